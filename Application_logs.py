@@ -1,19 +1,24 @@
 import numpy as np
 import pandas as pd
-import tensorflow as tf
-from tensorflow.keras.models import Sequential # type: ignore
-from tensorflow.keras.layers import LSTM, Dense, RepeatVector, TimeDistributed, Dropout, BatchNormalization # type: ignore
 from sklearn.preprocessing import StandardScaler, LabelEncoder
 from sklearn.ensemble import IsolationForest
 import re
 import matplotlib.pyplot as plt
 from sklearn.feature_extraction.text import TfidfVectorizer
-import tensorflow.keras.backend as K # type: ignore
 import json
 import sys
 from io import BytesIO
 import base64
 import logging
+from detector_engines import fit_detector, window_errors
+from log_schemas import read_log
+from graph_payload import resolve_graph_format, series_payload
+from correlation import record_anomalies
+from instrumentation import stage
+from ip_aggregation import source_ip_string, top_source_ips
+from model_registry import ModelRegistry, encode_labels, registry_key, resolve_engine, resolve_mode
+from quantile_sketch import KLLSketch
+from windowing import fit_windows, sliding_windows
 
 # Configure logging
 logging.basicConfig(
@@ -26,41 +31,50 @@ logging.basicConfig(
 )
 
 TIME_STEPS = 10
-
-def preprocess_structured_logs(df):
-    categorical_cols = [col for col in df.columns if df[col].dtype == 'object']
-    numeric_cols = [col for col in df.columns if df[col].dtype != 'object']
+LOG_TYPE = "Application Logs"
+
+def preprocess_structured_logs(df, state=None):
+    # A fitted state from the model registry is applied as-is instead of refitting
+    if state is None:
+        categorical_cols = [col for col in df.columns if df[col].dtype == 'object']
+        numeric_cols = [col for col in df.columns if df[col].dtype != 'object']
+    else:
+        categorical_cols = [col for col in state['label_encoders'] if col in df.columns]
+        numeric_cols = state['numeric_cols']
     
     label_encoders = {}
     for col in categorical_cols:
-        le = LabelEncoder()
-        df[col] = le.fit_transform(df[col].astype(str))
+        if state is None:
+            le = LabelEncoder()
+            df[col] = le.fit_transform(df[col].astype(str))
+        else:
+            le = state['label_encoders'][col]
+            df[col] = encode_labels(le, df[col].astype(str))
         label_encoders[col] = le
     
-    scaler = StandardScaler()
-    df_scaled = scaler.fit_transform(df[numeric_cols])
-    return df_scaled
+    if state is None:
+        scaler = StandardScaler()
+        df_scaled = scaler.fit_transform(df[numeric_cols])
+    else:
+        scaler = state['scaler']
+        df_scaled = scaler.transform(df[numeric_cols])
+    return df_scaled, {'label_encoders': label_encoders, 'scaler': scaler, 'numeric_cols': numeric_cols}
 
 def create_sequences(data, time_steps=TIME_STEPS):
-        sequences = []
-        for i in range(len(data) - time_steps):
-            sequences.append(data[i:i + time_steps])
-        return np.array(sequences)
+        return sliding_windows(data, time_steps)
 
 def custom_loss(y_true, y_pred):
+    import tensorflow.keras.backend as K # type: ignore
     return K.mean(K.square(y_true - y_pred))
 
-def analyse_application_logs(file_path):
-
-    df = pd.read_csv(file_path, on_bad_lines='skip')
-    data = preprocess_structured_logs(df)
-
-    # Create sequences for LSTM
-    data_sequences = create_sequences(data)
+def build_model(n_features):
+    # TensorFlow is only imported when the LSTM engine is used
+    from tensorflow.keras.models import Sequential # type: ignore
+    from tensorflow.keras.layers import LSTM, Dense, RepeatVector, TimeDistributed, Dropout, BatchNormalization # type: ignore
 
     # Build LSTM Autoencoder with improvements
     model = Sequential([
-        LSTM(128, activation='relu', input_shape=(TIME_STEPS, data.shape[1]), return_sequences=True),
+        LSTM(128, activation='relu', input_shape=(TIME_STEPS, n_features), return_sequences=True),
         BatchNormalization(),
         Dropout(0.2),
         LSTM(64, activation='relu', return_sequences=False),
@@ -69,70 +83,129 @@ def analyse_application_logs(file_path):
         BatchNormalization(),
         Dropout(0.2),
         LSTM(128, activation='relu', return_sequences=True),
-        TimeDistributed(Dense(data.shape[1]))
+        TimeDistributed(Dense(n_features))
     ])
 
 
 
     model.compile(optimizer='adam', loss=custom_loss)
     model.summary()
+    return model
 
-    # Train Autoencoder with improved configuration
-    X_train = data_sequences
-    model.fit(X_train, X_train, epochs=1, batch_size=64, validation_split=0.1, shuffle=True)
+def generate_plot(mse, anomalies, threshold):
+    plt.figure(figsize=(16, 8))
+    plt.plot(mse, label='Error Level Over Time', color='blue', linewidth=1.5, linestyle='-')
+    plt.scatter(np.where(anomalies)[0], mse[anomalies], color='red', marker='o', label='Anomalies', s=50)
+    plt.axhline(y=threshold, color='r', linestyle='--', label='Anomaly Threshold')
+    plt.xlabel('Log Entry Number', fontsize=14)
+    plt.ylabel('Reconstruction Error (MSE)', fontsize=14)
+    plt.title('Anomaly Detection in Application Logs', fontsize=16)
+    plt.legend(fontsize=12)
+    plt.grid(True, linestyle='--', alpha=0.6)
+      # Save plot to bytes
+    buf = BytesIO()
+    plt.savefig(buf, format='png')
+    buf.seek(0)
+    image_bytes = buf.getvalue()
+    plt.close()  # Close the figure to free memory
+    with stage('base64'):
+        return base64.b64encode(image_bytes).decode('utf-8')
+
+def analyse_application_logs(file_path, mode=None, tenant=None, graph_format=None, engine=None):
+    # 'score-only' (or 'auto' with a registered model) reuses the latest registered
+    # detector and preprocessing state instead of training on the uploaded file;
+    # graph_format 'series' returns a downsampled error series instead of a PNG;
+    # engine picks the detector (see detector_engines.DETECTOR_ENGINES), LSTM by default
+    mode = resolve_mode(mode)
+    graph_format = resolve_graph_format(graph_format)
+    engine = resolve_engine(LOG_TYPE, engine)
+    model_key = registry_key(LOG_TYPE, engine)
+    registry = ModelRegistry()
+    registered = registry.load(model_key, tenant) if mode != 'train' else None
+    if registered is None and mode == 'score-only':
+        raise ValueError(f"No trained {engine} model registered for {LOG_TYPE}")
+
+    df = read_log(file_path, LOG_TYPE)
+    # Addresses as logged; preprocessing label-encodes the column in place
+    ip_addresses = df['IP_Address'].astype(str).to_numpy()
+    timestamps = pd.to_datetime(df['Timestamp'], errors='coerce').to_numpy() if 'Timestamp' in df.columns else None
+    with stage('encode'):
+        data, state = preprocess_structured_logs(df, registered.state if registered else None)
+
+    # Create sequences for LSTM
+    data_sequences = create_sequences(data)
+
+    if registered:
+        model = registered.model
+        model_version = registered.metadata['version']
+    else:
+        with stage('train'):
+            if engine == 'lstm':
+                model = build_model(data.shape[1])
+
+                # Train Autoencoder with improved configuration
+                X_train = data_sequences
+                fit_windows(model, X_train, epochs=1, batch_size=64, validation_split=0.1, shuffle=True)
+            else:
+                model = fit_detector(engine, data_sequences)
+        model_version = registry.save(model_key, model, state, tenant=tenant,
+                                      metadata={'engine': engine,
+                                                'time_steps': TIME_STEPS,
+                                                'features': state['numeric_cols'],
+                                                'training_rows': len(df)},
+                                      sample=data_sequences)
 
   
     
-    X_pred = model.predict(data_sequences)
-    mse = np.mean(np.power(data_sequences - X_pred, 2), axis=(1, 2))
+    # Thresholds come from a quantile sketch filled while the errors are computed
+    sketch = KLLSketch()
+    mse = window_errors(model, data_sequences, sketch)
 
     
     #create a new dataframe with the mse values and IP_Address[10:] column
     anamoly_df = pd.DataFrame()
     anamoly_df['MSE'] = mse
-    anamoly_df['IP_Address'] = df['IP_Address'][10:]
-    #chang IPaddress to string
-    anamoly_df['IP_Address'] = anamoly_df['IP_Address'].astype(str)
+    # Window i is paired with row i + TIME_STEPS as before, now by position rather than index
+    anamoly_df['IP_Address'] = ip_addresses[TIME_STEPS:]
     
 
     # Dynamic threshold using IQR method
-    Q1 = np.percentile(mse, 25)
-    Q3 = np.percentile(mse, 75)
-    IQR = Q3 - Q1
-    threshold = Q3 + 1.5 * IQR
+    with stage('threshold'):
+        Q1 = sketch.quantile(0.25)
+        Q3 = sketch.quantile(0.75)
+        IQR = Q3 - Q1
+        threshold = Q3 + 1.5 * IQR
     
     anamoly_df = anamoly_df[anamoly_df['MSE'] > threshold]
 
     # Run real-time anomaly detection
     anomalies = mse > threshold
 
-    plt.figure(figsize=(16, 8))
-    plt.plot(mse, label='Error Level Over Time', color='blue', linewidth=1.5, linestyle='-')
-    plt.scatter(np.where(anomalies)[0], mse[anomalies], color='red', marker='o', label='Anomalies', s=50)
-    plt.axhline(y=threshold, color='r', linestyle='--', label='Anomaly Threshold')
-    plt.xlabel('Log Entry Number', fontsize=14)
-    plt.ylabel('Reconstruction Error (MSE)', fontsize=14)
-    plt.title('Anomaly Detection in Application Logs', fontsize=16)
-    plt.legend(fontsize=12)
-    plt.grid(True, linestyle='--', alpha=0.6)
-      # Save plot to bytes
-    buf = BytesIO()
-    plt.savefig(buf, format='png')
-    buf.seek(0)
-    image_bytes = buf.getvalue()
-    plt.close()  # Close the figure to free memory
-    image_base64 = base64.b64encode(image_bytes).decode('utf-8')
+    with stage('plot'):
+        if graph_format == 'series':
+            graph_data = series_payload(np.arange(len(mse)), mse, {'anomaly': anomalies},
+                                        {'anomaly': threshold}, 'Reconstruction Error (MSE)')
+        else:
+            graph_data = generate_plot(mse, anomalies, threshold)
 
     num_anomalies = len(anamoly_df)
+    with stage('source_ips'):
+        top_ips = top_source_ips(anamoly_df['IP_Address'])
+        if timestamps is not None:
+            record_anomalies(LOG_TYPE, anamoly_df['IP_Address'], timestamps[TIME_STEPS:][anomalies])
     
      # Prepare output data
     output_data = {
         'total_logs': int(len(df)),
         'malicious_events': num_anomalies,
         'alert_level': 'High' if num_anomalies > ((int) (len(df)*0.1)) else 'Medium' if num_anomalies > ((int) (len(df)*0.05)) else 'Low',
-        "sourceIp": "\n".join(anamoly_df["IP_Address"].tolist()),
-        'log_type': "Application Logs",
-        'graph_data': image_base64
+        "sourceIp": source_ip_string(top_ips, "\n"),
+        'top_source_ips': top_ips,
+        'log_type': LOG_TYPE,
+        'model_version': model_version,
+        'engine': engine,
+        'graph_format': graph_format,
+        'graph_data': graph_data
     }
 
     print(output_data)
@@ -16,14 +16,21 @@ import numpy as np
 import pandas as pd
 from sklearn.preprocessing import MinMaxScaler
 import sys
-from tensorflow.keras.models import Sequential
-from tensorflow.keras.layers import LSTM, Dense, RepeatVector, TimeDistributed
 import matplotlib.pyplot as plt
 import json
 import base64
 from io import BytesIO
 import logging
-from typing import Dict, Any, Union
+from typing import Dict, Any, Optional, Union
+from detector_engines import fit_detector, window_errors
+from log_schemas import read_log
+from graph_payload import resolve_graph_format, series_payload
+from correlation import record_anomalies
+from instrumentation import stage
+from ip_aggregation import source_ip_string, top_source_ips
+from model_registry import ModelRegistry, registry_key, resolve_engine, resolve_mode
+from quantile_sketch import KLLSketch
+from windowing import fit_windows, sliding_windows
 
 # Configure logging with more detailed format
 logging.basicConfig(
@@ -37,47 +44,53 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
-def load_and_preprocess_data(file_path: str) -> tuple:
-    """Load and preprocess the DNS log data."""
+LOG_TYPE = "DNS Query Logs"
+
+def load_and_preprocess_data(file_path: str, scaler: Optional[MinMaxScaler] = None) -> tuple:
+    """Load and preprocess the DNS log data, reusing a fitted scaler when one is given."""
     try:
-        data = pd.read_csv(file_path)
+        data = read_log(file_path, LOG_TYPE)
         logger.info(f"Successfully loaded data from {file_path}")
         
         missing_values = data.isnull().sum()
         logger.info(f"Missing values in dataset:\n{missing_values}")
         
-        data['Timestamp'] = pd.to_datetime(data['Timestamp'], errors='coerce')
         data = data.sort_values(by='Timestamp').reset_index(drop=True)
-        data['Response Data'].fillna('Unknown', inplace=True)
         
         numeric_columns = ['Response Time (ms)', 'Query Length', 'TTL', 'Source Port']
         numeric_data = data[numeric_columns].dropna()
         
-        scaler = MinMaxScaler()
-        scaled_data = scaler.fit_transform(numeric_data)
+        with stage('scale'):
+            if scaler is None:
+                scaler = MinMaxScaler()
+                scaled_data = scaler.fit_transform(numeric_data)
+            else:
+                scaled_data = scaler.transform(numeric_data)
         logger.info(f"Data shape after preprocessing: {scaled_data.shape}")
         
-        return data, scaled_data, numeric_columns
+        return data, scaled_data, numeric_columns, scaler
     except Exception as e:
         logger.error(f"Error in data preprocessing: {str(e)}")
         raise
 
 def prepare_lstm_data(scaled_data: np.ndarray, timesteps: int = 10) -> np.ndarray:
-    """Prepare data for LSTM processing."""
+    """Prepare data for LSTM processing as a read-only float32 window view."""
     try:
-        X_lstm = []
-        for i in range(timesteps, len(scaled_data)):
-            X_lstm.append(scaled_data[i-timesteps:i])
-        X_lstm = np.array(X_lstm)
+        # Window i covers rows [i, i + timesteps), matching the previous loop's alignment
+        X_lstm = sliding_windows(scaled_data, timesteps)
         logger.info(f"LSTM input data shape: {X_lstm.shape}")
         return X_lstm
     except Exception as e:
         logger.error(f"Error preparing LSTM data: {str(e)}")
         raise
 
-def build_and_train_model(X_lstm: np.ndarray) -> Sequential:
+def build_and_train_model(X_lstm: np.ndarray):
     """Build and train the LSTM autoencoder model."""
     try:
+        # TensorFlow is only imported when the LSTM engine is used
+        from tensorflow.keras.models import Sequential
+        from tensorflow.keras.layers import LSTM, Dense, RepeatVector, TimeDistributed
+
         model = Sequential([
             LSTM(64, activation='relu', input_shape=(X_lstm.shape[1], X_lstm.shape[2]), 
                  return_sequences=True),
@@ -91,8 +104,8 @@ def build_and_train_model(X_lstm: np.ndarray) -> Sequential:
         model.compile(optimizer='adam', loss='mse')
         logger.info("Model compiled successfully")
         
-        model.fit(X_lstm, X_lstm, epochs=70, batch_size=32, 
-                 validation_split=0.2, shuffle=False)
+        fit_windows(model, X_lstm, epochs=70, batch_size=32,
+                    validation_split=0.2, shuffle=False)
         logger.info("Model training completed")
         
         return model
@@ -128,7 +141,8 @@ def generate_plot(timestamps, mse, low_threshold, moderate_threshold,
         plt.savefig(buf, format='png', dpi=300, bbox_inches='tight')
         plt.close()
         buf.seek(0)
-        image_base64 = base64.b64encode(buf.getvalue()).decode('utf-8')
+        with stage('base64'):
+            image_base64 = base64.b64encode(buf.getvalue()).decode('utf-8')
         buf.close()
         
         return image_base64
@@ -136,35 +150,77 @@ def generate_plot(timestamps, mse, low_threshold, moderate_threshold,
         logger.error(f"Error generating plot: {str(e)}")
         raise
 
-def analyze_dns_logs(file_path: str) -> Dict[str, Any]:
-    """Main function to analyze DNS logs."""
+def analyze_dns_logs(file_path: str, mode: Optional[str] = None, tenant=None,
+                     graph_format: Optional[str] = None, engine: Optional[str] = None) -> Dict[str, Any]:
+    """Main function to analyze DNS logs.
+
+    In 'score-only' (or 'auto' with a registered model) mode the latest registered
+    detector and scaler are loaded instead of training on the uploaded file.
+    graph_format 'series' returns a downsampled error series instead of a PNG.
+    engine picks the detector (see detector_engines.DETECTOR_ENGINES), LSTM by default.
+    """
     try:
+        mode = resolve_mode(mode)
+        graph_format = resolve_graph_format(graph_format)
+        engine = resolve_engine(LOG_TYPE, engine)
+        model_key = registry_key(LOG_TYPE, engine)
+        registry = ModelRegistry()
+        registered = registry.load(model_key, tenant) if mode != 'train' else None
+        if registered is None and mode == 'score-only':
+            raise ValueError(f"No trained {engine} model registered for {LOG_TYPE}")
+
         # Load and preprocess data
-        data, scaled_data, numeric_columns = load_and_preprocess_data(file_path)
+        scaler = registered.state['scaler'] if registered else None
+        data, scaled_data, numeric_columns, scaler = load_and_preprocess_data(file_path, scaler)
         
         # Prepare LSTM data
         X_lstm = prepare_lstm_data(scaled_data)
         
-        # Build and train model
-        model = build_and_train_model(X_lstm)
+        if registered:
+            model = registered.model
+            model_version = registered.metadata['version']
+        else:
+            # Build and train model
+            with stage('train'):
+                if engine == 'lstm':
+                    model = build_and_train_model(X_lstm)
+                else:
+                    model = fit_detector(engine, X_lstm)
+            model_version = registry.save(model_key, model, {'scaler': scaler}, tenant=tenant,
+                                          metadata={'engine': engine,
+                                                    'timesteps': X_lstm.shape[1],
+                                                    'features': numeric_columns,
+                                                    'training_rows': len(data)},
+                                          sample=X_lstm)
         
         # Detect anomalies
-        reconstructions = model.predict(X_lstm)
-        mse = np.mean(np.square(X_lstm - reconstructions), axis=(1, 2))
+        # Thresholds come from a quantile sketch filled while the errors are computed
+        sketch = KLLSketch()
+        mse = window_errors(model, X_lstm, sketch)
         
         # Calculate thresholds
-        low_threshold = np.percentile(mse, 80)
-        moderate_threshold = np.percentile(mse, 95)
-        
-        # Classify severity
-        severity = ['High' if e > moderate_threshold else 
-                   'Moderate' if e > low_threshold else 'Low' 
-                   for e in mse]
+        with stage('threshold'):
+            low_threshold = sketch.quantile(0.80)
+            moderate_threshold = sketch.quantile(0.95)
+            
+            # Classify severity
+            severity = np.select([mse > moderate_threshold, mse > low_threshold],
+                                 ['High', 'Moderate'], 'Low')
         
         # Generate plot
         timestamps = data['Timestamp'][10:]  # timesteps = 10
-        image_base64 = generate_plot(timestamps, mse, low_threshold, 
-                                   moderate_threshold, severity)
+        with stage('plot'):
+            if graph_format == 'series':
+                severity_array = np.array(severity)
+                graph_data = series_payload(
+                    timestamps, mse,
+                    {'high': severity_array == 'High', 'moderate': severity_array == 'Moderate'},
+                    {'low': low_threshold, 'moderate': moderate_threshold},
+                    'Reconstruction Error'
+                )
+            else:
+                graph_data = generate_plot(timestamps, mse, low_threshold,
+                                           moderate_threshold, severity)
         
         # Prepare results
         filtered_data = pd.DataFrame({
@@ -174,14 +230,23 @@ def analyze_dns_logs(file_path: str) -> Dict[str, Any]:
         })[lambda x: x['Severity'] != 'Low']
         
         num_anomalies = len(filtered_data)
+        with stage('source_ips'):
+            top_ips = top_source_ips(filtered_data['SourceIp'], filtered_data['Timestamp'],
+                                     filtered_data['Severity'], ('Low', 'Moderate', 'High'))
+            record_anomalies(LOG_TYPE, filtered_data['SourceIp'], filtered_data['Timestamp'],
+                             filtered_data['Severity'])
         results = {
                 'total_logs': len(data),
                 'malicious_events': num_anomalies,
                 'alert_level': 'High' if num_anomalies > (len(data)*0.1) else 
                               'Medium' if num_anomalies > (len(data)*0.05) else 'Low',
-                "sourceIp": "\n,".join(filtered_data["SourceIp"].tolist()),
-                'log_type': "DNS Query Logs",
-                'graph_data': image_base64
+                "sourceIp": source_ip_string(top_ips),
+                'top_source_ips': top_ips,
+                'log_type': LOG_TYPE,
+                'model_version': model_version,
+                'engine': engine,
+                'graph_format': graph_format,
+                'graph_data': graph_data
              }
         
         logger.info("Analysis completed successfully")
@@ -65,4 +65,55 @@ BEGIN
         END;
 END //
 
-DELIMITER ;
\ No newline at end of file
+DELIMITER ;
+-- Create analysis_result_cache table (used when SHIELD_RESULT_CACHE=mysql)
+CREATE TABLE analysis_result_cache (
+    CacheKey CHAR(64) PRIMARY KEY,
+    Log_Type VARCHAR(50) NOT NULL,
+    AnalyzerVersion VARCHAR(64) NOT NULL,
+    Results LONGBLOB NOT NULL,
+    CreatedAt TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_result_cache_type (Log_Type, AnalyzerVersion)
+);
+
+-- Create analysis_jobs table (asynchronous analysis queue)
+CREATE TABLE analysis_jobs (
+    JobID INT AUTO_INCREMENT PRIMARY KEY,
+    LogID INT,
+    LogType VARCHAR(50) NOT NULL,
+    Status ENUM('queued', 'running', 'done', 'failed') NOT NULL DEFAULT 'queued',
+    Options TEXT,
+    Attempts INT NOT NULL DEFAULT 0,
+    Worker VARCHAR(100),
+    AnalysisID INT,
+    Result TEXT,
+    Error TEXT,
+    CreatedAt TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    StartedAt TIMESTAMP NULL,
+    FinishedAt TIMESTAMP NULL,
+    INDEX idx_jobs_status (Status, JobID),
+    FOREIGN KEY (LogID) REFERENCES UploadLogs(ID)
+);
+
+-- Create log_rollups table (dashboard aggregates, written when SHIELD_ROLLUPS=1)
+CREATE TABLE log_rollups (
+    UserID INT NOT NULL,
+    LogType VARCHAR(50) NOT NULL,
+    Resolution ENUM('minute', 'hour', 'day') NOT NULL,
+    BucketStart DATETIME NOT NULL,
+    Events BIGINT NOT NULL DEFAULT 0,
+    Bytes DOUBLE NOT NULL DEFAULT 0,
+    Anomalies BIGINT NOT NULL DEFAULT 0,
+    DistinctIps INT,
+    IpSketch VARBINARY(256),
+    PRIMARY KEY (UserID, LogType, Resolution, BucketStart)
+);
+
+-- Create log_rollup_uploads table (uploads already folded into log_rollups)
+CREATE TABLE log_rollup_uploads (
+    LogID INT PRIMARY KEY,
+    UserID INT NOT NULL,
+    LogType VARCHAR(50) NOT NULL,
+    CreatedAt TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (LogID) REFERENCES UploadLogs(ID)
+);
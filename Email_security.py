@@ -9,6 +9,12 @@ import base64
 import logging
 import json
 from typing import Dict, Any, Optional
+from graph_payload import resolve_graph_format, series_payload
+from instrumentation import stage
+from log_schemas import LOG_SCHEMAS, parse_timestamps, read_log
+from model_registry import ModelRegistry, encode_labels, forest_scores, resolve_mode
+
+LOG_TYPE = "Email Security Logs"
 
 # Configure logging with more detailed formatting
 logging.basicConfig(
@@ -20,10 +26,11 @@ logging.basicConfig(
     ]
 )
 
-def load_and_preprocess_data(file_path: str) -> tuple[pd.DataFrame, Optional[str]]:
-    """Load and preprocess email log data."""
+def load_and_preprocess_data(file_path: str, label_encoders: Optional[Dict[str, LabelEncoder]] = None
+                             ) -> tuple[pd.DataFrame, Optional[str], Dict[str, LabelEncoder]]:
+    """Load and preprocess email log data, fitting label encoders unless fitted ones are given."""
     try:
-        df = pd.read_csv(file_path)
+        df = read_log(file_path, LOG_TYPE)
         logging.info(f"Successfully loaded data from {file_path} with {len(df)} records")
         
         # Detect timestamp column
@@ -33,51 +40,67 @@ def load_and_preprocess_data(file_path: str) -> tuple[pd.DataFrame, Optional[str
         )
         
         if timestamp_col:
-            df[timestamp_col] = pd.to_datetime(df[timestamp_col], errors='coerce')
+            df[timestamp_col] = parse_timestamps(df[timestamp_col], LOG_SCHEMAS[LOG_TYPE].timestamp_format,
+                                                 errors='coerce')
             if df[timestamp_col].isna().any():
                 logging.warning(f"Some timestamp values could not be parsed in column '{timestamp_col}'")
         
         # Encode categorical variables
         categorical_cols = df.select_dtypes(include=['object']).columns.tolist()
-        for col in categorical_cols:
-            try:
-                le = LabelEncoder()
-                df[col] = le.fit_transform(df[col].astype(str))
-            except Exception as e:
-                logging.error(f"Error encoding column '{col}': {str(e)}")
-                raise ValueError(f"Failed to encode categorical column: {col}")
+        fitted = label_encoders is not None
+        label_encoders = label_encoders if fitted else {}
+        with stage('encode'):
+            for col in categorical_cols:
+                try:
+                    if fitted:
+                        if col in label_encoders:
+                            df[col] = encode_labels(label_encoders[col], df[col].astype(str))
+                        continue
+                    le = LabelEncoder()
+                    df[col] = le.fit_transform(df[col].astype(str))
+                    label_encoders[col] = le
+                except Exception as e:
+                    logging.error(f"Error encoding column '{col}': {str(e)}")
+                    raise ValueError(f"Failed to encode categorical column: {col}")
                 
-        return df, timestamp_col
+        return df, timestamp_col, label_encoders
         
     except Exception as e:
         logging.error(f"Error in load_and_preprocess_data: {str(e)}")
         raise
 
-def detect_anomalies(df: pd.DataFrame, contamination: float = 0.05) -> pd.DataFrame:
-    """Detect anomalies using Isolation Forest."""
+def detect_anomalies(df: pd.DataFrame, contamination: float = 0.05, iso_forest: Optional[IsolationForest] = None,
+                     num_cols: Optional[list] = None) -> tuple[pd.DataFrame, IsolationForest, list]:
+    """Detect anomalies using Isolation Forest, fitting one unless a baseline forest and its features are given."""
     try:
-        num_cols = df.select_dtypes(include=['number']).columns.tolist()
-        num_cols = [col for col in num_cols if col != 'Anomaly']
+        if num_cols is None:
+            num_cols = df.select_dtypes(include=['number']).columns.tolist()
+            num_cols = [col for col in num_cols if col != 'Anomaly']
+        missing_cols = [col for col in num_cols if col not in df.columns]
+        if missing_cols:
+            raise ValueError(f"Columns used by the baseline model are missing: {', '.join(missing_cols)}")
         
         if not num_cols:
             raise ValueError("No numerical features found for anomaly detection")
             
         X = df[num_cols]
-        iso_forest = IsolationForest(contamination=contamination, random_state=42)
-        df['Anomaly'] = iso_forest.fit_predict(X)
-        df['Anomaly'] = df['Anomaly'].apply(lambda x: 1 if x == -1 else 0)
+        if iso_forest is None:
+            with stage('fit'):
+                iso_forest = IsolationForest(contamination=contamination, random_state=42).fit(X)
+        _, predictions = forest_scores(iso_forest, X)
+        df['Anomaly'] = (predictions == -1).astype(int)
         
         num_anomalies = df['Anomaly'].sum()
         logging.info(f"Detected {num_anomalies} anomalies ({(num_anomalies/len(df))*100:.2f}%)")
         
-        return df
+        return df, iso_forest, num_cols
         
     except Exception as e:
         logging.error(f"Error in detect_anomalies: {str(e)}")
         raise
 
-def plot_anomalies(df: pd.DataFrame, timestamp_col: str) -> Optional[str]:
-    """Generate anomaly visualization plot."""
+def plot_anomalies(df: pd.DataFrame, timestamp_col: str, graph_format: str = 'png') -> Optional[str]:
+    """Generate anomaly visualization plot, or a downsampled series when graph_format is 'series'."""
     try:
         if not timestamp_col or timestamp_col not in df.columns:
             logging.warning("Cannot plot anomalies: No timestamp column available")
@@ -89,6 +112,10 @@ def plot_anomalies(df: pd.DataFrame, timestamp_col: str) -> Optional[str]:
         if not metric_col:
             logging.warning("Cannot plot anomalies: No suitable numeric column found")
             return None
+
+        if graph_format == 'series':
+            return series_payload(df[timestamp_col], df[metric_col],
+                                  {'anomaly': (df['Anomaly'] == 1).to_numpy()}, {}, metric_col)
             
         plt.figure(figsize=(12, 6))
         sns.lineplot(x=df[timestamp_col], y=df[metric_col], label=metric_col, marker='o')
@@ -112,19 +139,40 @@ def plot_anomalies(df: pd.DataFrame, timestamp_col: str) -> Optional[str]:
         image_bytes = buf.getvalue()
         plt.close()
         
-        return base64.b64encode(image_bytes).decode('utf-8')
+        with stage('base64'):
+            return base64.b64encode(image_bytes).decode('utf-8')
         
     except Exception as e:
         logging.error(f"Error in plot_anomalies: {str(e)}")
         plt.close()
         return None
 
-def analyse_email_logs(file_path: str) -> Dict[str, Any]:
-    """Main analysis function with improved error handling."""
+def analyse_email_logs(file_path: str, mode: Optional[str] = None, tenant=None,
+                       graph_format: Optional[str] = None) -> Dict[str, Any]:
+    """Main analysis function with improved error handling.
+
+    In 'score-only' (or 'auto' with a registered baseline) mode the file is scored against
+    the latest registered forest and encoders instead of fitting new ones.
+    """
     try:
-        df, timestamp_col = load_and_preprocess_data(file_path)
-        df = detect_anomalies(df)
-        image_base64 = plot_anomalies(df, timestamp_col)
+        mode = resolve_mode(mode)
+        graph_format = resolve_graph_format(graph_format)
+        registry = ModelRegistry()
+        registered = registry.load(LOG_TYPE, tenant) if mode != 'train' else None
+        if registered is None and mode == 'score-only':
+            raise ValueError(f"No trained model registered for {LOG_TYPE}")
+
+        if registered:
+            df, timestamp_col, _ = load_and_preprocess_data(file_path, registered.state['label_encoders'])
+            df, _, _ = detect_anomalies(df, iso_forest=registered.model, num_cols=registered.metadata['features'])
+            model_version = registered.metadata['version']
+        else:
+            df, timestamp_col, label_encoders = load_and_preprocess_data(file_path)
+            df, iso_forest, num_cols = detect_anomalies(df)
+            model_version = registry.save(LOG_TYPE, iso_forest, {'label_encoders': label_encoders}, tenant=tenant,
+                                          metadata={'features': num_cols, 'training_rows': len(df)})
+        with stage('plot'):
+            graph_data = plot_anomalies(df, timestamp_col, graph_format)
         
         num_anomalies = int(df['Anomaly'].sum())
         total_logs = len(df)
@@ -135,8 +183,10 @@ def analyse_email_logs(file_path: str) -> Dict[str, Any]:
             'alert_level': 'High' if num_anomalies > (total_logs * 0.1) else 
                           'Medium' if num_anomalies > (total_logs * 0.05) else 'Low',
             'sourceIp': "",
-            'log_type': "Email Security Logs",
-            'graph_data': image_base64
+            'log_type': LOG_TYPE,
+            'model_version': model_version,
+            'graph_format': graph_format,
+            'graph_data': graph_data
         }
         
         logging.info(f"Analysis completed successfully. Alert level: {output_data['alert_level']}")
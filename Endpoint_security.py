@@ -9,6 +9,13 @@ from io import BytesIO
 import base64
 import logging
 import traceback
+from graph_payload import resolve_graph_format, series_payload
+from correlation import record_anomalies
+from instrumentation import stage
+from log_schemas import read_log
+from model_registry import ModelRegistry, forest_scores, resolve_mode
+
+LOG_TYPE = "Endpoint Security Logs"
 
 # Configure logging
 logging.basicConfig(
@@ -20,62 +27,95 @@ logging.basicConfig(
     ]
 )
 
-def analyze_endpoint_logs(input_file):
+def generate_plot(timestamps, scores, anomalies):
+    """Render anomaly scores over time with anomalies marked, as a base64 PNG"""
+    plt.figure(figsize=(16, 8))
+    plt.plot(timestamps, scores, 
+            label='Anomaly Score', color='blue', linewidth=1.5)
+    plt.scatter(timestamps[anomalies == -1], 
+               scores[anomalies == -1],
+               color='red', marker='o', label='Anomalies', s=50)
+    plt.xlabel('Timestamp', fontsize=14)
+    plt.ylabel('Anomaly Score', fontsize=14)
+    plt.title('Endpoint Security Anomaly Detection', fontsize=16)
+    plt.legend(fontsize=12)
+    plt.grid(True, linestyle='--', alpha=0.6)
+
+    # Save plot to base64
+    buf = BytesIO()
+    plt.savefig(buf, format='png')
+    buf.seek(0)
+    with stage('base64'):
+        image_base64 = base64.b64encode(buf.getvalue()).decode('utf-8')
+    plt.close()
+    return image_base64
+
+def analyze_endpoint_logs(input_file, mode=None, tenant=None, graph_format=None):
     try:
         logging.info(f"Starting endpoint security log analysis with input file: {input_file}")
+        mode = resolve_mode(mode)
+        graph_format = resolve_graph_format(graph_format)
+        registry = ModelRegistry()
+        registered = registry.load(LOG_TYPE, tenant) if mode != 'train' else None
+        if registered is None and mode == 'score-only':
+            raise ValueError(f"No trained model registered for {LOG_TYPE}")
         
         # Load dataset
-        df = pd.read_csv(input_file, parse_dates=['Timestamp'])
+        df = read_log(input_file, LOG_TYPE)
         df.set_index('Timestamp', inplace=True)
         logging.info(f"Loaded {len(df)} records from dataset")
         
         # Feature Engineering
-        severity_map = {'INFO': 1, 'WARNING': 2, 'CRITICAL': 3}
-        df['severity_score'] = df['Severity'].map(severity_map)
-        
-        event_dummies = pd.get_dummies(df['Event_Type'], prefix='event')
-        df = pd.concat([df, event_dummies], axis=1)
-        
-        action_map = {
-            'NO_ACTION': 0, 'ALLOWED': 1, 'REPORTED': 2, 
-            'QUARANTINED': 3, 'BLOCKED': 4
-        }
-        df['action_score'] = df['Action_Taken'].map(action_map)
+        with stage('encode'):
+            severity_map = {'INFO': 1, 'WARNING': 2, 'CRITICAL': 3}
+            df['severity_score'] = df['Severity'].map(severity_map).astype('float64')
+            
+            event_dummies = pd.get_dummies(df['Event_Type'], prefix='event')
+            if registered:
+                # Event types the baseline has not seen are dropped, missing ones are all zero
+                event_dummies = event_dummies.reindex(columns=registered.state['event_columns'], fill_value=False)
+            df = pd.concat([df, event_dummies], axis=1)
+            
+            action_map = {
+                'NO_ACTION': 0, 'ALLOWED': 1, 'REPORTED': 2, 
+                'QUARANTINED': 3, 'BLOCKED': 4
+            }
+            df['action_score'] = df['Action_Taken'].map(action_map).astype('float64')
         
         # Select numerical columns for analysis
         numerical_columns = ['severity_score', 'action_score'] + list(event_dummies.columns)
         df_numeric = df[numerical_columns]
         
         # Detect anomalies
-        scaler = StandardScaler()
-        df_scaled = scaler.fit_transform(df_numeric)
-        
-        iso_forest = IsolationForest(n_estimators=100, contamination=0.1, random_state=42)
-        anomalies = iso_forest.fit_predict(df_scaled)
+        if registered:
+            scaler = registered.state['scaler']
+            df_scaled = scaler.transform(df_numeric)
+            iso_forest = registered.model
+            model_version = registered.metadata['version']
+        else:
+            with stage('fit'):
+                scaler = StandardScaler()
+                df_scaled = scaler.fit_transform(df_numeric)
+                iso_forest = IsolationForest(n_estimators=100, contamination=0.1, random_state=42).fit(df_scaled)
+            model_version = registry.save(LOG_TYPE, iso_forest,
+                                          {'scaler': scaler, 'event_columns': list(event_dummies.columns)},
+                                          tenant=tenant,
+                                          metadata={'features': numerical_columns, 'training_rows': len(df)})
+        scores, anomalies = forest_scores(iso_forest, df_scaled)
         
         # Create visualization
-        plt.figure(figsize=(16, 8))
-        plt.plot(df.index, iso_forest.score_samples(df_scaled), 
-                label='Anomaly Score', color='blue', linewidth=1.5)
-        plt.scatter(df.index[anomalies == -1], 
-                   iso_forest.score_samples(df_scaled)[anomalies == -1],
-                   color='red', marker='o', label='Anomalies', s=50)
-        plt.xlabel('Timestamp', fontsize=14)
-        plt.ylabel('Anomaly Score', fontsize=14)
-        plt.title('Endpoint Security Anomaly Detection', fontsize=16)
-        plt.legend(fontsize=12)
-        plt.grid(True, linestyle='--', alpha=0.6)
-
-        # Save plot to base64
-        buf = BytesIO()
-        plt.savefig(buf, format='png')
-        buf.seek(0)
-        image_base64 = base64.b64encode(buf.getvalue()).decode('utf-8')
-        plt.close()
+        with stage('plot'):
+            if graph_format == 'series':
+                graph_data = series_payload(df.index, scores, {'anomaly': anomalies == -1},
+                                            {'anomaly': iso_forest.offset_}, 'Anomaly Score')
+            else:
+                graph_data = generate_plot(df.index, scores, anomalies)
 
         # Count anomalies and get suspicious IPs
         num_anomalies = np.sum(anomalies == -1)
         suspicious_ips = df['Source_IP'][anomalies == -1].unique().tolist()
+        record_anomalies(LOG_TYPE, df['Source_IP'][anomalies == -1], df.index[anomalies == -1],
+                         df['Severity'][anomalies == -1])
 
         return {
             'total_logs': len(df),
@@ -83,8 +123,10 @@ def analyze_endpoint_logs(input_file):
             'alert_level': 'High' if num_anomalies > (len(df)*0.1) else 
                          'Medium' if num_anomalies > (len(df)*0.05) else 'Low',
             'sourceIp': "\n".join(map(str, suspicious_ips)) if suspicious_ips else "No suspicious IPs detected",
-            'log_type': "Endpoint Security Logs",
-            'graph_data': image_base64
+            'log_type': LOG_TYPE,
+            'model_version': model_version,
+            'graph_format': graph_format,
+            'graph_data': graph_data
         }
 
     except Exception as e:
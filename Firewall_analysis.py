@@ -8,6 +8,14 @@ import sys
 from io import BytesIO
 import base64
 import logging
+from graph_payload import resolve_graph_format, series_payload
+from correlation import record_anomalies
+from instrumentation import stage
+from ip_aggregation import source_ip_string, top_source_ips
+from log_schemas import read_log
+from model_registry import ModelRegistry, encode_labels, forest_scores, resolve_mode
+
+LOG_TYPE = "Firewall Logs"
 
 # Configure logging
 logging.basicConfig(
@@ -19,83 +27,124 @@ logging.basicConfig(
     ]
 )
 
-def analyze_firewall_logs(input_file):
+def generate_plot(df):
+    """Render bytes transferred over time with anomalies marked, as a base64 PNG"""
+    plt.figure(figsize=(12, 6))
+    sns.lineplot(x=df["Timestamp"], y=df["Bytes_Transferred"], label="Log Count", marker="o")
+    sns.scatterplot(
+        x=df[df["Anomaly"] == 1]["Timestamp"],
+        y=df[df["Anomaly"] == 1]["Bytes_Transferred"],
+        color="red",
+        label="Anomalies",
+        marker="x",
+        s=100
+    )
+    plt.xlabel("Timestamp")
+    plt.ylabel("Bytes Transferred")
+    plt.title("Firewall Anomaly Detection")
+    plt.legend()
+    plt.xticks(rotation=45)
+
+    # Save plot to bytes
+    buf = BytesIO()
+    plt.savefig(buf, format='png')
+    buf.seek(0)
+    image_bytes = buf.getvalue()
+    plt.close()  # Close the figure to free memory
+    with stage('base64'):
+        return base64.b64encode(image_bytes).decode('utf-8')
+
+def analyze_firewall_logs(input_file, mode=None, tenant=None, graph_format=None):
     """
     Analyzes firewall logs and returns analysis results as a JSON object
     Args:
         input_file: Path to input csv file containing analysis parameters
+        mode: 'train' fits and registers a new baseline forest, 'score-only' (or 'auto'
+            with a registered baseline) scores the file against the latest baseline
+        tenant: Optional tenant whose baseline is used
+        graph_format: 'png' (default) or 'series' for a downsampled JSON series
     Returns:
         dict: Analysis results as a JSON-serializable dictionary
     """
     try:
         logging.info(f"Starting firewall log analysis with input file: {input_file}")
-        
-        
+        mode = resolve_mode(mode)
+        graph_format = resolve_graph_format(graph_format)
+        registry = ModelRegistry()
+        registered = registry.load(LOG_TYPE, tenant) if mode != 'train' else None
+        if registered is None and mode == 'score-only':
+            raise ValueError(f"No trained model registered for {LOG_TYPE}")
         
         # Load dataset
         logging.info(f"Loading dataset from file_path: {input_file}")
-        df = pd.read_csv(input_file)
+        df = read_log(input_file, LOG_TYPE)
         logging.info(f"Loaded {len(df)} records from dataset")
-        
-        # Convert Timestamp to datetime
-        df["Timestamp"] = pd.to_datetime(df["Timestamp"])
+
+        # Threat levels as logged, for the per-IP summary once the column is encoded
+        threat_levels = df["Threat_Level"]
 
         # Encode categorical variables
-        label_encoders = {}
-        for col in ["Protocol", "Action", "Threat_Level"]:
-            le = LabelEncoder()
-            df[col] = le.fit_transform(df[col])
-            label_encoders[col] = le
+        label_encoders = registered.state['label_encoders'] if registered else {}
+        with stage('encode'):
+            for col in ["Protocol", "Action", "Threat_Level"]:
+                if registered:
+                    df[col] = encode_labels(label_encoders[col], df[col])
+                else:
+                    le = LabelEncoder()
+                    df[col] = le.fit_transform(df[col])
+                    label_encoders[col] = le
 
         # Select numerical features for anomaly detection
         features = ["Source_Port", "Destination_Port", "Protocol", "Action", "Bytes_Transferred", "Threat_Level"]
         X = df[features]
 
-        # Train Isolation Forest model
-        logging.info("Training Isolation Forest model")
-        iso_forest = IsolationForest(contamination=0.05, random_state=42)
-        df["Anomaly"] = iso_forest.fit_predict(X)
-        df["Anomaly"] = df["Anomaly"].apply(lambda x: 1 if x == -1 else 0)
+        if registered:
+            iso_forest = registered.model
+            model_version = registered.metadata['version']
+        else:
+            # Train Isolation Forest model
+            logging.info("Training Isolation Forest model")
+            with stage('fit'):
+                iso_forest = IsolationForest(contamination=0.05, random_state=42).fit(X)
+            model_version = registry.save(LOG_TYPE, iso_forest, {'label_encoders': label_encoders}, tenant=tenant,
+                                          metadata={'features': features, 'training_rows': len(df)})
+
+        logging.info(f"Scoring with Isolation Forest model version {model_version}")
+        _, predictions = forest_scores(iso_forest, X)
+        df["Anomaly"] = (predictions == -1).astype(int)
         
         # Create visualization
         logging.info("Generating visualization")
-        plt.figure(figsize=(12, 6))
-        sns.lineplot(x=df["Timestamp"], y=df["Bytes_Transferred"], label="Log Count", marker="o")
-        sns.scatterplot(
-            x=df[df["Anomaly"] == 1]["Timestamp"],
-            y=df[df["Anomaly"] == 1]["Bytes_Transferred"],
-            color="red",
-            label="Anomalies",
-            marker="x",
-            s=100
-        )
-        plt.xlabel("Timestamp")
-        plt.ylabel("Bytes Transferred")
-        plt.title("Firewall Anomaly Detection")
-        plt.legend()
-        plt.xticks(rotation=45)
-        
-        # Save plot to bytes
-        buf = BytesIO()
-        plt.savefig(buf, format='png')
-        buf.seek(0)
-        image_bytes = buf.getvalue()
-        plt.close()  # Close the figure to free memory
+        with stage('plot'):
+            if graph_format == 'series':
+                graph_data = series_payload(df["Timestamp"], df["Bytes_Transferred"],
+                                            {'anomaly': (df["Anomaly"] == 1).to_numpy()}, {},
+                                            "Bytes Transferred")
+            else:
+                graph_data = generate_plot(df)
         
         # Calculate number of anomalies
         num_anomalies = df[df["Anomaly"] == 1].shape[0]
         logging.info(f"Detected {num_anomalies} anomalies")
-        
-        image_base64 = base64.b64encode(image_bytes).decode('utf-8')
+
+        with stage('source_ips'):
+            anomalous = (df["Anomaly"] == 1).to_numpy()
+            top_ips = top_source_ips(df["Source_IP"][anomalous], df["Timestamp"][anomalous],
+                                     threat_levels[anomalous], ('Low', 'Medium', 'High'))
+            record_anomalies(LOG_TYPE, df["Source_IP"][anomalous], df["Timestamp"][anomalous],
+                             threat_levels[anomalous])
         
         # Prepare output data
         output_data = {
             'total_logs': len(df),
             'malicious_events': num_anomalies,
             'alert_level': 'High' if num_anomalies > ((int) (len(df)*0.1)) else 'Medium' if num_anomalies > ((int) (len(df)*0.05)) else 'Low',
-            "sourceIp": "\n,".join(df[df["Anomaly"] == 1]["Source_IP"].tolist()),
-            'log_type': "Firewall Logs",
-            'graph_data': image_base64
+            "sourceIp": source_ip_string(top_ips),
+            'top_source_ips': top_ips,
+            'log_type': LOG_TYPE,
+            'model_version': model_version,
+            'graph_format': graph_format,
+            'graph_data': graph_data
         }
         
         logging.info("Analysis completed successfully")
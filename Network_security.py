@@ -3,16 +3,22 @@ import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sns
 from sklearn.preprocessing import MinMaxScaler
-from tensorflow.keras.models import Model # type: ignore
-from tensorflow.keras.layers import Input, LSTM, RepeatVector, TimeDistributed, Dense, Dropout # type: ignore
-from tensorflow.keras.callbacks import EarlyStopping # type: ignore
 import sys
 from io import BytesIO
 import base64
 import json
 import logging
-from typing import Dict, Any, List, Tuple
+from typing import Dict, Any, List, Optional, Tuple
 import traceback
+from detector_engines import fit_detector, window_errors
+from log_schemas import read_log
+from graph_payload import resolve_graph_format, series_payload
+from correlation import record_anomalies
+from instrumentation import stage
+from ip_aggregation import source_ip_string, top_source_ips
+from model_registry import ModelRegistry, registry_key, resolve_engine, resolve_mode
+from quantile_sketch import KLLSketch
+from windowing import fit_windows, sliding_windows
 
 # Configure logging with more detailed format
 logging.basicConfig(
@@ -26,39 +32,47 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
-def load_and_preprocess_data(file_path: str) -> Tuple[pd.DataFrame, np.ndarray, List[str]]:
-    """Load and preprocess network log data."""
+LOG_TYPE = "Network Traffic Logs"
+
+def load_and_preprocess_data(file_path: str, scaler: Optional[MinMaxScaler] = None
+                             ) -> Tuple[pd.DataFrame, np.ndarray, List[str], MinMaxScaler]:
+    """Load and preprocess network log data, reusing a fitted scaler when one is given."""
     try:
-        df = pd.read_csv(file_path)
+        df = read_log(file_path, LOG_TYPE)
         logger.info(f"Successfully loaded data from {file_path} with shape {df.shape}")
         
-        df['timestamp'] = pd.to_datetime(df['timestamp'])
         df.set_index('timestamp', inplace=True)
         
         numerical_features = ['packet_size', 'duration', 'bytes_sent', 'bytes_received']
-        scaler = MinMaxScaler()
-        scaled_data = scaler.fit_transform(df[numerical_features])
+        with stage('scale'):
+            if scaler is None:
+                scaler = MinMaxScaler()
+                scaled_data = scaler.fit_transform(df[numerical_features])
+            else:
+                scaled_data = scaler.transform(df[numerical_features])
         
         logger.info(f"Preprocessed data shape: {scaled_data.shape}")
-        return df, scaled_data, numerical_features
+        return df, scaled_data, numerical_features, scaler
     except Exception as e:
         logger.error(f"Error in data preprocessing: {str(e)}")
         raise
 
 def create_sequences(data_array: np.ndarray, window_size: int = 10) -> np.ndarray:
-    """Create sequences for LSTM processing."""
+    """Create sequences for LSTM processing as a read-only float32 window view."""
     try:
-        sequences = []
-        for i in range(len(data_array) - window_size):
-            sequences.append(data_array[i:i+window_size])
-        return np.array(sequences)
+        return sliding_windows(data_array, window_size)
     except Exception as e:
         logger.error(f"Error creating sequences: {str(e)}")
         raise
 
-def build_and_train_model(sequences: np.ndarray, window_size: int, input_dim: int) -> Model:
+def build_and_train_model(sequences: np.ndarray, window_size: int, input_dim: int):
     """Build and train the LSTM autoencoder model."""
     try:
+        # TensorFlow is only imported when the LSTM engine is used
+        from tensorflow.keras.models import Model # type: ignore
+        from tensorflow.keras.layers import Input, LSTM, RepeatVector, TimeDistributed, Dense, Dropout # type: ignore
+        from tensorflow.keras.callbacks import EarlyStopping # type: ignore
+
         inputs = Input(shape=(window_size, input_dim))
         encoded = LSTM(64, activation='relu', return_sequences=True)(inputs)
         encoded = Dropout(0.2)(encoded)
@@ -76,8 +90,8 @@ def build_and_train_model(sequences: np.ndarray, window_size: int, input_dim: in
         early_stop = EarlyStopping(monitor='val_loss', patience=5, restore_best_weights=True)
         
         logger.info("Training model...")
-        autoencoder.fit(
-            sequences, sequences,
+        fit_windows(
+            autoencoder, sequences,
             epochs=25,
             batch_size=32,
             validation_split=0.1,
@@ -111,7 +125,8 @@ def generate_plot(anomaly_df: pd.DataFrame, threshold: float) -> str:
         plt.savefig(buf, format='png', dpi=300, bbox_inches='tight')
         plt.close()
         buf.seek(0)
-        image_base64 = base64.b64encode(buf.getvalue()).decode('utf-8')
+        with stage('base64'):
+            image_base64 = base64.b64encode(buf.getvalue()).decode('utf-8')
         buf.close()
         
         return image_base64
@@ -119,54 +134,106 @@ def generate_plot(anomaly_df: pd.DataFrame, threshold: float) -> str:
         logger.error(f"Error generating plot: {str(e)}")
         raise
 
-def analyze_network_logs(file_path: str) -> Dict[str, Any]:
-    """Main function to analyze network logs."""
+def analyze_network_logs(file_path: str, mode: Optional[str] = None, tenant=None,
+                         graph_format: Optional[str] = None, engine: Optional[str] = None) -> Dict[str, Any]:
+    """Main function to analyze network logs.
+
+    In 'score-only' (or 'auto' with a registered model) mode the latest registered
+    detector and scaler are loaded instead of training on the uploaded file.
+    graph_format 'series' returns a downsampled error series instead of a PNG.
+    engine picks the detector (see detector_engines.DETECTOR_ENGINES), LSTM by default.
+    """
     try:
+        mode = resolve_mode(mode)
+        graph_format = resolve_graph_format(graph_format)
+        engine = resolve_engine(LOG_TYPE, engine)
+        model_key = registry_key(LOG_TYPE, engine)
+        registry = ModelRegistry()
+        registered = registry.load(model_key, tenant) if mode != 'train' else None
+        if registered is None and mode == 'score-only':
+            raise ValueError(f"No trained {engine} model registered for {LOG_TYPE}")
+
         # Load and preprocess data
-        df, scaled_data, numerical_features = load_and_preprocess_data(file_path)
+        scaler = registered.state['scaler'] if registered else None
+        df, scaled_data, numerical_features, scaler = load_and_preprocess_data(file_path, scaler)
         
         # Create sequences
         window_size = 10
         sequences = create_sequences(scaled_data, window_size)
         logger.info(f"Created sequences with shape: {sequences.shape}")
 
-        # Build and train model
-        input_dim = len(numerical_features)
-        autoencoder = build_and_train_model(sequences, window_size, input_dim)
+        if registered:
+            autoencoder = registered.model
+            model_version = registered.metadata['version']
+        else:
+            # Build and train model
+            input_dim = len(numerical_features)
+            with stage('train'):
+                if engine == 'lstm':
+                    autoencoder = build_and_train_model(sequences, window_size, input_dim)
+                else:
+                    autoencoder = fit_detector(engine, sequences)
+            model_version = registry.save(model_key, autoencoder, {'scaler': scaler}, tenant=tenant,
+                                          metadata={'engine': engine,
+                                                    'window_size': window_size,
+                                                    'features': numerical_features,
+                                                    'training_rows': len(df)},
+                                          sample=sequences)
 
         # Generate reconstructions and calculate MSE
-        reconstructions = autoencoder.predict(sequences)
-        mse = np.mean(np.power(sequences - reconstructions, 2), axis=(1, 2))
-        threshold = np.percentile(mse, 65)
-        logger.info(f"Anomaly Detection Threshold (65th percentile): {threshold:.4f}")
-
-        # Classify anomalies
-        anomaly_df = df.iloc[window_size:].copy()
-        anomaly_df['reconstruction_error'] = mse
-        anomaly_df['severity'] = 'normal'
-        anomaly_df.loc[anomaly_df['reconstruction_error'] > threshold, 'severity'] = 'high'
-        medium_threshold = np.percentile(mse, 60)
-        anomaly_df.loc[(anomaly_df['reconstruction_error'] > medium_threshold) &
-                       (anomaly_df['reconstruction_error'] <= threshold), 'severity'] = 'medium'
+        # Thresholds come from a quantile sketch filled while the errors are computed
+        sketch = KLLSketch()
+        mse = window_errors(autoencoder, sequences, sketch)
+        with stage('threshold'):
+            threshold = sketch.quantile(0.65)
+            logger.info(f"Anomaly Detection Threshold (65th percentile): {threshold:.4f}")
+
+            # Classify anomalies
+            anomaly_df = df.iloc[window_size:].copy()
+            anomaly_df['reconstruction_error'] = mse
+            anomaly_df['severity'] = 'normal'
+            anomaly_df.loc[anomaly_df['reconstruction_error'] > threshold, 'severity'] = 'high'
+            medium_threshold = sketch.quantile(0.60)
+            anomaly_df.loc[(anomaly_df['reconstruction_error'] > medium_threshold) &
+                           (anomaly_df['reconstruction_error'] <= threshold), 'severity'] = 'medium'
         logger.info("Anomaly Severity Classification:")
         logger.info(anomaly_df[['reconstruction_error', 'severity']].head())
 
         # Generate plot
-        image_base64 = generate_plot(anomaly_df, threshold)
+        with stage('plot'):
+            if graph_format == 'series':
+                graph_data = series_payload(
+                    anomaly_df.index, anomaly_df['reconstruction_error'],
+                    {'high': (anomaly_df['severity'] == 'high').to_numpy(),
+                     'medium': (anomaly_df['severity'] == 'medium').to_numpy()},
+                    {'high': threshold, 'medium': medium_threshold},
+                    'Reconstruction Error'
+                )
+            else:
+                graph_data = generate_plot(anomaly_df, threshold)
 
         # Filter anomalies
         filtered_anomalies = anomaly_df[anomaly_df['severity'] == 'high']
         num_anomalies = filtered_anomalies.shape[0]
         logger.info(f"Number of Anomalies Detected: {num_anomalies}")
+        with stage('source_ips'):
+            top_ips = top_source_ips(filtered_anomalies['source_ip'], filtered_anomalies.index,
+                                     filtered_anomalies['severity'], ('normal', 'medium', 'high'))
+            record_anomalies(LOG_TYPE, filtered_anomalies['source_ip'], filtered_anomalies.index,
+                             filtered_anomalies['severity'])
 
         # Prepare output data
         output_data = {
             'total_logs': len(df),
             'malicious_events': num_anomalies,
             'alert_level': 'High' if num_anomalies > ((int) (len(df)*0.1)) else 'Medium' if num_anomalies > ((int) (len(df)*0.05)) else 'Low',
-            "sourceIp": "\n,".join(filtered_anomalies["source_ip"].tolist()),
-            'log_type': "Network Traffic Logs",
-            'graph_data': image_base64
+            "sourceIp": source_ip_string(top_ips),
+            'top_source_ips': top_ips,
+            'log_type': LOG_TYPE,
+            'model_version': model_version,
+            'engine': engine,
+            'graph_format': graph_format,
+            'graph_data': graph_data
         }
 
         logger.info("Analysis completed successfully")
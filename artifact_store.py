@@ -0,0 +1,148 @@
+import os
+import base64
+import hashlib
+import logging
+from datetime import datetime
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+# Directory holding the PHP pages (upload.php, recent_logs.php) as served by the web server.
+# Graphs are only stored as files once it is configured; otherwise they stay inline base64.
+ARTIFACT_WEB_ROOT = os.environ.get('SHIELD_WEB_ROOT')
+
+# Subdirectory of the web root holding the artifacts; URLs are relative to the PHP pages
+ARTIFACT_SUBDIR = 'artifacts'
+
+# Store rendered graphs as files and return references instead of base64 (set to 0 to inline them again)
+ARTIFACTS_ENABLED = bool(ARTIFACT_WEB_ROOT) and os.environ.get('SHIELD_GRAPH_ARTIFACTS', '1') == '1'
+
+ARTIFACT_ROOT = os.path.join(ARTIFACT_WEB_ROOT, ARTIFACT_SUBDIR) if ARTIFACT_WEB_ROOT else None
+
+ARTIFACT_URL_PREFIX = f"{ARTIFACT_SUBDIR}/"
+
+# Least recently used artifacts are removed once the store grows past this size
+ARTIFACT_MAX_BYTES = int(os.environ.get('SHIELD_ARTIFACT_MAX_BYTES', str(5 * 1024 ** 3)))
+
+MEDIA_TYPES = {'png': 'image/png'}
+
+
+class ArtifactStore:
+    """Content-addressed files named by their SHA-256 under two levels of shard directories.
+
+    Identical graphs are stored once, and since a file never changes under its name the
+    web server can let browsers cache it indefinitely.
+    """
+
+    def __init__(self, root: Optional[str] = ARTIFACT_ROOT, max_bytes: int = ARTIFACT_MAX_BYTES,
+                 url_prefix: str = ARTIFACT_URL_PREFIX):
+        if root is None:
+            raise Exception("The artifact store needs SHIELD_WEB_ROOT, the directory serving the PHP pages")
+        self.root = root
+        self.max_bytes = max_bytes
+        self.url_prefix = url_prefix
+
+    @staticmethod
+    def _relative_path(digest: str, extension: str) -> str:
+        return f"{digest[:2]}/{digest[2:4]}/{digest}.{extension}"
+
+    def path_for(self, digest: str, extension: str) -> str:
+        return os.path.join(self.root, *self._relative_path(digest, extension).split('/'))
+
+    def url_for(self, digest: str, extension: str) -> str:
+        return self.url_prefix + self._relative_path(digest, extension)
+
+    def contains(self, digest: str, extension: str) -> bool:
+        """Whether an artifact is still stored, marking it as recently used."""
+        try:
+            os.utime(self.path_for(digest, extension))
+            return True
+        except OSError:
+            return False
+
+    def put(self, data: bytes, extension: str) -> Dict[str, Any]:
+        """Store raw bytes unless an identical artifact exists and return its reference."""
+        digest = hashlib.sha256(data).hexdigest()
+        if not self.contains(digest, extension):
+            path = self.path_for(digest, extension)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            staging_path = f"{path}.{os.getpid()}.tmp"
+            try:
+                with open(staging_path, 'wb') as f:
+                    f.write(data)
+                os.replace(staging_path, path)
+            finally:
+                if os.path.exists(staging_path):
+                    os.remove(staging_path)
+            logger.info(f"Stored artifact {digest}.{extension} ({len(data)} bytes)")
+            self.gc()
+        return {
+            'sha256': digest,
+            'bytes': len(data),
+            'media_type': MEDIA_TYPES.get(extension, 'application/octet-stream'),
+            'url': self.url_for(digest, extension)
+        }
+
+    def _entries(self):
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                if filename.endswith('.tmp'):
+                    continue
+                path = os.path.join(dirpath, filename)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                yield path, stat.st_size, stat.st_mtime
+
+    def gc(self, max_bytes: Optional[int] = None) -> int:
+        """Remove least recently used artifacts until the store fits in max_bytes."""
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        entries = sorted(self._entries(), key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for path, size, _ in entries:
+            if total <= max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        if removed:
+            logger.info(f"Removed {removed} artifacts, store size now {total} bytes")
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        entries = list(self._entries())
+        oldest = min((mtime for _, _, mtime in entries), default=None)
+        return {
+            'root': self.root,
+            'files': len(entries),
+            'bytes': sum(size for _, size, _ in entries),
+            'max_bytes': self.max_bytes,
+            'least_recently_used': datetime.fromtimestamp(oldest).isoformat(timespec='seconds') if oldest else None
+        }
+
+
+def store_graph(results: Dict[str, Any], store: ArtifactStore) -> Dict[str, Any]:
+    """Move an analyzer's base64 PNG graph into the store, leaving its URL in graph_data.
+
+    The reference is also reported as graph_artifact; series payloads are left inline.
+    """
+    graph_data = results.get('graph_data')
+    if results.get('graph_format', 'png') != 'png' or not isinstance(graph_data, str) or not graph_data:
+        return results
+    # Some plots are returned as data URIs
+    image_bytes = base64.b64decode(graph_data.split(',', 1)[-1])
+    artifact = store.put(image_bytes, 'png')
+    results['graph_artifact'] = artifact
+    results['graph_data'] = artifact['url']
+    return results
+
+
+def graph_artifact_available(results: Dict[str, Any], store: ArtifactStore) -> bool:
+    """Whether the graph referenced by (cached) results has not been collected."""
+    artifact = results.get('graph_artifact')
+    return artifact is None or store.contains(artifact['sha256'], artifact['url'].rsplit('.', 1)[-1])
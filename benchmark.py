@@ -0,0 +1,159 @@
+import os
+import re
+import sys
+import json
+import logging
+import argparse
+import platform
+import tempfile
+import inspect
+import importlib
+import contextlib
+import multiprocessing
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Any, List, Optional
+
+from log_schemas import ANALYZERS
+from synthetic_logs import GENERATORS, ANOMALY_RATE, write_csv
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ROWS = [10_000, 100_000]
+
+DATA_DIR = os.environ.get('SHIELD_BENCHMARK_DATA_DIR',
+                          os.path.join(tempfile.gettempdir(), 'shield_benchmark'))
+
+# Relative slowdown (or memory growth) against the baseline reported as a regression
+TOLERANCE = 0.2
+
+
+def _slug(log_type: str) -> str:
+    return re.sub(r'[^A-Za-z0-9]+', '_', log_type).strip('_').lower()
+
+
+def dataset_path(log_type: str, rows: int, seed: int, anomaly_rate: float, data_dir: str = DATA_DIR) -> str:
+    """Write the synthetic log for a case unless an identical one was generated before."""
+    os.makedirs(data_dir, exist_ok=True)
+    path = os.path.join(data_dir, f"{_slug(log_type)}_{rows}_{seed}_{anomaly_rate:g}.csv")
+    if not os.path.exists(path):
+        write_csv(log_type, path, rows, anomaly_rate, seed)
+    return path
+
+
+def run_case(log_type: str, path: str, rows: int, options: Dict[str, Any]) -> Dict[str, Any]:
+    """Run one analyzer over one file; called in a fresh process so peak RSS belongs to this case alone."""
+    from instrumentation import collect
+
+    module_name, function_name = ANALYZERS[log_type]
+    with collect(log_type) as timings:
+        with timings.stage('import'):
+            function = getattr(importlib.import_module(module_name), function_name)
+        parameters = inspect.signature(function).parameters
+        options = {name: value for name, value in options.items() if name in parameters and value is not None}
+        # Some analyzers print their whole result, graph included
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            result = function(path, **options)
+    report = timings.as_dict()
+    analysis_wall_s = report['total_wall_s'] - report['stages'].get('import', {}).get('wall_s', 0.0)
+    return {
+        'rows_per_s': round(rows / analysis_wall_s, 1) if analysis_wall_s > 0 else None,
+        **report,
+        'malicious_events': result.get('malicious_events'),
+        'engine': result.get('engine')
+    }
+
+
+def run_benchmark(log_types: List[str], row_counts: List[int], seed: int = 0,
+                  anomaly_rate: float = ANOMALY_RATE, mode: str = 'train',
+                  graph_format: Optional[str] = None, engine: Optional[str] = None,
+                  data_dir: str = DATA_DIR) -> Dict[str, Any]:
+    # Models trained here go to a scratch registry, never the one serving uploads
+    os.environ.setdefault('SHIELD_MODEL_DIR', os.path.join(data_dir, 'models'))
+    context = multiprocessing.get_context('spawn')
+    options = {'mode': mode, 'graph_format': graph_format, 'engine': engine}
+    cases = []
+    for log_type in log_types:
+        for rows in row_counts:
+            case = {'log_type': log_type, 'rows': rows}
+            try:
+                path = dataset_path(log_type, rows, seed, anomaly_rate, data_dir)
+                with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                    case.update(executor.submit(run_case, log_type, path, rows, options).result())
+                logger.info(f"{log_type} x {rows}: {case['rows_per_s']} rows/s, peak {case['peak_rss_mb']} MB")
+            except Exception as e:
+                logger.error(f"{log_type} x {rows} failed: {str(e)}")
+                case['error'] = str(e)
+            cases.append(case)
+    return {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'host': {'platform': platform.platform(), 'python': platform.python_version(),
+                 'cpus': os.cpu_count()},
+        'settings': {'seed': seed, 'anomaly_rate': anomaly_rate, **options},
+        'cases': cases
+    }
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float = TOLERANCE) -> List[str]:
+    """Describe every case that is slower, or uses more memory, than the baseline by more than tolerance."""
+    previous = {(case['log_type'], case['rows']): case for case in baseline.get('cases', [])}
+    regressions = []
+    for case in report['cases']:
+        before = previous.get((case['log_type'], case['rows']))
+        if before is None or 'error' in before:
+            continue
+        name = f"{case['log_type']} x {case['rows']}"
+        if 'error' in case:
+            regressions.append(f"{name}: failed ({case['error']})")
+            continue
+        if before.get('rows_per_s') and case['rows_per_s'] < before['rows_per_s'] * (1 - tolerance):
+            regressions.append(f"{name}: {case['rows_per_s']} rows/s, baseline {before['rows_per_s']}")
+        if before.get('peak_rss_mb') and case['peak_rss_mb'] and \
+                case['peak_rss_mb'] > before['peak_rss_mb'] * (1 + tolerance):
+            regressions.append(f"{name}: peak {case['peak_rss_mb']} MB, baseline {before['peak_rss_mb']} MB")
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog='benchmark.py',
+                                     description='Measure analyzer throughput on synthetic logs')
+    parser.add_argument('--log-type', action='append', choices=list(GENERATORS),
+                        help='Analyzer to run (repeatable, default all)')
+    parser.add_argument('--rows', type=int, nargs='+', default=DEFAULT_ROWS,
+                        help='Row counts to generate, e.g. 10000 1000000 10000000')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--anomaly-rate', type=float, default=ANOMALY_RATE)
+    parser.add_argument('--mode', default='train', help='Model mode passed to the analyzers')
+    parser.add_argument('--graph-format', help='Graph format passed to the analyzers')
+    parser.add_argument('--engine', help='Detector engine passed to the network, DNS and application analyzers')
+    parser.add_argument('--data-dir', default=DATA_DIR, help='Where generated logs are kept between runs')
+    parser.add_argument('--output', help='Write the report to this JSON file')
+    parser.add_argument('--baseline', help='Baseline report to compare against')
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='Overwrite --baseline with this run instead of comparing')
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE)
+    args = parser.parse_args(argv)
+
+    report = run_benchmark(args.log_type or list(GENERATORS), args.rows, args.seed, args.anomaly_rate,
+                           args.mode, args.graph_format, args.engine, args.data_dir)
+
+    regressions = []
+    if args.baseline and not args.save_baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        report['regressions'] = regressions
+    for path in filter(None, [args.output, args.baseline if args.save_baseline else None]):
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=2)
+        logger.info(f"Benchmark report written to {path}")
+
+    print(json.dumps({'cases': [{key: case.get(key) for key in ('log_type', 'rows', 'rows_per_s',
+                                                                  'peak_rss_mb', 'error') if key in case}
+                                for case in report['cases']],
+                      'regressions': regressions}, indent=2))
+    return 1 if regressions or any('error' in case for case in report['cases']) else 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    sys.exit(main())
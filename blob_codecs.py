@@ -0,0 +1,132 @@
+import io
+import os
+import gzip
+import zlib
+import logging
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Codec used when compacting stored uploads: zstd (needs pyarrow) or gzip
+UPLOAD_CODEC = os.environ.get('SHIELD_UPLOAD_CODEC', 'zstd')
+
+# Compression level for compaction; None uses the codec's default
+UPLOAD_CODEC_LEVEL = int(os.environ['SHIELD_UPLOAD_CODEC_LEVEL']) if os.environ.get('SHIELD_UPLOAD_CODEC_LEVEL') else None
+
+# Leading bytes of each supported compressed format
+MAGIC = {
+    'zstd': b'\x28\xb5\x2f\xfd',
+    'gzip': b'\x1f\x8b'
+}
+
+CODECS = tuple(MAGIC)
+
+# Bytes compressed per call (one zstd frame) while compacting an upload
+COMPRESS_CHUNK_SIZE = 8 * 1024 ** 2
+
+
+def sniff(header: bytes) -> Optional[str]:
+    """Codec of a blob from its first bytes, or None for uncompressed data."""
+    for codec, magic in MAGIC.items():
+        if header.startswith(magic):
+            return codec
+    return None
+
+
+def _decompressor(codec: str, stream):
+    if codec == 'gzip':
+        return gzip.GzipFile(fileobj=stream, mode='rb')
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise Exception("Reading zstd-compressed uploads requires pyarrow")
+    return pa.CompressedInputStream(_Borrowed(stream), 'zstd')
+
+
+class _Borrowed(io.RawIOBase):
+    """Read-only view that leaves the stream open when pyarrow closes it on restart."""
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        data = self.stream.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+
+class DecompressedStream(io.RawIOBase):
+    """Decompressed view of a compressed, seekable binary stream.
+
+    Reads decompress on the fly, so only a chunk of the upload is held in memory.
+    Seeking backwards restarts decompression from the start of the compressed stream;
+    closing the view closes the compressed stream.
+    """
+
+    def __init__(self, stream, codec: str):
+        self.stream = stream
+        self.codec = codec
+        self._open()
+
+    def _open(self):
+        self.stream.seek(0)
+        self._reader = _decompressor(self.codec, self.stream)
+        self.position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self.position
+
+    def readinto(self, buffer) -> int:
+        data = self._reader.read(len(buffer))
+        buffer[:len(data)] = data
+        self.position += len(data)
+        return len(data)
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self.position
+        elif whence != io.SEEK_SET:
+            raise io.UnsupportedOperation("Compressed uploads cannot seek from the end")
+        if offset < self.position:
+            self._open()
+        while self.position < offset:
+            skipped = self._reader.read(min(offset - self.position, COMPRESS_CHUNK_SIZE))
+            if not skipped:
+                break
+            self.position += len(skipped)
+        return self.position
+
+    def close(self):
+        if not self.closed:
+            self.stream.close()
+        super().close()
+
+
+def compress_stream(stream, codec: str = UPLOAD_CODEC, level: Optional[int] = UPLOAD_CODEC_LEVEL) -> bytes:
+    """Compress a binary stream chunk by chunk into one blob of the given codec."""
+    if codec == 'gzip':
+        encoder = zlib.compressobj(level if level is not None else 6, wbits=31)
+        parts = []
+        for chunk in iter(lambda: stream.read(COMPRESS_CHUNK_SIZE), b''):
+            parts.append(encoder.compress(chunk))
+        parts.append(encoder.flush())
+        return b''.join(parts)
+    if codec != 'zstd':
+        raise ValueError(f"Unknown codec '{codec}', expected one of {', '.join(CODECS)}")
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise Exception("Writing zstd-compressed uploads requires pyarrow")
+    # One zstd frame per chunk; frames concatenate into a single valid stream
+    encoder = pa.Codec('zstd', compression_level=level)
+    return b''.join(encoder.compress(chunk, asbytes=True)
+                    for chunk in iter(lambda: stream.read(COMPRESS_CHUNK_SIZE), b''))
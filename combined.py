@@ -3,7 +3,15 @@ import matplotlib.pyplot as plt
 from sklearn.ensemble import IsolationForest
 import numpy as np
 import os
+import io
+import json
+import argparse
 import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+from instrumentation import collect, emit, stage
+from model_registry import ModelRegistry, forest_scores, resolve_mode
+from rollups import Rollup
 
 # Define log folders
 LOG_FOLDERS = {
@@ -18,22 +26,30 @@ LOG_FOLDERS = {
 
 OUTPUT_BASE_PATH = "static"
 
+# Per-folder watermarks and hourly rollups
+STATE_BASE_PATH = os.path.join("cache", "combined")
+
 # Get the latest log file from a specified folder
 def get_latest_log(log_folder):
     try:
-        files = [os.path.join(log_folder, f) for f in os.listdir(log_folder) if f.endswith(".csv")]
+        with os.scandir(log_folder) as entries:
+            files = [(entry.stat().st_ctime, entry.path) for entry in entries
+                     if entry.name.endswith(".csv") and entry.is_file()]
         if not files:
             return None
-        latest_file = max(files, key=os.path.getctime)
+        latest_file = max(files)[1]
         return latest_file
     except Exception as e:
         # print(f"❌ Error accessing log files in {log_folder}: {e}")
         return None
 
-# Load logs and normalize column names
-def load_logs(file_path):
+# Load logs and normalize column names; `names` reads headerless rows appended to a file
+def load_logs(file_path, names=None):
     try:
-        logs = pd.read_csv(file_path)
+        if names is None:
+            logs = pd.read_csv(file_path)
+        else:
+            logs = pd.read_csv(file_path, header=None, names=names)
         logs.columns = logs.columns.str.lower().str.replace(' ', '_')
         if 'timestamp' not in logs.columns:
             return None
@@ -46,28 +62,44 @@ def load_logs(file_path):
         return None
 
 # Extract features
-def extract_features(logs):
+def extract_features(logs, numeric_columns=None):
     if logs is None or logs.empty:
         return None
-    numeric_columns = logs.select_dtypes(include=[np.number]).columns.tolist()
+    if numeric_columns is None:
+        numeric_columns = logs.select_dtypes(include=[np.number]).columns.tolist()
     if not numeric_columns:
         return None
-    features = logs.resample('h')[numeric_columns].agg(['sum', 'mean', 'std', 'max', 'min']).reset_index()
-    features.columns = ['timestamp'] + ['{}_{}'.format(col[0], col[1]) for col in features.columns[1:]]
-    return features
+    # Same columns as resample('h').agg(['sum', 'mean', 'std', 'max', 'min'])
+    return Rollup.from_rows(logs, numeric_columns).to_features()
 
-# Detect anomalies
-def detect_anomalies(features, contamination=0.1):
+# Detect anomalies, scoring with a baseline forest when one is given
+def detect_anomalies(features, contamination=0.1, model=None):
     if features is None or features.empty:
         return None
     anomaly_columns = [col for col in features.columns if col != 'timestamp']
     if not anomaly_columns:
         return None
-    model = IsolationForest(contamination=contamination, random_state=42)
-    features['Anomaly_Score'] = model.fit_predict(features[anomaly_columns])
+    if model is None:
+        model = IsolationForest(contamination=contamination, random_state=42).fit(features[anomaly_columns])
+    _, features['Anomaly_Score'] = forest_scores(model, features[anomaly_columns])
     features['Anomaly'] = features['Anomaly_Score'] == -1
     return features
 
+# Baseline forest for the hourly features of a log type; fitted and registered in 'train' mode,
+# or in 'auto' mode when none matching the current feature columns is registered
+def baseline_forest(log_type, features, mode, contamination=0.1):
+    registry = ModelRegistry()
+    registry_key = f"combined {log_type}"
+    anomaly_columns = [col for col in features.columns if col != 'timestamp']
+    registered = registry.load(registry_key) if mode != 'train' else None
+    if registered is not None and registered.metadata.get('features') == anomaly_columns:
+        return registered.model
+    if mode == 'score-only':
+        raise ValueError(f"No baseline registered for the {log_type} hourly features")
+    model = IsolationForest(contamination=contamination, random_state=42).fit(features[anomaly_columns])
+    registry.save(registry_key, model, {}, metadata={'features': anomaly_columns, 'training_rows': len(features)})
+    return model
+
 # Save anomaly graph
 def save_anomaly_graph(features, log_type):
     output_folder = os.path.join(OUTPUT_BASE_PATH, log_type)
@@ -93,40 +125,143 @@ def save_anomaly_graph(features, log_type):
     plt.savefig(output_file)
     plt.close()
 
-# Main function: Runs for all log types
-def main():
-    # print("\n🚀 Running anomaly detection on all log types...\n")
+# Path of the persisted watermark and rollup of a log type
+def state_path(log_type):
+    return os.path.join(STATE_BASE_PATH, log_type, 'state.pkl')
 
-    for log_type, folder in LOG_FOLDERS.items():
-        # print(f"🔍 Checking latest log file for: {log_type}")
+# Load the watermark and hourly rollup of a log type, or None if there is none
+def load_state(log_type):
+    try:
+        state = pd.read_pickle(state_path(log_type))
+        rollup = Rollup(state['watermark']['numeric_columns'], 'h', state['rollup'])
+        return state['watermark'], rollup
+    except Exception:
+        return None
+
+# Persist the watermark and rollup together, so they can never disagree
+def save_state(log_type, watermark, rollup):
+    path = state_path(log_type)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    pd.to_pickle({'watermark': watermark, 'rollup': rollup.state}, path + '.tmp')
+    os.replace(path + '.tmp', path)
+
+# Split raw bytes into complete lines and a trailing line that may still be being written
+def split_complete_lines(data):
+    cut = data.rfind(b'\n') + 1
+    return data[:cut], data[cut:]
+
+# Fold rows read past the watermark into the hourly rollup; returns (watermark, rollup, features) or None
+def fold_rows(watermark, data, rollup):
+    complete, partial = split_complete_lines(data)
+    complete_rows, partial_rows = [
+        load_logs(io.BytesIO(chunk), names=watermark['columns']) if chunk.strip() else None
+        for chunk in (complete, partial)
+    ]
+    if complete.strip() and complete_rows is None:
+        return None
 
+    if rollup is None:
+        typed = complete_rows if complete_rows is not None else partial_rows
+        if typed is None:
+            return None
+        watermark['numeric_columns'] = typed.select_dtypes(include=[np.number]).columns.tolist()
+        if not watermark['numeric_columns']:
+            return None
+        rollup = Rollup(watermark['numeric_columns'])
+
+    if complete_rows is not None and not complete_rows.empty:
+        rollup.update(complete_rows)
+        last_timestamp = complete_rows.index.max()
+        if watermark.get('last_timestamp') is None or last_timestamp.isoformat() > watermark['last_timestamp']:
+            watermark['last_timestamp'] = last_timestamp.isoformat()
+    watermark['offset'] += len(complete)
+
+    # The trailing row counts towards this run only; it is read again once its line is complete
+    current = rollup
+    if partial_rows is not None and not partial_rows.empty:
+        current = rollup.copy().update(partial_rows)
+    return watermark, rollup, current.to_features()
+
+# Read a whole log file
+def full_scan(log_file, stat):
+    with open(log_file, 'rb') as f:
+        data = f.read()
+    header, _, body = data.partition(b'\n')
+    watermark = {
+        'file': log_file,
+        'size': stat.st_size,
+        'mtime': stat.st_mtime,
+        'offset': len(header) + 1,
+        'columns': pd.read_csv(io.BytesIO(header), nrows=0).columns.tolist(),
+        'numeric_columns': None,
+        'last_timestamp': None
+    }
+    return fold_rows(watermark, body, None)
+
+# Read only the rows appended since the watermark
+def incremental_scan(log_file, stat, watermark, rollup):
+    with open(log_file, 'rb') as f:
+        f.seek(watermark['offset'])
+        data = f.read()
+    return fold_rows(dict(watermark, size=stat.st_size, mtime=stat.st_mtime), data, rollup)
+
+# Process one log folder, skipping it when its latest file is unchanged since the last run
+def process_folder(log_type, folder, full=False, mode=None):
+    try:
         log_file = get_latest_log(folder)
-        
         if not log_file:
-            # print(f"❌ No log files found for {log_type}\n")
-            continue
-
-        # print(f"✅ Processing latest log file: {log_file}")
+            return 'no-logs'
+        stat = os.stat(log_file)
 
-        logs = load_logs(log_file)
-        if logs is None:
-            # print("❌ Failed to load log data.\n")
-            continue
+        state = None if full else load_state(log_type)
+        same_file = state is not None and state[0]['file'] == log_file
+        if same_file and state[0]['size'] == stat.st_size and state[0]['mtime'] == stat.st_mtime:
+            return 'unchanged'
 
-        features = extract_features(logs)
-        if features is None:
-            # print("❌ Failed to extract features.\n")
-            continue
+        with collect(f"combined {log_type}") as timings:
+            result, status = None, 'full'
+            with stage('scan'):
+                if same_file and stat.st_size >= state[0]['offset']:
+                    result, status = incremental_scan(log_file, stat, *state), 'incremental'
+                if result is None:
+                    result, status = full_scan(log_file, stat), 'full'
+            if result is None:
+                return 'failed'
 
-        features = detect_anomalies(features)
-        if features is None:
-            # print("❌ Failed to detect anomalies.\n")
-            continue
+            watermark, rollup, features = result
+            with stage('save_state'):
+                save_state(log_type, watermark, rollup)
 
-        save_anomaly_graph(features, log_type)
-        # print(f"✅ Anomaly graph saved for {log_type}. Check static/{log_type}/anomalies.png.\n")
+            if features is None:
+                return 'failed'
+            with stage('detect'):
+                features = detect_anomalies(features, model=baseline_forest(log_type, features, resolve_mode(mode)))
+            if features is None:
+                return 'failed'
+            with stage('plot'):
+                save_anomaly_graph(features, log_type)
+        emit(timings, {'scan': status})
+        return status
+    except Exception as e:
+        # print(f"❌ Error processing {log_type}: {e}")
+        return 'failed'
 
+# Main function: Runs for all log types, one folder per worker process
+def main(workers=None, full=False, mode=None):
+    # print("\n🚀 Running anomaly detection on all log types...\n")
+    workers = workers or min(len(LOG_FOLDERS), os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {log_type: executor.submit(process_folder, log_type, folder, full, mode)
+                   for log_type, folder in LOG_FOLDERS.items()}
+        statuses = {log_type: future.result() for log_type, future in futures.items()}
     # print("🎉 Done! All logs processed.\n")
+    return statuses
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description='Detect anomalies in the latest log of every log folder')
+    parser.add_argument('--full', action='store_true', help='Ignore watermarks and rescan every latest file')
+    parser.add_argument('--workers', type=int, help='Worker processes (default: one per folder, up to the CPU count)')
+    parser.add_argument('--mode', choices=['train', 'score-only', 'auto'],
+                        help='Refit the hourly baselines (train) or score against the registered ones')
+    args = parser.parse_args()
+    main(args.workers, args.full, args.mode)
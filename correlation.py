@@ -0,0 +1,170 @@
+import os
+import logging
+import ipaddress
+import contextlib
+import contextvars
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import timed
+from log_schemas import ANOMALY_EVENTS
+
+logger = logging.getLogger(__name__)
+
+# Anomalies of one source IP closer together than this are chained into one incident
+CORRELATION_TOLERANCE_S = float(os.environ.get('SHIELD_CORRELATION_TOLERANCE_S', '300'))
+
+# Distinct log types an incident needs before it is reported
+MIN_LOG_TYPES = 2
+
+# Severity labels of the analyzers on one scale, so incidents can report the worst of them
+SEVERITY_RANKS = {
+    'normal': 0, 'info': 1, 'low': 1,
+    'moderate': 2, 'medium': 2, 'warning': 2,
+    'high': 3, 'critical': 4
+}
+
+_captured: contextvars.ContextVar = contextvars.ContextVar('shield_anomalies', default=None)
+
+
+@contextlib.contextmanager
+def capture_anomalies():
+    """Collect the anomaly events recorded by the analyzers in the enclosed code."""
+    events: List[pd.DataFrame] = []
+    token = _captured.set(events)
+    try:
+        yield events
+    finally:
+        _captured.reset(token)
+
+
+def record_anomalies(log_type: str, ips, timestamps, severities=None):
+    """Report an analyzer's anomalous rows; does nothing unless anomalies are being captured."""
+    events = _captured.get()
+    if events is None:
+        return
+    ips = np.asarray(ips, dtype=object)
+    events.append(pd.DataFrame({
+        'timestamp': pd.to_datetime(np.asarray(timestamps), errors='coerce'),
+        'log_type': log_type,
+        'ip': ips.astype(str),
+        'severity': np.asarray(severities, dtype=object).astype(str) if severities is not None else None
+    }))
+
+
+def anomaly_events(captured: List[pd.DataFrame]) -> pd.DataFrame:
+    """One frame of every captured event, typed like the log store's anomaly events."""
+    if not captured:
+        return pd.DataFrame({'timestamp': pd.Series(dtype='datetime64[ns]'), 'log_type': pd.Series(dtype=object),
+                             'ip': pd.Series(dtype=object), 'severity': pd.Series(dtype=object)})
+    return pd.concat(captured, ignore_index=True)
+
+
+def _normalize_ip(value: str) -> str:
+    value = value.strip().lower().strip('[]')
+    # Drop a port from IPv4 'a.b.c.d:port' and bracketed IPv6 '[addr]:port'
+    if value.count(':') == 1:
+        value = value.split(':', 1)[0]
+    elif ']:' in value:
+        value = value.split(']:', 1)[0]
+    try:
+        address = ipaddress.ip_address(value)
+    except ValueError:
+        return value
+    if address.version == 6 and address.ipv4_mapped is not None:
+        address = address.ipv4_mapped
+    return address.compressed
+
+
+def normalize_ips(ips) -> pd.Categorical:
+    """Canonical form of every address (ports, brackets and IPv4-mapped IPv6 removed).
+
+    Each distinct value is normalized once, so the cost grows with the number of IPs
+    rather than the number of rows.
+    """
+    codes, uniques = pd.factorize(pd.Series(ips).astype(str))
+    normalized = pd.Index([_normalize_ip(value) for value in uniques])
+    categories, remap = np.unique(normalized.to_numpy(dtype=str), return_inverse=True)
+    remap = np.append(remap, -1)
+    return pd.Categorical.from_codes(remap[codes], categories=categories)
+
+
+@timed('correlate')
+def correlate(events: pd.DataFrame, tolerance_s: float = CORRELATION_TOLERANCE_S,
+              min_log_types: int = MIN_LOG_TYPES) -> pd.DataFrame:
+    """Multi-signal incidents: anomalies of one source IP from several log types close in time.
+
+    Events are sorted by IP and timestamp once; an incident starts wherever the IP changes
+    or the gap to the previous event exceeds the tolerance, and incidents whose events come
+    from fewer than `min_log_types` log types are dropped. Sorting dominates, so millions
+    of events take O(n log n) without comparing pairs of events.
+    """
+    events = events.dropna(subset=['timestamp'])
+    ips = normalize_ips(events['ip'].to_numpy())
+    ip_codes = ips.codes.astype(np.int64)
+    times = events['timestamp'].to_numpy(dtype='datetime64[ns]').astype(np.int64)
+    valid = ip_codes >= 0
+    ip_codes, times = ip_codes[valid], times[valid]
+    log_types, log_type_names = pd.factorize(events['log_type'].to_numpy()[valid])
+    severities = events['severity'].to_numpy()[valid] if 'severity' in events else np.full(len(times), None)
+    ranks = pd.Series(severities, dtype=object).str.lower().map(SEVERITY_RANKS).fillna(-1).to_numpy(np.int64)
+
+    order = np.lexsort((times, ip_codes))
+    ip_codes, times, log_types, ranks = ip_codes[order], times[order], log_types[order], ranks[order]
+    severities = np.asarray(severities, dtype=object)[order]
+
+    boundaries = np.ones(len(times), dtype=bool)
+    boundaries[1:] = (ip_codes[1:] != ip_codes[:-1]) | (np.diff(times) > int(tolerance_s * 1e9))
+    incident_ids = np.cumsum(boundaries) - 1
+
+    frame = pd.DataFrame({'incident': incident_ids, 'log_type': log_types, 'rank': ranks, 'time': times})
+    summary = frame.groupby('incident', sort=False).agg(
+        events=('time', 'size'), start=('time', 'min'), end=('time', 'max'),
+        log_types=('log_type', 'nunique'), max_rank=('rank', 'max')
+    )
+    summary = summary[summary['log_types'] >= min_log_types]
+    if summary.empty:
+        return pd.DataFrame(columns=['ip', 'start', 'end', 'events', 'log_types', 'signals', 'max_severity'])
+
+    # Per log type event counts, only for the incidents that are kept
+    kept = np.isin(incident_ids, summary.index.to_numpy())
+    counts = frame[kept].groupby(['incident', 'log_type']).size()
+    signals = {incident: {} for incident in summary.index}
+    for (incident, log_type), count in counts.items():
+        signals[incident][str(log_type_names[log_type])] = int(count)
+
+    first_rows = np.flatnonzero(boundaries)[summary.index.to_numpy()]
+    worst_rows = frame[kept].sort_values('rank', kind='stable').groupby('incident').tail(1)
+    worst = pd.Series(severities[worst_rows.index.to_numpy()], index=worst_rows['incident'].to_numpy())
+
+    incidents = pd.DataFrame({
+        'ip': ips.categories[ip_codes[first_rows]],
+        'start': pd.to_datetime(summary['start'].to_numpy()),
+        'end': pd.to_datetime(summary['end'].to_numpy()),
+        'events': summary['events'].to_numpy(),
+        'log_types': summary['log_types'].to_numpy(),
+        'signals': [signals[incident] for incident in summary.index],
+        'max_severity': [worst.get(incident) if rank >= 0 else None
+                         for incident, rank in zip(summary.index, summary['max_rank'])]
+    })
+    return incidents.sort_values(['log_types', 'events', 'start'], ascending=[False, False, True],
+                                 kind='stable').reset_index(drop=True)
+
+
+def incidents_payload(incidents: pd.DataFrame, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    """JSON-ready list of the top incidents."""
+    rows = incidents.head(limit) if limit is not None else incidents
+    return [
+        {
+            'ip': row.ip,
+            'start': row.start.isoformat(),
+            'end': row.end.isoformat(),
+            'events': int(row.events),
+            'log_types': int(row.log_types),
+            'signals': row.signals,
+            'max_severity': row.max_severity
+        }
+        for row in rows.itertuples(index=False)
+    ]
@@ -0,0 +1,233 @@
+import io
+import os
+import logging
+from typing import Optional, Tuple
+
+import mysql.connector
+from mysql.connector import pooling
+
+from blob_codecs import MAGIC, UPLOAD_CODEC, UPLOAD_CODEC_LEVEL, DecompressedStream, compress_stream, sniff
+
+logger = logging.getLogger(__name__)
+
+# Add database configuration
+DB_CONFIG = {
+    'host': 'localhost',
+    'user': 'Shield_db',
+    'password': 'Shield_db',
+    'database': 'Shield_db'
+}
+
+# Connections kept open per process
+POOL_SIZE = int(os.environ.get('SHIELD_DB_POOL_SIZE', '5'))
+
+# Bytes fetched per round trip when streaming an uploaded file
+BLOB_CHUNK_SIZE = int(os.environ.get('SHIELD_BLOB_CHUNK_SIZE', str(8 * 1024 ** 2)))
+
+# SQL condition matching uploads not stored in one of the compressed formats
+UNCOMPRESSED_CONDITION = " AND ".join(
+    f"SUBSTRING(filedata, 1, {len(magic)}) <> X'{magic.hex().upper()}'" for magic in MAGIC.values()
+)
+
+_pool = None
+_pool_pid = None
+
+
+def connect():
+    """Borrow a connection from this process's pool; closing it returns it to the pool"""
+    global _pool, _pool_pid
+    # Pooled sockets must not be shared with forked worker processes
+    if _pool is None or _pool_pid != os.getpid():
+        _pool = pooling.MySQLConnectionPool(pool_name=f"shield_{os.getpid()}", pool_size=POOL_SIZE,
+                                            **DB_CONFIG)
+        _pool_pid = os.getpid()
+    try:
+        return _pool.get_connection()
+    except mysql.connector.errors.PoolError:
+        # Every pooled connection is busy; fall back to a dedicated one
+        logger.warning("Database connection pool exhausted, opening an unpooled connection")
+        return mysql.connector.connect(**DB_CONFIG)
+
+
+class SQLiteConnection:
+    """Transaction wrapper over a sqlite3 connection in autocommit mode (the local stand-in for MySQL)."""
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def execute(self, query, params=()):
+        return self.connection.execute(query, params)
+
+    def begin(self):
+        # Takes the database write lock up front so concurrent writers (e.g. two queue workers
+        # claiming the same job) serialize before reading
+        self.connection.execute("BEGIN IMMEDIATE")
+
+    def commit(self):
+        self.connection.execute("COMMIT")
+
+    def rollback(self):
+        self.connection.execute("ROLLBACK")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.connection.close()
+
+
+class MySQLConnection:
+    """Transaction wrapper over a pooled connection, autocommitting outside begin()/commit()."""
+
+    def __init__(self, connection):
+        self.connection = connection
+        # Pooled connections are shared, so the session setting is put back on release
+        self._autocommit = connection.autocommit
+        self.connection.autocommit = True
+
+    def execute(self, query, params=()):
+        cursor = self.connection.cursor(buffered=True)
+        cursor.execute(query, params)
+        return cursor
+
+    def begin(self):
+        self.connection.start_transaction()
+
+    def commit(self):
+        self.connection.commit()
+
+    def rollback(self):
+        self.connection.rollback()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        try:
+            self.connection.autocommit = self._autocommit
+        finally:
+            self.connection.close()
+
+
+class _BlobRange(io.RawIOBase):
+    """Seekable raw stream over UploadLogs.filedata, read in SUBSTRING ranges over one connection."""
+
+    def __init__(self, log_id: int, chunk_size: int = BLOB_CHUNK_SIZE):
+        self.log_id = log_id
+        self.chunk_size = chunk_size
+        self.position = 0
+        self.connection = connect()
+        try:
+            cursor = self.connection.cursor()
+            # The server hashes the blob so the caches can be checked before any of it is transferred
+            cursor.execute("SELECT OCTET_LENGTH(filedata), SHA2(filedata, 256) FROM UploadLogs WHERE id = %s",
+                           (log_id,))
+            row = cursor.fetchone()
+            cursor.close()
+        except Exception:
+            self.connection.close()
+            raise
+        if not row:
+            self.connection.close()
+            raise Exception(f"No log file found with ID: {log_id}")
+        self.size = int(row[0] or 0)
+        self.digest = row[1] or ''
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self.position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self.position
+        elif whence == io.SEEK_END:
+            offset += self.size
+        self.position = max(0, offset)
+        return self.position
+
+    def readinto(self, buffer) -> int:
+        length = min(len(buffer), self.chunk_size, self.size - self.position)
+        if length <= 0:
+            return 0
+        cursor = self.connection.cursor()
+        cursor.execute("SELECT SUBSTRING(filedata, %s, %s) FROM UploadLogs WHERE id = %s",
+                       (self.position + 1, length, self.log_id))
+        chunk = cursor.fetchone()[0]
+        cursor.close()
+        buffer[:len(chunk)] = chunk
+        self.position += len(chunk)
+        return len(chunk)
+
+    def close(self):
+        if not self.closed:
+            self.connection.close()
+        super().close()
+
+
+class UploadBlob(io.BufferedReader):
+    """Buffered stream over an uploaded file, holding at most one chunk of it in memory.
+
+    `digest` is the SHA-256 of the whole file and `size` its length in bytes.
+    """
+
+    def __init__(self, log_id: int, chunk_size: int = BLOB_CHUNK_SIZE):
+        raw = _BlobRange(log_id, chunk_size)
+        super().__init__(raw, buffer_size=chunk_size)
+        self.digest = raw.digest
+        self.size = raw.size
+
+
+class DecompressedUpload(io.BufferedReader):
+    """Uploaded file stored compressed, decompressed as it is streamed.
+
+    `digest` and `size` describe the stored (compressed) blob, `codec` its format.
+    """
+
+    def __init__(self, blob: UploadBlob, codec: str, chunk_size: int = BLOB_CHUNK_SIZE):
+        super().__init__(DecompressedStream(blob, codec), buffer_size=chunk_size)
+        self.digest = blob.digest
+        self.size = blob.size
+        self.codec = codec
+
+
+def open_upload(log_id: int) -> UploadBlob:
+    """Open the stored file of an upload for streaming, decompressing zstd or gzip blobs on the fly"""
+    try:
+        blob = UploadBlob(log_id)
+        codec = sniff(blob.peek(4)[:4])
+    except mysql.connector.Error as e:
+        raise Exception(f"Database error: {str(e)}")
+    if codec is not None:
+        blob = DecompressedUpload(blob, codec)
+    logger.info(f"Streaming upload {log_id} ({blob.size} bytes{', ' + codec if codec else ''}) "
+                f"in {BLOB_CHUNK_SIZE} byte chunks")
+    return blob
+
+
+def compact_upload(connection, log_id: int, codec: str = UPLOAD_CODEC,
+                   level: Optional[int] = UPLOAD_CODEC_LEVEL) -> Tuple[int, int]:
+    """Recompress one stored upload in place; returns its size before and after.
+
+    Blobs that are already compressed, or would not shrink, are left alone. The update
+    is not committed, so callers can commit uploads in batches.
+    """
+    with UploadBlob(log_id) as blob:
+        size = blob.size
+        if sniff(blob.peek(4)[:4]) is not None:
+            return size, size
+        compressed = compress_stream(blob, codec, level)
+    if len(compressed) >= size:
+        return size, size
+    cursor = connection.cursor()
+    try:
+        # Skip the upload if it was replaced while being compressed
+        cursor.execute("UPDATE UploadLogs SET filedata = %s WHERE id = %s AND OCTET_LENGTH(filedata) = %s",
+                       (compressed, log_id, size))
+        return (size, len(compressed)) if cursor.rowcount else (size, size)
+    finally:
+        cursor.close()
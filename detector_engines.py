@@ -0,0 +1,211 @@
+import os
+import abc
+import math
+import time
+import logging
+
+import numpy as np
+from sklearn.ensemble import IsolationForest
+from sklearn.neural_network import MLPRegressor
+
+from instrumentation import timed
+from model_registry import forest_scores
+from windowing import (PREDICT_BATCH_SIZE, TRAIN_MAX_SECONDS, TRAIN_MAX_WINDOWS, TRAIN_PATIENCE,
+                       reconstruction_errors, sample_training_windows, training_deadline, window_batches)
+
+logger = logging.getLogger(__name__)
+
+# Share of the window variance the PCA detector keeps
+PCA_VARIANCE_KEPT = 0.95
+
+# Passes over the training windows made by the dense autoencoder
+DENSE_EPOCHS = int(os.environ.get('SHIELD_DENSE_EPOCHS', '5'))
+
+# Windows the IsolationForest is fitted on; each tree only draws 256 of them anyway
+FOREST_FIT_WINDOWS = 65536
+
+
+def _flatten(batch: np.ndarray) -> np.ndarray:
+    return np.ascontiguousarray(batch, dtype=np.float32).reshape(len(batch), -1)
+
+
+class WindowDetector(abc.ABC):
+    """Detector fitted on (n, window, features) windows, scoring each window like the autoencoders do.
+
+    Larger errors are always more anomalous.
+    """
+
+    engine: str = ''
+
+    @abc.abstractmethod
+    def fit(self, windows: np.ndarray) -> 'WindowDetector':
+        """Fit on training windows and return self."""
+
+    @abc.abstractmethod
+    def errors(self, windows: np.ndarray, sketch=None) -> np.ndarray:
+        """Anomaly error per window, also fed to the sketch when one is given."""
+
+
+class ReconstructionDetector(WindowDetector):
+    """Engine reconstructing windows, so its errors come from the same reconstruction_errors()
+    as the Keras models."""
+
+    @abc.abstractmethod
+    def predict_on_batch(self, batch: np.ndarray) -> np.ndarray:
+        """Reconstruction of a batch of windows."""
+
+    def errors(self, windows: np.ndarray, sketch=None) -> np.ndarray:
+        return reconstruction_errors(self, windows, sketch=sketch)
+
+
+class PCADetector(ReconstructionDetector):
+    """Linear autoencoder: windows are projected onto the top principal components and back."""
+
+    engine = 'pca'
+
+    def __init__(self, variance_kept: float = PCA_VARIANCE_KEPT, batch_size: int = PREDICT_BATCH_SIZE * 16):
+        self.variance_kept = variance_kept
+        self.batch_size = batch_size
+        self.mean_ = None
+        self.components_ = None
+
+    def fit(self, windows: np.ndarray) -> 'PCADetector':
+        # Mean and covariance are accumulated batch by batch, so only one batch is ever flattened
+        n_features = int(np.prod(windows.shape[1:]))
+        total = np.zeros(n_features)
+        scatter = np.zeros((n_features, n_features))
+        for start in range(0, len(windows), self.batch_size):
+            flat = _flatten(windows[start:start + self.batch_size]).astype(np.float64)
+            total += flat.sum(axis=0)
+            scatter += flat.T @ flat
+        n = max(len(windows), 1)
+        self.mean_ = total / n
+        covariance = scatter / n - np.outer(self.mean_, self.mean_)
+
+        eigenvalues, eigenvectors = np.linalg.eigh(covariance)
+        order = np.argsort(eigenvalues)[::-1]
+        eigenvalues, eigenvectors = np.clip(eigenvalues[order], 0, None), eigenvectors[:, order]
+        explained = np.cumsum(eigenvalues) / eigenvalues.sum() if eigenvalues.sum() > 0 else np.ones(n_features)
+        n_components = int(np.searchsorted(explained, self.variance_kept) + 1)
+        self.components_ = eigenvectors[:, :n_components].astype(np.float32)
+        self.mean_ = self.mean_.astype(np.float32)
+        logger.info(f"PCA detector keeps {n_components} of {n_features} components")
+        return self
+
+    def predict_on_batch(self, batch: np.ndarray) -> np.ndarray:
+        centered = _flatten(batch) - self.mean_
+        reconstructed = (centered @ self.components_) @ self.components_.T + self.mean_
+        return reconstructed.reshape(batch.shape)
+
+
+class DenseDetector(ReconstructionDetector):
+    """Small fully connected autoencoder on flattened windows, trained with sklearn on the CPU."""
+
+    engine = 'dense'
+
+    def __init__(self, epochs: int = DENSE_EPOCHS, batch_size: int = 256, seed: int = 42,
+                 max_windows: int = TRAIN_MAX_WINDOWS, max_seconds: float = TRAIN_MAX_SECONDS,
+                 patience: int = TRAIN_PATIENCE):
+        self.epochs = epochs
+        self.batch_size = batch_size
+        self.seed = seed
+        self.max_windows = max_windows
+        self.max_seconds = max_seconds
+        self.patience = patience
+        self.network = None
+
+    def fit(self, windows: np.ndarray) -> 'DenseDetector':
+        # Same training budget as the Keras autoencoders in windowing.fit_windows
+        deadline = training_deadline(self.max_seconds)
+        windows = sample_training_windows(windows, self.max_windows, self.seed)
+        n_features = int(np.prod(windows.shape[1:]))
+        hidden, bottleneck = max(n_features // 2, 8), max(n_features // 8, 2)
+        self.network = MLPRegressor(hidden_layer_sizes=(hidden, bottleneck, hidden), activation='relu',
+                                    random_state=self.seed)
+        batches = window_batches(windows, self.batch_size, shuffle=True, seed=self.seed)
+        steps = math.ceil(len(windows) / self.batch_size)
+        best_loss, stale_epochs = np.inf, 0
+        for epoch in range(self.epochs):
+            losses = []
+            for _ in range(steps):
+                batch, _ = next(batches)
+                flat = _flatten(batch)
+                self.network.partial_fit(flat, flat)
+                losses.append(self.network.loss_)
+                if deadline is not None and time.perf_counter() >= deadline:
+                    logger.warning(f"Training time budget spent in epoch {epoch + 1}, stopping early")
+                    return self
+            epoch_loss = float(np.mean(losses))
+            if epoch_loss < best_loss:
+                best_loss, stale_epochs = epoch_loss, 0
+            else:
+                stale_epochs += 1
+                if self.patience > 0 and stale_epochs >= self.patience:
+                    logger.info(f"Training loss stopped improving after epoch {epoch + 1}")
+                    break
+        return self
+
+    def predict_on_batch(self, batch: np.ndarray) -> np.ndarray:
+        return self.network.predict(_flatten(batch)).reshape(batch.shape)
+
+
+def window_statistics(batch: np.ndarray) -> np.ndarray:
+    """Per-feature mean, std, min, max and first-to-last change of each window."""
+    batch = np.asarray(batch, dtype=np.float32)
+    return np.concatenate([
+        batch.mean(axis=1), batch.std(axis=1), batch.min(axis=1), batch.max(axis=1),
+        batch[:, -1] - batch[:, 0]
+    ], axis=1)
+
+
+class ForestDetector(WindowDetector):
+    """IsolationForest on window statistics; the error is the negated score_samples value."""
+
+    engine = 'iforest'
+
+    def __init__(self, fit_windows: int = FOREST_FIT_WINDOWS, batch_size: int = PREDICT_BATCH_SIZE * 16):
+        self.fit_windows = fit_windows
+        self.batch_size = batch_size
+        self.forest = None
+
+    def fit(self, windows: np.ndarray) -> 'ForestDetector':
+        # Evenly spaced windows keep the sample spread over the whole upload
+        step = max(len(windows) // self.fit_windows, 1)
+        self.forest = IsolationForest(n_estimators=100, random_state=42).fit(window_statistics(windows[::step]))
+        return self
+
+    @timed('predict')
+    def errors(self, windows: np.ndarray, sketch=None) -> np.ndarray:
+        errors = np.empty(len(windows), dtype=np.float64)
+        for start in range(0, len(windows), self.batch_size):
+            scores, _ = forest_scores(self.forest, window_statistics(windows[start:start + self.batch_size]))
+            errors[start:start + len(scores)] = -scores
+            if sketch is not None:
+                sketch.update(-scores)
+        return errors
+
+
+DETECTORS = {
+    'pca': PCADetector,
+    'dense': DenseDetector,
+    'iforest': ForestDetector
+}
+
+
+@timed('fit')
+def fit_detector(engine: str, windows: np.ndarray) -> WindowDetector:
+    """Fit one of the CPU engines; the LSTM engine is built by each analyzer."""
+    if engine not in DETECTORS:
+        raise ValueError(f"Engine '{engine}' is not a window detector")
+    logger.info(f"Fitting {engine} detector on {len(windows)} windows")
+    return DETECTORS[engine]().fit(windows)
+
+
+def window_errors(model, windows: np.ndarray, sketch=None) -> np.ndarray:
+    """Anomaly error per window from a Keras autoencoder or a WindowDetector.
+
+    The errors are added to `sketch` batch by batch as they are computed.
+    """
+    if isinstance(model, WindowDetector):
+        return model.errors(windows, sketch)
+    return reconstruction_errors(model, windows, sketch=sketch)
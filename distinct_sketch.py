@@ -0,0 +1,31 @@
+import numpy as np
+import pandas as pd
+
+# HyperLogLog with 2**8 one-byte registers: about 6.5% error, 256 bytes per sketch
+HLL_PRECISION = 8
+HLL_REGISTERS = 1 << HLL_PRECISION
+
+
+def hll_registers(values, groups: np.ndarray, n_groups: int) -> np.ndarray:
+    """HyperLogLog registers of the values falling in each group (one row per group)."""
+    hashes = pd.util.hash_array(np.asarray(values, dtype=object))
+    index = (hashes >> np.uint64(64 - HLL_PRECISION)).astype(np.int64)
+    # Rank: position of the first set bit in the next 32 hash bits
+    rest = ((hashes >> np.uint64(32 - HLL_PRECISION)) & np.uint64(0xFFFFFFFF)).astype(np.float64)
+    rank = np.where(rest > 0, 32 - np.floor(np.log2(np.maximum(rest, 1))), 33).astype(np.uint8)
+    registers = np.zeros((n_groups, HLL_REGISTERS), dtype=np.uint8)
+    highest = pd.Series(rank).groupby(groups * HLL_REGISTERS + index).max()
+    registers.reshape(-1)[highest.index.to_numpy()] = highest.to_numpy()
+    return registers
+
+
+def hll_estimate(registers: np.ndarray) -> np.ndarray:
+    """Distinct count estimated from each row of registers."""
+    registers = np.atleast_2d(registers)
+    alpha = 0.7213 / (1 + 1.079 / HLL_REGISTERS)
+    raw = alpha * HLL_REGISTERS ** 2 / np.sum(2.0 ** -registers.astype(np.float64), axis=1)
+    zeros = np.sum(registers == 0, axis=1)
+    with np.errstate(divide='ignore'):
+        # Linear counting is more accurate while many registers are still empty
+        linear = HLL_REGISTERS * np.log(HLL_REGISTERS / np.maximum(zeros, 1))
+    return np.rint(np.where((raw <= 2.5 * HLL_REGISTERS) & (zeros > 0), linear, raw)).astype(np.int64)
@@ -0,0 +1,115 @@
+import os
+import json
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import timed
+
+# png: rendered base64 PNG (default); series: downsampled JSON series drawn by the browser
+GRAPH_FORMATS = ('png', 'series')
+
+# Points kept from the score series, and per anomaly class, in a series payload
+SERIES_POINT_BUDGET = int(os.environ.get('SHIELD_GRAPH_POINTS', '1000'))
+
+
+def resolve_graph_format(graph_format: Optional[str] = None) -> str:
+    """Return the graph format, defaulting to SHIELD_GRAPH_FORMAT or 'png'."""
+    graph_format = graph_format or os.environ.get('SHIELD_GRAPH_FORMAT', 'png')
+    if graph_format not in GRAPH_FORMATS:
+        raise ValueError(f"Unknown graph format '{graph_format}', expected one of {', '.join(GRAPH_FORMATS)}")
+    return graph_format
+
+
+def lttb(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """Largest-Triangle-Three-Buckets downsampling; returns the indices of the kept points.
+
+    The first and last points are always kept; every bucket in between contributes the
+    point forming the largest triangle with the previous pick and the next bucket's mean,
+    which preserves peaks that plain striding would drop.
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    bucket_size = (n - 2) / (n_out - 2)
+
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0] = 0
+    previous = 0
+    for i in range(n_out - 2):
+        start = int(i * bucket_size) + 1
+        end = int((i + 1) * bucket_size) + 1
+        next_start = end
+        next_end = min(int((i + 2) * bucket_size) + 1, n)
+
+        next_x = x[next_start:next_end].mean()
+        next_y = y[next_start:next_end].mean()
+        area = np.abs(
+            (x[previous] - next_x) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (next_y - y[previous])
+        )
+        previous = start + int(np.argmax(area))
+        selected[i + 1] = previous
+    selected[-1] = n - 1
+    return selected
+
+
+def _x_values(x) -> np.ndarray:
+    """Numeric x values: epoch milliseconds for timestamps, the values themselves otherwise."""
+    if pd.api.types.is_datetime64_any_dtype(getattr(x, 'dtype', None)):
+        times = np.asarray(x, dtype='datetime64[ms]')
+        values = times.astype(np.int64).astype(np.float64)
+        values[np.isnat(times)] = np.nan
+        return values
+    return np.asarray(x, dtype=np.float64)
+
+
+def _round(values: np.ndarray, integer: bool = False) -> list:
+    """JSON list of values, as integers or trimmed to 6 significant digits; NaN becomes null."""
+    if integer:
+        return [None if np.isnan(v) else int(v) for v in values]
+    return [None if np.isnan(v) else float(f"{v:.6g}") for v in values]
+
+
+@timed('series')
+def series_payload(x, y, anomalies: Dict[str, np.ndarray], thresholds: Dict[str, float],
+                   y_label: str, budget: int = SERIES_POINT_BUDGET) -> str:
+    """Compact JSON payload of a score series downsampled to `budget` points.
+
+    `anomalies` maps a class name (e.g. 'high') to a boolean mask or index array over the
+    series; each class keeps its total count and at most `budget` of its highest points.
+    """
+    x_type = 'time' if pd.api.types.is_datetime64_any_dtype(getattr(x, 'dtype', None)) else 'index'
+    x_values = _x_values(x)
+    y_values = np.asarray(y, dtype=np.float64)
+
+    valid = np.flatnonzero(~(np.isnan(x_values) | np.isnan(y_values)))
+    kept = valid[lttb(x_values[valid], y_values[valid], budget)]
+
+    anomaly_points = {}
+    for name, selector in anomalies.items():
+        selector = np.asarray(selector)
+        indices = np.flatnonzero(selector) if selector.dtype == bool else selector.astype(np.int64)
+        if len(indices) > budget:
+            indices = np.sort(indices[np.argsort(y_values[indices])[-budget:]])
+        anomaly_points[name] = {
+            'count': int(selector.sum()) if selector.dtype == bool else int(len(selector)),
+            'x': _round(x_values[indices], integer=True),
+            'y': _round(y_values[indices])
+        }
+
+    payload = {
+        'format': 'series',
+        'x_type': x_type,
+        'y_label': y_label,
+        'total_points': int(len(y_values)),
+        'x': _round(x_values[kept], integer=True),
+        'y': _round(y_values[kept]),
+        'thresholds': {name: float(value) for name, value in thresholds.items()},
+        'anomalies': anomaly_points
+    }
+    return json.dumps(payload, separators=(',', ':'))
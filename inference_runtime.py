@@ -0,0 +1,192 @@
+import os
+import abc
+import logging
+from typing import Dict, Any, Optional
+
+import numpy as np
+
+from windowing import reconstruction_errors
+
+logger = logging.getLogger(__name__)
+
+# keras: score with the saved Keras model (default)
+# tflite: export Keras autoencoders to TensorFlow Lite and score with its interpreter
+# onnx: export Keras autoencoders to ONNX and score with onnxruntime
+INFERENCE_RUNTIMES = ('keras', 'tflite', 'onnx')
+
+INFERENCE_RUNTIME = os.environ.get('SHIELD_INFERENCE_RUNTIME', 'keras')
+
+EXPORT_FILES = {'tflite': 'model.tflite', 'onnx': 'model.onnx'}
+
+# Windows per interpreter call; every call uses this shape, so buffers are allocated once
+INFERENCE_BATCH_SIZE = int(os.environ.get('SHIELD_INFERENCE_BATCH_SIZE', '4096'))
+
+# Interpreter threads; defaults to every CPU of the host
+INFERENCE_THREADS = int(os.environ.get('SHIELD_INFERENCE_THREADS', str(os.cpu_count() or 1)))
+
+# Exports whose reconstruction errors differ from Keras by more than this (relative) are discarded
+PARITY_TOLERANCE = float(os.environ.get('SHIELD_INFERENCE_PARITY_TOLERANCE', '1e-3'))
+
+# Training windows compared between Keras and the export
+PARITY_SAMPLE_WINDOWS = 2048
+
+
+def resolve_runtime(runtime: Optional[str] = None) -> str:
+    runtime = runtime or INFERENCE_RUNTIME
+    if runtime not in INFERENCE_RUNTIMES:
+        raise ValueError(f"Unknown inference runtime '{runtime}', expected one of {', '.join(INFERENCE_RUNTIMES)}")
+    return runtime
+
+
+class _FixedBatchModel(abc.ABC):
+    """Runs an exported autoencoder on fixed-size batches, padding the last one."""
+
+    def __init__(self, batch_size: int = INFERENCE_BATCH_SIZE):
+        # reconstruction_errors() feeds batches of this size
+        self.predict_batch_size = batch_size
+
+    @abc.abstractmethod
+    def _run(self, batch: np.ndarray) -> np.ndarray:
+        """Reconstruction of exactly one batch of predict_batch_size windows."""
+
+    def predict_on_batch(self, batch: np.ndarray) -> np.ndarray:
+        batch = np.ascontiguousarray(batch, dtype=np.float32)
+        outputs = np.empty_like(batch)
+        size = self.predict_batch_size
+        for start in range(0, len(batch), size):
+            chunk = batch[start:start + size]
+            if len(chunk) < size:
+                padded = np.zeros((size,) + batch.shape[1:], dtype=np.float32)
+                padded[:len(chunk)] = chunk
+                outputs[start:start + len(chunk)] = self._run(padded)[:len(chunk)]
+            else:
+                outputs[start:start + size] = self._run(chunk)
+        return outputs
+
+
+class TFLiteModel(_FixedBatchModel):
+    """TensorFlow Lite interpreter over an exported autoencoder."""
+
+    runtime = 'tflite'
+
+    def __init__(self, path: str, batch_size: int = INFERENCE_BATCH_SIZE, threads: int = INFERENCE_THREADS):
+        super().__init__(batch_size)
+        try:
+            # The standalone runtime avoids loading TensorFlow in scoring workers
+            from tflite_runtime.interpreter import Interpreter  # type: ignore
+        except ImportError:
+            from tensorflow.lite import Interpreter  # type: ignore
+        self.interpreter = Interpreter(model_path=path, num_threads=threads)
+        input_detail = self.interpreter.get_input_details()[0]
+        self.interpreter.resize_tensor_input(input_detail['index'], [batch_size] + list(input_detail['shape'][1:]))
+        self.interpreter.allocate_tensors()
+        self.input_index = input_detail['index']
+        self.output_index = self.interpreter.get_output_details()[0]['index']
+
+    def _run(self, batch: np.ndarray) -> np.ndarray:
+        self.interpreter.set_tensor(self.input_index, batch)
+        self.interpreter.invoke()
+        return self.interpreter.get_tensor(self.output_index)
+
+
+class ONNXModel(_FixedBatchModel):
+    """onnxruntime session over an exported autoencoder."""
+
+    runtime = 'onnx'
+
+    def __init__(self, path: str, batch_size: int = INFERENCE_BATCH_SIZE, threads: int = INFERENCE_THREADS):
+        super().__init__(batch_size)
+        import onnxruntime  # type: ignore
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = threads
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = onnxruntime.InferenceSession(path, options, providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def _run(self, batch: np.ndarray) -> np.ndarray:
+        return self.session.run(None, {self.input_name: batch})[0]
+
+
+RUNTIME_MODELS = {'tflite': TFLiteModel, 'onnx': ONNXModel}
+
+
+def _export_tflite(model, path: str):
+    import tensorflow as tf  # type: ignore
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    try:
+        tflite_model = converter.convert()
+    except Exception as e:
+        # LSTMs the converter cannot fuse run through the TensorFlow op fallback
+        logger.info(f"Builtin-only TFLite conversion failed, allowing TensorFlow ops: {str(e)}")
+        converter = tf.lite.TFLiteConverter.from_keras_model(model)
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS, tf.lite.OpsSet.SELECT_TF_OPS]
+        converter._experimental_lower_tensor_list_ops = False
+        tflite_model = converter.convert()
+    with open(path, 'wb') as f:
+        f.write(tflite_model)
+
+
+def _export_onnx(model, path: str):
+    import tensorflow as tf  # type: ignore
+    import tf2onnx  # type: ignore
+    signature = [tf.TensorSpec((None,) + tuple(model.input_shape[1:]), tf.float32, name='windows')]
+    tf2onnx.convert.from_keras(model, input_signature=signature, opset=13, output_path=path)
+
+
+EXPORTERS = {'tflite': _export_tflite, 'onnx': _export_onnx}
+
+
+def parity_check(reference, exported, windows: np.ndarray, tolerance: float = PARITY_TOLERANCE) -> Dict[str, Any]:
+    """Compare the reconstruction errors of two models on the same windows."""
+    expected = reconstruction_errors(reference, windows)
+    actual = reconstruction_errors(exported, windows)
+    max_abs_error = float(np.max(np.abs(actual - expected))) if len(windows) else 0.0
+    scale = float(np.max(np.abs(expected))) if len(windows) else 0.0
+    max_rel_error = max_abs_error / scale if scale > 0 else max_abs_error
+    return {
+        'windows': int(len(windows)),
+        'max_abs_error': max_abs_error,
+        'max_rel_error': max_rel_error,
+        'tolerance': tolerance,
+        'passed': bool(max_rel_error <= tolerance)
+    }
+
+
+def export_model(model, directory: str, sample: np.ndarray, runtime: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """Export a Keras autoencoder next to its saved copy and check it against Keras.
+
+    Returns the export's metadata, or None when the runtime is keras or the export fails
+    or misses the parity tolerance, in which case scoring keeps using Keras.
+    """
+    runtime = resolve_runtime(runtime)
+    if runtime == 'keras':
+        return None
+    path = os.path.join(directory, EXPORT_FILES[runtime])
+    try:
+        EXPORTERS[runtime](model, path)
+        step = max(len(sample) // PARITY_SAMPLE_WINDOWS, 1)
+        parity = parity_check(model, RUNTIME_MODELS[runtime](path), sample[::step][:PARITY_SAMPLE_WINDOWS])
+    except Exception as e:
+        logger.warning(f"{runtime} export failed, scoring will use Keras: {str(e)}")
+        if os.path.exists(path):
+            os.remove(path)
+        return None
+    if not parity['passed']:
+        logger.warning(f"{runtime} export differs from Keras by {parity['max_rel_error']:.2e} "
+                       f"(tolerance {parity['tolerance']:.0e}), scoring will use Keras")
+        os.remove(path)
+        return None
+    logger.info(f"Exported {runtime} model, max relative error {parity['max_rel_error']:.2e}")
+    return {'runtime': runtime, 'file': EXPORT_FILES[runtime], 'parity': parity}
+
+
+def load_exported(directory: str, export: Optional[Dict[str, Any]], runtime: Optional[str] = None):
+    """Load a model's export for the configured runtime, or None to fall back to Keras."""
+    runtime = resolve_runtime(runtime)
+    if runtime == 'keras' or not export or export.get('runtime') != runtime:
+        return None
+    try:
+        return RUNTIME_MODELS[runtime](os.path.join(directory, export['file']))
+    except Exception as e:
+        logger.warning(f"Could not load the {runtime} export, falling back to Keras: {str(e)}")
+        return None
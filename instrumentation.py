@@ -0,0 +1,184 @@
+import os
+import re
+import sys
+import json
+import time
+import logging
+import functools
+import contextlib
+import contextvars
+from datetime import datetime
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+# Append one JSON line per analysis to this file when set
+METRICS_JSONL = os.environ.get('SHIELD_METRICS_JSONL')
+
+# Write Prometheus textfile-collector files (one per log type) into this directory when set
+METRICS_TEXTFILE_DIR = os.environ.get('SHIELD_METRICS_TEXTFILE_DIR')
+
+_active: contextvars.ContextVar = contextvars.ContextVar('shield_timings', default=None)
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def peak_rss_bytes() -> Optional[int]:
+    """Peak resident set size of this process so far, or None when it cannot be read."""
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+        return peak if sys.platform == 'darwin' else peak * 1024
+    try:
+        import psutil
+        memory = psutil.Process().memory_info()
+        return getattr(memory, 'peak_wset', memory.rss)
+    except Exception:
+        return None
+
+
+class Timings:
+    """Wall time, CPU time and peak RSS of the named stages of one analysis.
+
+    Stages opened inside another stage are recorded as 'outer/inner', so the top-level
+    stages add up to the instrumented total. A stage entered several times accumulates.
+    """
+
+    def __init__(self, name: Optional[str] = None):
+        self.name = name
+        self.stages: Dict[str, Dict[str, Any]] = {}
+        self._stack = []
+        self._started = time.perf_counter()
+        self._started_cpu = time.process_time()
+
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        self._stack.append(name)
+        key = '/'.join(self._stack)
+        rss_before = peak_rss_bytes()
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+            rss_after = peak_rss_bytes()
+            self._stack.pop()
+            entry = self.stages.setdefault(key, {'calls': 0, 'wall_s': 0.0, 'cpu_s': 0.0,
+                                                 'peak_rss_mb': None, 'rss_growth_mb': 0.0})
+            entry['calls'] += 1
+            entry['wall_s'] += wall
+            entry['cpu_s'] += cpu
+            if rss_after is not None:
+                entry['peak_rss_mb'] = rss_after / 1024 ** 2
+                entry['rss_growth_mb'] += (rss_after - rss_before) / 1024 ** 2
+
+    def as_dict(self) -> Dict[str, Any]:
+        rss = peak_rss_bytes()
+        return {
+            'total_wall_s': round(time.perf_counter() - self._started, 4),
+            'total_cpu_s': round(time.process_time() - self._started_cpu, 4),
+            'peak_rss_mb': round(rss / 1024 ** 2, 1) if rss is not None else None,
+            'stages': {
+                key: {
+                    'calls': entry['calls'],
+                    'wall_s': round(entry['wall_s'], 4),
+                    'cpu_s': round(entry['cpu_s'], 4),
+                    'peak_rss_mb': round(entry['peak_rss_mb'], 1) if entry['peak_rss_mb'] is not None else None,
+                    'rss_growth_mb': round(entry['rss_growth_mb'], 1)
+                }
+                for key, entry in self.stages.items()
+            }
+        }
+
+
+@contextlib.contextmanager
+def collect(name: Optional[str] = None):
+    """Record the stages of the enclosed code, joining the collector already active if there is one."""
+    timings = _active.get()
+    if timings is not None:
+        yield timings
+        return
+    timings = Timings(name)
+    token = _active.set(timings)
+    try:
+        yield timings
+    finally:
+        _active.reset(token)
+
+
+@contextlib.contextmanager
+def stage(name: str):
+    """Time a named stage of the active collector; does nothing when none is active."""
+    timings = _active.get()
+    if timings is None:
+        yield
+        return
+    with timings.stage(name):
+        yield
+
+
+def timed(name: str):
+    """Decorator recording every call of a function as a stage."""
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _prometheus_label(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def emit(timings: Timings, labels: Optional[Dict[str, Any]] = None):
+    """Write the timings of a finished analysis to the configured metrics sinks."""
+    if not METRICS_JSONL and not METRICS_TEXTFILE_DIR:
+        return
+    report = timings.as_dict()
+    labels = {'log_type': timings.name, **(labels or {})}
+    try:
+        if METRICS_JSONL:
+            line = json.dumps({'time': datetime.now().isoformat(timespec='seconds'), **labels, **report},
+                              default=str)
+            os.makedirs(os.path.dirname(os.path.abspath(METRICS_JSONL)), exist_ok=True)
+            # A single write of a short line keeps concurrent appends from interleaving
+            with open(METRICS_JSONL, 'a') as f:
+                f.write(line + '\n')
+
+        if METRICS_TEXTFILE_DIR:
+            base = ','.join(f'{key}="{_prometheus_label(value)}"' for key, value in labels.items())
+            lines = [
+                '# HELP shield_analysis_stage_seconds Duration of each analysis stage in the last run.',
+                '# TYPE shield_analysis_stage_seconds gauge'
+            ]
+            for key, entry in report['stages'].items():
+                for kind in ('wall', 'cpu'):
+                    lines.append(f'shield_analysis_stage_seconds{{{base},stage="{_prometheus_label(key)}",'
+                                 f'kind="{kind}"}} {entry[f"{kind}_s"]}')
+            lines += [
+                '# HELP shield_analysis_seconds Total duration of the last run.',
+                '# TYPE shield_analysis_seconds gauge',
+                f'shield_analysis_seconds{{{base},kind="wall"}} {report["total_wall_s"]}',
+                f'shield_analysis_seconds{{{base},kind="cpu"}} {report["total_cpu_s"]}'
+            ]
+            if report['peak_rss_mb'] is not None:
+                lines += [
+                    '# HELP shield_analysis_peak_rss_bytes Peak resident memory of the process after the last run.',
+                    '# TYPE shield_analysis_peak_rss_bytes gauge',
+                    f'shield_analysis_peak_rss_bytes{{{base}}} {int(report["peak_rss_mb"] * 1024 ** 2)}'
+                ]
+            slug = re.sub(r'[^A-Za-z0-9]+', '_', str(timings.name or 'analysis')).strip('_').lower()
+            os.makedirs(METRICS_TEXTFILE_DIR, exist_ok=True)
+            path = os.path.join(METRICS_TEXTFILE_DIR, f'shield_{slug}.prom')
+            # The collector must never read a half-written file
+            staging_path = f"{path}.{os.getpid()}.tmp"
+            with open(staging_path, 'w') as f:
+                f.write('\n'.join(lines) + '\n')
+            os.replace(staging_path, path)
+    except OSError as e:
+        logger.warning(f"Failed to write analysis metrics: {str(e)}")
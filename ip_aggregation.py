@@ -0,0 +1,147 @@
+import os
+import logging
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from distinct_sketch import HLL_REGISTERS, hll_estimate, hll_registers
+
+logger = logging.getLogger(__name__)
+
+# Source IPs reported per analysis, most frequent first
+TOP_K = int(os.environ.get('SHIELD_TOP_IPS', '100'))
+
+# Above this many distinct IPs the counts come from a Space-Saving summary instead of exact groups
+EXACT_MAX_DISTINCT = int(os.environ.get('SHIELD_TOP_IPS_EXACT_DISTINCT', '1000000'))
+
+# Rows folded into the Space-Saving summary at a time
+CHUNK_ROWS = 1_000_000
+
+
+def _aggregate(codes: np.ndarray, timestamps: Optional[np.ndarray], ranks: Optional[np.ndarray]) -> pd.DataFrame:
+    """Exact count, first/last seen and highest severity rank per IP code."""
+    frame = pd.DataFrame({'code': codes})
+    aggregations = {'count': ('code', 'size')}
+    if timestamps is not None:
+        frame['timestamp'] = timestamps
+        aggregations.update(first_seen=('timestamp', 'min'), last_seen=('timestamp', 'max'))
+    if ranks is not None:
+        frame['rank'] = ranks
+        aggregations['rank'] = ('rank', 'max')
+    summary = frame.groupby('code', sort=False).agg(**aggregations)
+    summary['error'] = 0
+    return summary
+
+
+class SpaceSaving:
+    """Mergeable Space-Saving summary of the most frequent IPs.
+
+    At most `capacity` IPs are kept. Once IPs have been dropped, an IP missing from
+    the summary is credited with its smallest count when an exact chunk aggregate is
+    merged in, so counts are upper bounds that exceed the true count by at most `error`,
+    itself at most rows / capacity.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.summary: Optional[pd.DataFrame] = None
+        # Whether IPs have been dropped; until then the summary is exact
+        self.truncated = False
+
+    def _keep(self, summary: pd.DataFrame):
+        self.truncated = self.truncated or len(summary) > self.capacity
+        self.summary = summary.nlargest(self.capacity, 'count')
+
+    def merge(self, other: pd.DataFrame) -> 'SpaceSaving':
+        """Fold in the exact aggregate of a chunk of rows."""
+        if self.summary is None:
+            self._keep(other)
+            return self
+        index = self.summary.index.union(other.index)
+        mine, theirs = self.summary.reindex(index), other.reindex(index)
+        # Chunk aggregates are exact, so only IPs dropped from the summary need a floor
+        floor = int(self.summary['count'].min()) if self.truncated else 0
+        merged = pd.DataFrame({
+            'count': mine['count'].fillna(floor) + theirs['count'].fillna(0),
+            'error': mine['error'].fillna(floor) + theirs['error'].fillna(0)
+        }, index=index)
+        for column, combine in (('first_seen', np.fmin), ('last_seen', np.fmax), ('rank', np.fmax)):
+            if column in mine:
+                merged[column] = combine(mine[column], theirs[column])
+        self._keep(merged)
+        return self
+
+
+def _chunk_aggregates(ips: pd.Series, timestamps: Optional[np.ndarray], ranks: Optional[np.ndarray]):
+    """Exact aggregate of every CHUNK_ROWS rows, indexed by IP string."""
+    categorical = isinstance(ips.dtype, pd.CategoricalDtype)
+    # Categorical columns from the log schemas are already factorized
+    all_codes = ips.cat.codes.to_numpy() if categorical else None
+    for start in range(0, len(ips), CHUNK_ROWS):
+        chunk = slice(start, start + CHUNK_ROWS)
+        if categorical:
+            codes, uniques = all_codes[chunk], ips.cat.categories
+        else:
+            codes, uniques = pd.factorize(ips.iloc[chunk].astype(str))
+        summary = _aggregate(codes, timestamps[chunk] if timestamps is not None else None,
+                             ranks[chunk] if ranks is not None else None)
+        summary = summary[summary.index >= 0]
+        summary.index = pd.Index(uniques.take(summary.index.to_numpy()).astype(str))
+        yield summary
+
+
+def top_source_ips(ips, timestamps=None, severities=None, severity_order: Optional[Sequence[str]] = None,
+                   k: int = TOP_K) -> Dict[str, Any]:
+    """Distinct source IPs of anomalous rows with counts, first/last seen and highest severity.
+
+    Returns the `k` most frequent IPs, most frequent first, the number of distinct IPs and
+    whether the counts are approximate. Rows are aggregated CHUNK_ROWS at a time; once more
+    than EXACT_MAX_DISTINCT IPs have been seen the running aggregate shrinks to a Space-Saving
+    summary (counts become upper bounds) and the distinct count to a HyperLogLog estimate, so
+    memory stays bounded however many IPs there are. `severity_order` lists the severities
+    from lowest to highest.
+    """
+    ips = pd.Series(ips)
+    timestamps = pd.to_datetime(pd.Series(timestamps)).to_numpy() if timestamps is not None else None
+    ranks = None
+    if severities is not None:
+        ranks = pd.Categorical(pd.Series(severities), categories=list(severity_order), ordered=True).codes
+
+    sketch = SpaceSaving(EXACT_MAX_DISTINCT)
+    registers = np.zeros(HLL_REGISTERS, dtype=np.uint8)
+    approximate = False
+    for chunk in _chunk_aggregates(ips, timestamps, ranks):
+        np.maximum(registers, hll_registers(chunk.index.to_numpy(), np.zeros(len(chunk), dtype=np.int64), 1)[0],
+                   out=registers)
+        sketch.merge(chunk)
+        if sketch.truncated and not approximate:
+            approximate = True
+            logger.info(f"More than {EXACT_MAX_DISTINCT} distinct source IPs, counting the top {k} "
+                        f"with a Space-Saving summary")
+            shrunk = SpaceSaving(max(k * 10, 1000))
+            shrunk.truncated = True
+            sketch = shrunk.merge(sketch.summary)
+
+    summary = sketch.summary if sketch.summary is not None else _aggregate(np.empty(0, dtype=np.int64), None, None)
+    distinct = int(hll_estimate(registers)[0]) if approximate else len(summary)
+    summary = summary.sort_values(['count'] + (['rank'] if ranks is not None else []),
+                                  ascending=False, kind='stable').head(k)
+
+    entries: List[Dict[str, Any]] = []
+    for ip, row in summary.iterrows():
+        entry = {'ip': str(ip), 'count': int(row['count'])}
+        if approximate:
+            entry['count_error'] = int(row['error'])
+        if timestamps is not None:
+            entry['first_seen'] = pd.Timestamp(row['first_seen']).isoformat() if pd.notna(row['first_seen']) else None
+            entry['last_seen'] = pd.Timestamp(row['last_seen']).isoformat() if pd.notna(row['last_seen']) else None
+        if ranks is not None:
+            entry['max_severity'] = severity_order[int(row['rank'])] if row['rank'] >= 0 else None
+        entries.append(entry)
+    return {'ips': entries, 'distinct': distinct, 'approximate': approximate}
+
+
+def source_ip_string(top_ips: Dict[str, Any], separator: str = "\n,") -> str:
+    """The legacy sourceIp field: the reported IPs, each once, joined like the analyzers used to."""
+    return separator.join(entry['ip'] for entry in top_ips['ips'])
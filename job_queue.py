@@ -0,0 +1,203 @@
+import os
+import sys
+import json
+import socket
+import sqlite3
+import logging
+import argparse
+from datetime import datetime, timedelta
+from typing import Dict, Any, Optional
+
+import db
+
+logger = logging.getLogger(__name__)
+
+# mysql (default) or sqlite as a local stand-in
+QUEUE_BACKEND = os.environ.get('SHIELD_QUEUE_BACKEND', 'mysql')
+
+QUEUE_SQLITE_PATH = os.environ.get(
+    'SHIELD_QUEUE_DB',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'analysis_jobs.sqlite3')
+)
+
+JOB_STATUSES = ('queued', 'running', 'done', 'failed')
+
+JOB_COLUMNS = ('JobID', 'LogID', 'LogType', 'Status', 'Options', 'Attempts', 'Worker',
+               'AnalysisID', 'Result', 'Error', 'CreatedAt', 'StartedAt', 'FinishedAt')
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS analysis_jobs (
+    JobID INTEGER PRIMARY KEY AUTOINCREMENT,
+    LogID INTEGER,
+    LogType VARCHAR(50) NOT NULL,
+    Status VARCHAR(10) NOT NULL DEFAULT 'queued',
+    Options TEXT,
+    Attempts INTEGER NOT NULL DEFAULT 0,
+    Worker VARCHAR(100),
+    AnalysisID INTEGER,
+    Result TEXT,
+    Error TEXT,
+    CreatedAt TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    StartedAt TIMESTAMP,
+    FinishedAt TIMESTAMP
+)
+"""
+
+
+def _now() -> str:
+    return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+
+def worker_name() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class JobQueue:
+    """Analysis jobs in the analysis_jobs table, claimed by workers with row locks."""
+
+    def __init__(self, backend: str = QUEUE_BACKEND, sqlite_path: str = QUEUE_SQLITE_PATH):
+        if backend not in ('mysql', 'sqlite'):
+            raise ValueError(f"Unknown queue backend '{backend}', expected mysql or sqlite")
+        self.backend = backend
+        self.sqlite_path = sqlite_path
+        # Parameter placeholder of the DB-API driver in use
+        self.param = '?' if backend == 'sqlite' else '%s'
+        if backend == 'sqlite':
+            with self._connect() as connection:
+                connection.execute(SQLITE_SCHEMA)
+
+    def _connect(self):
+        if self.backend == 'sqlite':
+            # Autocommit mode; claims open their own IMMEDIATE transaction
+            return db.SQLiteConnection(sqlite3.connect(self.sqlite_path, timeout=30, isolation_level=None))
+        return db.MySQLConnection(db.connect())
+
+    def enqueue(self, log_type: str, log_id: Optional[int] = None,
+                options: Optional[Dict[str, Any]] = None) -> int:
+        """Queue an analysis job and return its id."""
+        with self._connect() as connection:
+            cursor = connection.execute(
+                f"INSERT INTO analysis_jobs (LogID, LogType, Status, Options) "
+                f"VALUES ({self.param}, {self.param}, 'queued', {self.param})",
+                (log_id, log_type, json.dumps(options or {}))
+            )
+            job_id = cursor.lastrowid
+        logger.info(f"Queued job {job_id} for {log_type} upload {log_id}")
+        return job_id
+
+    def status(self, job_id: int) -> Optional[Dict[str, Any]]:
+        """Return a job row, with its options and result decoded, or None if it does not exist."""
+        with self._connect() as connection:
+            row = connection.execute(
+                f"SELECT {', '.join(JOB_COLUMNS)} FROM analysis_jobs WHERE JobID = {self.param}",
+                (job_id,)
+            ).fetchone()
+        return _decode_job(row) if row else None
+
+    def claim(self, worker: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Atomically move the oldest queued job to 'running' and return it."""
+        worker = worker or worker_name()
+        with self._connect() as connection:
+            connection.begin()
+            try:
+                lock = " FOR UPDATE SKIP LOCKED" if self.backend == 'mysql' else ""
+                row = connection.execute(
+                    f"SELECT {', '.join(JOB_COLUMNS)} FROM analysis_jobs "
+                    f"WHERE Status = 'queued' ORDER BY JobID LIMIT 1{lock}"
+                ).fetchone()
+                if row is None:
+                    connection.commit()
+                    return None
+                connection.execute(
+                    f"UPDATE analysis_jobs SET Status = 'running', Worker = {self.param}, "
+                    f"Attempts = Attempts + 1, StartedAt = {self.param} WHERE JobID = {self.param}",
+                    (worker, _now(), row[0])
+                )
+                connection.commit()
+            except Exception:
+                connection.rollback()
+                raise
+        job = _decode_job(row)
+        job.update({'Status': 'running', 'Worker': worker, 'Attempts': job['Attempts'] + 1})
+        return job
+
+    def complete(self, job_id: int, result: Dict[str, Any], analysis_id: Optional[int] = None):
+        self._finish(job_id, 'done', result=json.dumps(result), analysis_id=analysis_id)
+
+    def fail(self, job_id: int, error: str):
+        self._finish(job_id, 'failed', error=error)
+
+    def _finish(self, job_id: int, status: str, result: Optional[str] = None,
+                analysis_id: Optional[int] = None, error: Optional[str] = None):
+        with self._connect() as connection:
+            connection.execute(
+                f"UPDATE analysis_jobs SET Status = {self.param}, Result = {self.param}, "
+                f"AnalysisID = {self.param}, Error = {self.param}, FinishedAt = {self.param} "
+                f"WHERE JobID = {self.param}",
+                (status, result, analysis_id, error, _now(), job_id)
+            )
+        logger.info(f"Job {job_id} {status}")
+
+    def requeue_stale(self, max_age_seconds: int) -> int:
+        """Return jobs stuck in 'running' longer than max_age_seconds (e.g. a killed worker) to the queue."""
+        cutoff = (datetime.now() - timedelta(seconds=max_age_seconds)).strftime('%Y-%m-%d %H:%M:%S')
+        with self._connect() as connection:
+            cursor = connection.execute(
+                f"UPDATE analysis_jobs SET Status = 'queued', Worker = NULL "
+                f"WHERE Status = 'running' AND StartedAt < {self.param}",
+                (cutoff,)
+            )
+            requeued = cursor.rowcount
+        if requeued:
+            logger.warning(f"Requeued {requeued} stale running jobs")
+        return requeued
+
+
+def _decode_job(row) -> Dict[str, Any]:
+    job = dict(zip(JOB_COLUMNS, row))
+    for key in ('Options', 'Result'):
+        if job[key]:
+            job[key] = json.loads(job[key])
+    for key in ('CreatedAt', 'StartedAt', 'FinishedAt'):
+        if isinstance(job[key], datetime):
+            job[key] = job[key].isoformat(timespec='seconds')
+    return job
+
+
+def main(argv=None) -> int:
+    """Lightweight enqueue/status entry point that does not load any analyzer"""
+    parser = argparse.ArgumentParser(prog='job_queue.py', description='Queue analysis jobs and poll their status')
+    subparsers = parser.add_subparsers(dest='action', required=True)
+    enqueue = subparsers.add_parser('enqueue', help='Queue an upload for analysis')
+    enqueue.add_argument('log_type')
+    enqueue.add_argument('log_id', type=int)
+    enqueue.add_argument('--mode', help='Model mode passed to the analyzer')
+    enqueue.add_argument('--graph-format', help='Graph format passed to the analyzer')
+    enqueue.add_argument('--engine', help='Detector engine passed to the analyzer')
+    status = subparsers.add_parser('status', help='Show the state of a job')
+    status.add_argument('job_id', type=int)
+    args = parser.parse_args(argv)
+
+    try:
+        queue = JobQueue()
+        if args.action == 'enqueue':
+            options = {'mode': args.mode, 'graph_format': args.graph_format, 'engine': args.engine}
+            options = {name: value for name, value in options.items() if value is not None}
+            job_id = queue.enqueue(args.log_type.strip('"\''), args.log_id, options)
+            print(json.dumps({"success": True, "job_id": job_id, "status": "queued"}))
+            return 0
+
+        job = queue.status(args.job_id)
+        if job is None:
+            print(json.dumps({"success": False, "error": f"No job found with ID: {args.job_id}"}))
+            return 1
+        print(json.dumps({"success": True, "job": job}, default=str))
+        return 0
+    except Exception as e:
+        logger.error(f"Job queue command failed: {str(e)}")
+        print(json.dumps({"success": False, "error": str(e)}))
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,53 @@
+// Draws a downsampled series payload (graph_format 'series') with its thresholds and anomalies
+function renderSeriesToCanvas(canvas, series) {
+    const container = canvas.parentElement;
+    canvas.width = container.offsetWidth - 40;
+    canvas.height = Math.round(canvas.width / 2);
+
+    const ctx = canvas.getContext('2d');
+    const pad = 40;
+    const points = series.x.map((x, i) => [x, series.y[i]]).filter(p => p[0] !== null && p[1] !== null);
+    const thresholds = Object.values(series.thresholds);
+    const xs = points.map(p => p[0]);
+    const ys = points.map(p => p[1]).concat(thresholds);
+    const xMin = Math.min(...xs), xMax = Math.max(...xs);
+    const yMin = Math.min(...ys), yMax = Math.max(...ys);
+    const sx = x => pad + (x - xMin) / ((xMax - xMin) || 1) * (canvas.width - 2 * pad);
+    const sy = y => canvas.height - pad - (y - yMin) / ((yMax - yMin) || 1) * (canvas.height - 2 * pad);
+
+    ctx.clearRect(0, 0, canvas.width, canvas.height);
+    ctx.fillStyle = '#fff';
+    ctx.fillRect(0, 0, canvas.width, canvas.height);
+
+    ctx.strokeStyle = 'blue';
+    ctx.lineWidth = 1;
+    ctx.beginPath();
+    points.forEach(([x, y], i) => i ? ctx.lineTo(sx(x), sy(y)) : ctx.moveTo(sx(x), sy(y)));
+    ctx.stroke();
+
+    ctx.strokeStyle = 'red';
+    ctx.setLineDash([6, 4]);
+    thresholds.forEach(t => {
+        ctx.beginPath();
+        ctx.moveTo(pad, sy(t));
+        ctx.lineTo(canvas.width - pad, sy(t));
+        ctx.stroke();
+    });
+    ctx.setLineDash([]);
+
+    const colors = ['red', 'orange', 'purple'];
+    Object.values(series.anomalies).forEach((anomaly, i) => {
+        ctx.fillStyle = colors[i % colors.length];
+        anomaly.x.forEach((x, j) => {
+            if (x === null || anomaly.y[j] === null) return;
+            ctx.beginPath();
+            ctx.arc(sx(x), sy(anomaly.y[j]), 3, 0, 2 * Math.PI);
+            ctx.fill();
+        });
+    });
+
+    ctx.fillStyle = '#333';
+    ctx.font = '12px sans-serif';
+    ctx.fillText(series.y_label, pad, pad / 2);
+    ctx.fillText(`${series.total_points.toLocaleString()} points`, canvas.width - pad - 100, pad / 2);
+}
@@ -0,0 +1,159 @@
+import logging
+from typing import Any, Dict, NamedTuple, Optional
+
+import pandas as pd
+
+from instrumentation import timed
+
+logger = logging.getLogger(__name__)
+
+# Timestamp layout written by our log exporters; other layouts fall back to inference
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+class LogSchema(NamedTuple):
+    # Columns the analyzer uses with their compact dtypes; None reads every column as-is
+    columns: Optional[Dict[str, str]]
+    timestamp_column: Optional[str]
+    timestamp_format: str = TIMESTAMP_FORMAT
+    # errors= handling for timestamps that cannot be parsed ('raise' or 'coerce')
+    timestamp_errors: str = 'raise'
+    read_options: Dict[str, Any] = {}
+
+
+# Analyzer module and entry point for every supported log type
+ANALYZERS = {
+    "Network Traffic Logs": ("Network_security", "analyze_network_logs"),
+    "Firewall Logs": ("Firewall_analysis", "analyze_firewall_logs"),
+    "DNS Query Logs": ("DNS_analysis", "analyze_dns_logs"),
+    "Email Security Logs": ("Email_security", "analyse_email_logs"),
+    "Application Logs": ("Application_logs", "analyse_application_logs"),
+    "Endpoint Security Logs": ("Endpoint_security", "analyze_endpoint_logs")
+}
+
+# Log store name of the anomaly events recorded by the analyzers (see correlation.py)
+ANOMALY_EVENTS = "Anomaly Events"
+
+LOG_SCHEMAS = {
+    "Network Traffic Logs": LogSchema(
+        columns={
+            'timestamp': 'object',
+            'packet_size': 'float32',
+            'duration': 'float32',
+            'bytes_sent': 'float32',
+            'bytes_received': 'float32',
+            'source_ip': 'category'
+        },
+        timestamp_column='timestamp'
+    ),
+    "DNS Query Logs": LogSchema(
+        columns={
+            'Timestamp': 'object',
+            'Response Time (ms)': 'float32',
+            'Query Length': 'float32',
+            'TTL': 'float32',
+            'Source Port': 'float32',
+            'Client IP': 'category'
+        },
+        timestamp_column='Timestamp',
+        timestamp_errors='coerce'
+    ),
+    "Firewall Logs": LogSchema(
+        columns={
+            'Timestamp': 'object',
+            'Source_IP': 'category',
+            'Source_Port': 'float32',
+            'Destination_Port': 'float32',
+            'Protocol': 'category',
+            'Action': 'category',
+            'Bytes_Transferred': 'float32',
+            'Threat_Level': 'category'
+        },
+        timestamp_column='Timestamp'
+    ),
+    "Endpoint Security Logs": LogSchema(
+        columns={
+            'Timestamp': 'object',
+            'Source_IP': 'category',
+            'Severity': 'category',
+            'Event_Type': 'category',
+            'Action_Taken': 'category'
+        },
+        timestamp_column='Timestamp',
+        timestamp_errors='coerce'
+    ),
+    # Email and application analyzers derive their features from whatever columns
+    # the upload has, so every column is read with the default dtypes
+    "Email Security Logs": LogSchema(
+        columns=None,
+        timestamp_column=None
+    ),
+    "Application Logs": LogSchema(
+        columns=None,
+        timestamp_column=None,
+        read_options={'on_bad_lines': 'skip'}
+    ),
+    # Not an upload type: anomalous rows of every analyzer, kept per tenant for correlation
+    ANOMALY_EVENTS: LogSchema(
+        columns={
+            'timestamp': 'object',
+            'log_type': 'category',
+            'ip': 'category',
+            'severity': 'category'
+        },
+        timestamp_column='timestamp',
+        timestamp_errors='coerce'
+    )
+}
+
+
+def parse_timestamps(series: pd.Series, fmt: str = TIMESTAMP_FORMAT, errors: str = 'raise') -> pd.Series:
+    """Parse timestamps with a fixed format, inferring the format only when it does not match."""
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series
+    try:
+        return pd.to_datetime(series, format=fmt, errors='raise', cache=True)
+    except (ValueError, TypeError):
+        logger.info(f"Timestamps in '{series.name}' do not match {fmt}, inferring the format")
+        return pd.to_datetime(series, errors=errors)
+
+
+def read_csv_with_schema(source, schema: LogSchema) -> pd.DataFrame:
+    """Read only the schema's columns with compact dtypes, using pyarrow when it is installed."""
+    options = dict(schema.read_options)
+    if schema.columns is not None:
+        options['usecols'] = list(schema.columns)
+        options['dtype'] = {col: dtype for col, dtype in schema.columns.items() if dtype != 'object'}
+
+        # The pyarrow engine infers types on its own, so it is only used when every column is declared
+        try:
+            return pd.read_csv(source, engine='pyarrow', **options)
+        except (ImportError, ValueError) as e:
+            logger.info(f"pyarrow CSV engine unavailable, using the C engine: {str(e)}")
+            if hasattr(source, 'seek'):
+                source.seek(0)
+
+    return pd.read_csv(source, engine='c', **options)
+
+
+@timed('load')
+def read_log(source, log_type: str) -> pd.DataFrame:
+    """Load an uploaded log of the given type with its declared columns, dtypes and timestamp format.
+
+    `source` is a CSV path or file object, a Parquet file from the upload cache,
+    which is memory-mapped and already typed, or a DataFrame read from the log store,
+    which the analyzer may modify.
+    """
+    schema = LOG_SCHEMAS[log_type]
+    if isinstance(source, pd.DataFrame):
+        df = source
+    elif isinstance(source, str) and source.endswith('.parquet'):
+        columns = list(schema.columns) if schema.columns is not None else None
+        df = pd.read_parquet(source, engine='pyarrow', columns=columns, memory_map=True)
+    else:
+        df = read_csv_with_schema(source, schema)
+    if schema.timestamp_column is not None:
+        df[schema.timestamp_column] = parse_timestamps(
+            df[schema.timestamp_column], schema.timestamp_format, schema.timestamp_errors
+        )
+    return df
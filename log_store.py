@@ -0,0 +1,181 @@
+import os
+import re
+import json
+import logging
+from typing import Any, Dict, List, Optional
+
+import pandas as pd
+
+from log_schemas import LOG_SCHEMAS, read_log
+
+logger = logging.getLogger(__name__)
+
+# Ingest every analyzed upload into the log store (needs pyarrow)
+LOG_STORE_ENABLED = os.environ.get('SHIELD_LOG_STORE', '0') == '1'
+
+LOG_STORE_ROOT = os.environ.get(
+    'SHIELD_LOG_STORE_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'log_store')
+)
+
+INDEX_FILE = 'index.jsonl'
+
+
+def _slug(value: str) -> str:
+    return re.sub(r'[^A-Za-z0-9]+', '_', value).strip('_').lower()
+
+
+def _timestamp(value) -> Optional[pd.Timestamp]:
+    return pd.Timestamp(value) if value is not None else None
+
+
+class LogStore:
+    """Append-only Parquet store of uploaded logs, partitioned by tenant, log type and day.
+
+    Every upload adds one file to each day partition its rows fall in, named after the
+    upload's digest. Ingesting an upload twice is a no-op: uploads are recognized by their
+    UploadLogs ID when one is given (compaction changes the stored blob's digest) and by
+    digest otherwise. An index per tenant and log type
+    records the rows and min/max timestamp of every file, so a time range query only
+    opens the files that overlap it. Log types without a timestamp column are filed
+    under the day they were ingested.
+    """
+
+    def __init__(self, root: str = LOG_STORE_ROOT):
+        self.root = root
+
+    def _directory(self, tenant, log_type: str) -> str:
+        return os.path.join(self.root, str(tenant), _slug(log_type))
+
+    def index(self, tenant, log_type: str) -> List[Dict[str, Any]]:
+        """Index entries of one tenant's log type, in ingestion order."""
+        try:
+            with open(os.path.join(self._directory(tenant, log_type), INDEX_FILE)) as f:
+                return [json.loads(line) for line in f if line.strip()]
+        except FileNotFoundError:
+            return []
+
+    def append(self, tenant, log_type: str, df: pd.DataFrame, digest: str,
+               source_id: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Add the rows of one upload and return the index entries written for it."""
+        directory = self._directory(tenant, log_type)
+        if source_id is not None:
+            existing = [entry for entry in self.index(tenant, log_type) if entry['source_id'] == source_id]
+        else:
+            existing = [entry for entry in self.index(tenant, log_type) if entry['digest'] == digest]
+        if existing:
+            logger.info(f"Upload {source_id or digest} already in the {log_type} store of tenant {tenant}")
+            return existing
+
+        ingested_at = pd.Timestamp.now().floor('s')
+        timestamp_column = LOG_SCHEMAS[log_type].timestamp_column
+        if timestamp_column is not None:
+            timestamps = df[timestamp_column]
+            df = df[timestamps.notna()]
+            days = timestamps[timestamps.notna()].dt.floor('D')
+            if len(df) < len(timestamps):
+                logger.warning(f"Skipped {len(timestamps) - len(df)} rows without a timestamp")
+            groups = df.groupby(days.to_numpy(), sort=True)
+        else:
+            groups = [(ingested_at.floor('D'), df)]
+
+        entries = []
+        for day, rows in groups:
+            day = pd.Timestamp(day)
+            path = os.path.join(directory, f"day={day:%Y-%m-%d}", f"{digest[:16]}.parquet")
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            staging_path = f"{path}.{os.getpid()}.tmp"
+            try:
+                rows.to_parquet(staging_path, engine='pyarrow', compression='zstd', index=False)
+                os.replace(staging_path, path)
+            finally:
+                if os.path.exists(staging_path):
+                    os.remove(staging_path)
+            if timestamp_column is not None:
+                min_ts, max_ts = rows[timestamp_column].min(), rows[timestamp_column].max()
+            else:
+                min_ts = max_ts = ingested_at
+            entries.append({
+                'file': os.path.relpath(path, directory),
+                'day': f"{day:%Y-%m-%d}",
+                'rows': int(len(rows)),
+                'min_ts': min_ts.isoformat(),
+                'max_ts': max_ts.isoformat(),
+                'digest': digest,
+                'source_id': source_id,
+                'ingested_at': ingested_at.isoformat()
+            })
+
+        # Files are in place before the index names them; one append per upload
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, INDEX_FILE), 'a') as f:
+            f.write(''.join(json.dumps(entry) + '\n' for entry in entries))
+        logger.info(f"Stored {len(df)} {log_type} rows of tenant {tenant} in {len(entries)} day partitions")
+        return entries
+
+    def ingest(self, tenant, log_type: str, source, digest: str, source_id: Optional[int] = None):
+        """Parse an upload (CSV stream or cached Parquet path) and append it."""
+        return self.append(tenant, log_type, read_log(source, log_type), digest, source_id)
+
+    def partitions(self, tenant, log_type: str, start=None, end=None) -> List[Dict[str, Any]]:
+        """Index entries whose rows may fall between start and end (inclusive)."""
+        start, end = _timestamp(start), _timestamp(end)
+        return [
+            entry for entry in self.index(tenant, log_type)
+            if (start is None or pd.Timestamp(entry['max_ts']) >= start)
+            and (end is None or pd.Timestamp(entry['min_ts']) <= end)
+        ]
+
+    def latest(self, tenant, log_type: str) -> Optional[pd.Timestamp]:
+        """Newest timestamp stored for a tenant's log type."""
+        entries = self.index(tenant, log_type)
+        return max((pd.Timestamp(entry['max_ts']) for entry in entries), default=None)
+
+    def read(self, tenant, log_type: str, start=None, end=None) -> pd.DataFrame:
+        """Rows of a tenant's log type between start and end, oldest first, typed like read_log."""
+        schema = LOG_SCHEMAS[log_type]
+        entries = self.partitions(tenant, log_type, start, end)
+        if not entries:
+            raise Exception(f"No {log_type} stored for tenant {tenant} in the requested range")
+        directory = self._directory(tenant, log_type)
+        df = pd.concat([pd.read_parquet(os.path.join(directory, entry['file']), engine='pyarrow')
+                        for entry in entries], ignore_index=True)
+
+        if schema.timestamp_column is not None:
+            timestamps = df[schema.timestamp_column]
+            keep = pd.Series(True, index=df.index)
+            if start is not None:
+                keep &= timestamps >= _timestamp(start)
+            if end is not None:
+                keep &= timestamps <= _timestamp(end)
+            df = df[keep].sort_values(schema.timestamp_column, kind='stable').reset_index(drop=True)
+        if schema.columns is not None:
+            # Categories differ between files, so concatenation falls back to object columns
+            df = df.astype({column: dtype for column, dtype in schema.columns.items() if dtype == 'category'})
+        logger.info(f"Read {len(df)} {log_type} rows of tenant {tenant} from {len(entries)} partition files")
+        return df
+
+    def stats(self, tenant=None, log_type: Optional[str] = None) -> Dict[str, Any]:
+        if tenant is not None:
+            tenants = [str(tenant)]
+        elif os.path.isdir(self.root):
+            tenants = sorted(name for name in os.listdir(self.root) if os.path.isdir(os.path.join(self.root, name)))
+        else:
+            tenants = []
+        summary = []
+        for tenant_name in tenants:
+            for name in ([log_type] if log_type else LOG_SCHEMAS):
+                entries = self.index(tenant_name, name)
+                if not entries:
+                    continue
+                summary.append({
+                    'tenant': tenant_name,
+                    'log_type': name,
+                    'uploads': len({entry['digest'] for entry in entries}),
+                    'files': len(entries),
+                    'days': len({entry['day'] for entry in entries}),
+                    'rows': sum(entry['rows'] for entry in entries),
+                    'min_ts': min(entry['min_ts'] for entry in entries),
+                    'max_ts': max(entry['max_ts'] for entry in entries)
+                })
+        return {'root': self.root, 'stores': summary}
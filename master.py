@@ -3,8 +3,17 @@ import json
 import os
 import base64
 import logging
-from typing import Dict, Any
-import subprocess
+import argparse
+import contextlib
+import importlib
+import inspect
+import socket
+import socketserver
+import shutil
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, Any, Callable, Optional
 from datetime import datetime
 import mysql.connector
 from mysql.connector import Error
@@ -13,14 +22,23 @@ from mysql.connector import Error
 import base64
 from PIL import Image
 import io
+import pandas as pd
 
-# Add database configuration
-DB_CONFIG = {
-    'host': 'localhost',
-    'user': 'Shield_db',
-    'password': 'Shield_db',
-    'database': 'Shield_db'
-}
+import db
+from artifact_store import ARTIFACTS_ENABLED, ArtifactStore, graph_artifact_available, store_graph
+from blob_codecs import CODECS, COMPRESS_CHUNK_SIZE, UPLOAD_CODEC, UPLOAD_CODEC_LEVEL
+from correlation import (ANOMALY_EVENTS, CORRELATION_TOLERANCE_S, MIN_LOG_TYPES, anomaly_events,
+                         capture_anomalies, correlate, incidents_payload)
+from db import open_upload
+from graph_payload import resolve_graph_format
+from instrumentation import collect, emit, stage
+from job_queue import JobQueue
+from log_schemas import ANALYZERS, read_log
+from log_store import LOG_STORE_ENABLED, LogStore
+from model_registry import ModelRegistry, registry_key, resolve_engine, resolve_mode
+from result_cache import create_result_cache, result_key, source_version
+from rollup_tables import RESOLUTIONS, ROLLUPS_ENABLED, RollupTable
+from upload_cache import UploadCache, columnar_support, content_hash
 
 # Set up logging
 logging.basicConfig(
@@ -29,35 +47,69 @@ logging.basicConfig(
     format='%(asctime)s - %(levelname)s - %(message)s'
 )
 
+# Key trained models by the uploading user instead of sharing them per log type
+MODEL_PER_TENANT = os.environ.get('SHIELD_MODEL_PER_TENANT', '0') == '1'
+
+# Convert uploads to cached columnar files on first analysis (needs pyarrow)
+UPLOAD_CACHE_ENABLED = os.environ.get('SHIELD_UPLOAD_CACHE', '1') == '1'
+
+# Modules shared by the analyzers; editing them changes every analyzer's version
+ANALYZER_SHARED_MODULES = ("correlation", "detector_engines", "distinct_sketch", "graph_payload", "inference_runtime",
+                           "ip_aggregation", "log_schemas", "model_registry", "quantile_sketch", "windowing")
+
+# Log types whose analyzers take a detector engine option
+ENGINE_LOG_TYPES = ("Network Traffic Logs", "DNS Query Logs", "Application Logs")
+
 class LogAnalyzerMaster:
     def __init__(self):
         self.base_path = os.path.dirname(os.path.abspath(__file__))
-        self.temp_dir = os.path.join(os.path.dirname(self.base_path),"temp")
-        self.analysis_scripts = {
-            "Network Traffic Logs": "Network_security.py",
-            "Firewall Logs": "Firewall_analysis.py",
-            "DNS Query Logs": "DNS_analysis.py",
-            "Email Security Logs": "Email_security.py",
-            "Application Logs": "Application_logs.py",
-            "Endpoint Security Logs": "Endpoint_security.py"
-        }
+        self.analyzers = dict(ANALYZERS)
+        self._analyzer_functions: Dict[str, Callable[..., Dict[str, Any]]] = {}
+        self._analyzer_versions: Dict[str, str] = {}
+        self.upload_cache = UploadCache() if UPLOAD_CACHE_ENABLED and columnar_support() else None
+        self.result_cache = create_result_cache()
+        self.artifact_store = ArtifactStore() if ARTIFACTS_ENABLED else None
+        self.log_store = LogStore()
+        self.rollups = RollupTable() if ROLLUPS_ENABLED else None
+        # Anomalous rows of the last analysis run here, for the log store's correlation history
+        self.anomaly_events = None
         self._setup_environment()
 
     def _setup_environment(self):
         """Create necessary directories and validate environment"""
         try:
-            os.makedirs(self.temp_dir, exist_ok=True)
-            logging.info(f"Temporary directory confirmed: {self.temp_dir}")
-            
+            # Analyzer modules are imported from the directory of this script
+            if self.base_path not in sys.path:
+                sys.path.insert(0, self.base_path)
+
             # Validate all analysis scripts exist
-            for script_name in self.analysis_scripts.values():
-                script_path = os.path.join(self.base_path, script_name)
+            for module_name, _ in self.analyzers.values():
+                script_path = os.path.join(self.base_path, f"{module_name}.py")
                 if not os.path.exists(script_path):
                     logging.warning(f"Analysis script not found: {script_path}")
         except Exception as e:
             logging.error(f"Environment setup failed: {str(e)}")
             raise
 
+    def _load_analyzer(self, log_type: str) -> Callable[..., Dict[str, Any]]:
+        """Import the analyzer module for a log type once and return its entry point"""
+        if log_type not in self._analyzer_functions:
+            module_name, function_name = self.analyzers[log_type]
+            logging.info(f"Loading analyzer {module_name}.{function_name}")
+            module = importlib.import_module(module_name)
+            self._analyzer_functions[log_type] = getattr(module, function_name)
+        return self._analyzer_functions[log_type]
+
+    def preload(self):
+        """Import every analyzer up front so jobs only pay for the analysis itself"""
+        for log_type in self.analyzers:
+            try:
+                self._load_analyzer(log_type)
+            except Exception as e:
+                # Jobs for this log type will report the import error when they run
+                logging.error(f"Failed to preload analyzer for {log_type}: {str(e)}")
+        logging.info(f"Preloaded {len(self._analyzer_functions)} analyzers")
+
     # def _decode_base64(self, base64_data: str) -> bytes:
     #     """Decode base64 data with proper padding and validation"""
     #     try:
@@ -73,89 +125,149 @@ class LogAnalyzerMaster:
     #         logging.debug(f"First 100 chars of base64 data: {base64_data[:100]}")
     #         raise ValueError(f"Invalid base64 data: {str(e)}")
 
-    def _save_temp_file(self, file_data: str, log_type: str) -> str:
-        """Save base64 encoded file data to a temporary file"""
+    def analyzer_version(self, log_type: str) -> str:
+        """Fingerprint of the analyzer script and shared modules for a log type"""
+        if log_type not in self._analyzer_versions:
+            module_name, _ = self.analyzers[log_type]
+            paths = [os.path.join(self.base_path, f"{name}.py")
+                     for name in (module_name,) + ANALYZER_SHARED_MODULES]
+            self._analyzer_versions[log_type] = source_version(paths)
+        return self._analyzer_versions[log_type]
+
+    def _result_cache_key(self, log_type: str, digest: str, options: Dict[str, Any]):
+        """Result cache key for an upload, or None when the key cannot be computed"""
         try:
-            # Generate unique filename
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            temp_filename = f"temp_{log_type.replace(' ', '_')}_{timestamp}.csv"
-            temp_file_path = os.path.join(self.temp_dir, temp_filename)
-            
-            logging.info(f"Saving temporary file: {temp_file_path}")
-            
-            # # Decode base64 data
-            # try:
-            #     decoded_data = self._decode_base64(file_data)
-            #     logging.info("Successfully decoded base64 data")
-            # except ValueError as e:
-            #     logging.error(f"Base64 decoding failed: {str(e)}")
-            #     raise
-                
-            # Write decoded data to temporary file
-            # with open(temp_file_path, 'wb') as f:
-            #     f.write(decoded_data)
-
-            with open(temp_file_path, 'wb') as f:
-                f.write(file_data)
-            
-            logging.info(f"Successfully saved temporary file: {temp_file_path}")
-            return temp_file_path
-            
+            params = dict(options)
+            params["mode"] = resolve_mode(options.get("mode"))
+            params["graph_format"] = resolve_graph_format(options.get("graph_format"))
+            if self.artifact_store is not None:
+                # Results holding an artifact reference are not interchangeable with inline ones
+                params["graph_artifacts"] = True
+            model_key = log_type
+            if log_type in ENGINE_LOG_TYPES:
+                params["engine"] = resolve_engine(log_type, options.get("engine"))
+                model_key = registry_key(log_type, params["engine"])
+            if params["mode"] != "train":
+                # Scoring results depend on which registered model version is picked up
+                registry = ModelRegistry()
+                params["model_versions"] = [registry.latest_version(model_key, options.get("tenant")),
+                                            registry.latest_version(model_key)]
+            return result_key(digest, log_type, self.analyzer_version(log_type), params)
         except Exception as e:
-            logging.error(f"Failed to save temporary file: {str(e)}")
-            raise
+            logging.warning(f"Result cache disabled for this job: {str(e)}")
+            return None
 
-    def analyze_logs(self, log_type: str, file_data: str) -> Dict[str, Any]:
-        """Execute log analysis for the specified log type"""
-        if log_type not in self.analysis_scripts:
-            error_msg = f"Unsupported log type: {log_type}"
-            logging.error(error_msg)
-            return {"success": False, "error": error_msg}
+    def _unsupported(self, log_type: str) -> Dict[str, Any]:
+        error_msg = f"Unsupported log type: {log_type}"
+        logging.error(error_msg)
+        return {"success": False, "error": error_msg}
+
+    def analyze_logs(self, log_type: str, file_data, digest: Optional[str] = None, **options) -> Dict[str, Any]:
+        """Execute log analysis for the specified log type, reusing cached results for identical uploads
 
-        temp_file = None
+        `file_data` is the upload's bytes or a seekable binary stream such as an UploadBlob,
+        in which case `digest` must be its SHA-256.
+        """
+        if log_type not in self.analyzers:
+            return self._unsupported(log_type)
+
+        self.anomaly_events = None
+        with collect(log_type):
+            digest = digest or content_hash(file_data)
+            cache_key = None
+            if self.result_cache is not None:
+                with stage('result_cache'):
+                    cache_key = self._result_cache_key(log_type, digest, options)
+                    cached_results = self.result_cache.get(cache_key) if cache_key else None
+                if cached_results is not None and self.artifact_store is not None and \
+                        not graph_artifact_available(cached_results, self.artifact_store):
+                    # The graph was garbage collected, so analyze again to render it
+                    cached_results = None
+                if cached_results is not None:
+                    return {
+                        "success": True,
+                        "log_type": log_type,
+                        "results": cached_results,
+                        "cached": True
+                    }
+
+            results = self._analyze_upload(log_type, file_data, digest, **options)
+            if cache_key and results["success"]:
+                # Timings describe this run only, not later cache hits
+                cached_results = {key: value for key, value in results["results"].items() if key != "timings"}
+                self.result_cache.put(cache_key, log_type, self.analyzer_version(log_type), cached_results)
+            return results
+
+    def _analyze_upload(self, log_type: str, file_data, digest: str, **options) -> Dict[str, Any]:
+        """Analyze an upload from the columnar cache or, failing that, straight from its stream"""
         try:
-            logging.info("File data length is: " + str(len(file_data)))
-            # Save incoming data to temporary file
-            temp_file = self._save_temp_file(file_data, log_type)
-            
-            # Get analysis script path
-            script_name = self.analysis_scripts[log_type]
-            script_path = os.path.join(self.base_path, script_name)
-            
-            logging.info(f"Executing analysis script: {script_path} with file: {temp_file}")
-            
-            # Execute analysis script with log file path as argument
-            result = subprocess.run(
-                ['python', script_path, temp_file],
-                capture_output=True,
-                text=True,
-                check=True
-            )
-            
-           
+            source = file_data if hasattr(file_data, 'read') else io.BytesIO(file_data)
 
-            json_output = result.stdout.strip().split('\n')[-1]  # Get last line
-            logging.info(f"Analysis script output:\n{json_output}")
-            
-            # Parse JSON output from the analysis script
-            try:
-                analysis_results = json.loads(json_output)
-                return {
-                    "success": True,
-                    "log_type": log_type,
-                    "results": analysis_results
-                }
-            except json.JSONDecodeError as e:
-                raise Exception(f"Failed to parse analysis results: {str(e)}\nOutput: {result.stdout}")
-
-        except subprocess.CalledProcessError as e:
-            error_msg = f"Analysis script failed with exit code {e.returncode}: {e.stderr}"
+            # Analyze the cached columnar copy, parsing the CSV only on first sight of an upload
+            if self.upload_cache is not None:
+                try:
+                    with stage('upload_cache'):
+                        cached_file = self.upload_cache.get_or_build(source, log_type, digest)
+                except Exception as e:
+                    logging.warning(f"Upload cache unavailable, analyzing the raw file: {str(e)}")
+                    source.seek(0)
+                else:
+                    if os.path.exists(cached_file):
+                        return self.analyze_file(log_type, cached_file, **options)
+                    # Evicted by another process before it could be read
+                    logging.warning(f"Cached upload {digest} was evicted, analyzing the raw file")
+                    source.seek(0)
+
+            return self.analyze_file(log_type, source, **options)
+        except Exception as e:
+            error_msg = f"Analysis failed for {log_type}: {str(e)}"
             logging.error(error_msg)
             return {
                 "success": False,
                 "log_type": log_type,
                 "error": error_msg
             }
+
+    def analyze_file(self, log_type: str, file_path, **options) -> Dict[str, Any]:
+        """Run the analyzer for a log type in-process on a log file path or binary stream
+
+        Options such as the model mode or tenant are only passed to analyzers that accept them.
+        """
+        if log_type not in self.analyzers:
+            return self._unsupported(log_type)
+
+        try:
+            with collect(log_type) as timings:
+                with stage('import'):
+                    analyzer = self._load_analyzer(log_type)
+                parameters = inspect.signature(analyzer).parameters
+                options = {name: value for name, value in options.items()
+                           if name in parameters and value is not None}
+                source = f"{len(file_path)} stored rows" if hasattr(file_path, 'columns') else file_path
+                logging.info(f"Running {log_type} analyzer in-process on: {source} with options {options}")
+
+                # Analyzers and Keras print progress to stdout, which is reserved for our JSON
+                with contextlib.redirect_stdout(sys.stderr), capture_anomalies() as captured:
+                    analysis_results = analyzer(file_path, **options)
+                self.anomaly_events = anomaly_events(captured)
+
+                # Some analyzers report failures in the result instead of raising
+                if "error" in analysis_results:
+                    raise Exception(analysis_results["error"])
+
+                if self.artifact_store is not None:
+                    # The PNG goes to the artifact store; results and log_Analysis only keep its URL
+                    with stage('artifact'):
+                        store_graph(analysis_results, self.artifact_store)
+
+                analysis_results["timings"] = timings.as_dict()
+                emit(timings)
+
+            return {
+                "success": True,
+                "log_type": log_type,
+                "results": analysis_results
+            }
         except Exception as e:
             error_msg = f"Analysis failed for {log_type}: {str(e)}"
             logging.error(error_msg)
@@ -164,43 +276,196 @@ class LogAnalyzerMaster:
                 "log_type": log_type,
                 "error": error_msg
             }
-        finally:
-            # Clean up temporary file
-            if temp_file and os.path.exists(temp_file):
-                try:
-                    os.remove(temp_file)
-                    logging.info(f"Temporary file removed: {temp_file}")
-                except Exception as e:
-                    logging.warning(f"Failed to remove temporary file {temp_file}: {str(e)}")
 
-def get_file_content_from_db(log_id: int) -> str:
-    """Retrieve file content from database"""
+    def ingest_upload(self, log_id: int, events=None) -> list:
+        """Append a stored upload, and the anomaly events found in it, to its owner's log store"""
+        info = get_upload_info(log_id)
+        with open_upload(log_id) as blob:
+            source = blob
+            if self.upload_cache is not None:
+                # The analysis has usually built the columnar copy already
+                source = self.upload_cache.get_or_build(blob, info["LogType"], blob.digest)
+            entries = self.log_store.ingest(info["UserID"], info["LogType"], source, blob.digest, log_id)
+            if events is not None and len(events):
+                self.log_store.append(info["UserID"], ANOMALY_EVENTS, events, blob.digest, log_id)
+            return entries
+
+    def rollup_upload(self, log_id: int, events=None) -> Dict[str, int]:
+        """Fold a stored upload, and the anomaly events found in it, into its owner's rollup tables"""
+        info = get_upload_info(log_id)
+        with open_upload(log_id) as blob:
+            source = blob
+            if self.upload_cache is not None:
+                source = self.upload_cache.get_or_build(blob, info["LogType"], blob.digest)
+            df = read_log(source, info["LogType"])
+        anomaly_times = events["timestamp"] if events is not None else None
+        return self.rollups.add(info["UserID"], info["LogType"], df, log_id, anomaly_times)
+
+    def correlate(self, tenant, start=None, end=None, tolerance_s: float = CORRELATION_TOLERANCE_S,
+                  min_log_types: int = MIN_LOG_TYPES):
+        """Incidents linking a tenant's stored anomalies of several log types by source IP and time"""
+        with collect("correlation") as timings:
+            with stage('load'):
+                events = self.log_store.read(tenant, ANOMALY_EVENTS, start, end)
+            incidents = correlate(events, tolerance_s, min_log_types)
+        return events, incidents, timings.as_dict()
+
+    def analyze_range(self, log_type: str, tenant, start=None, end=None, **options) -> Dict[str, Any]:
+        """Analyze a tenant's stored logs between start and end without reloading whole uploads"""
+        if log_type not in self.analyzers:
+            return self._unsupported(log_type)
+        try:
+            df = self.log_store.read(tenant, log_type, start, end)
+        except Exception as e:
+            error_msg = f"Analysis failed for {log_type}: {str(e)}"
+            logging.error(error_msg)
+            return {"success": False, "log_type": log_type, "error": error_msg}
+        results = self.analyze_file(log_type, df, **options)
+        if results["success"]:
+            results["results"]["range"] = {"tenant": tenant, "start": str(start) if start is not None else None,
+                                           "end": str(end) if end is not None else None}
+        return results
+
+
+def ingest_analyzed_upload(analyzer: LogAnalyzerMaster, log_id: int, results: Dict[str, Any]):
+    """Add an upload to the log store (SHIELD_LOG_STORE=1) and the rollup tables (SHIELD_ROLLUPS=1)
+    after a successful analysis"""
+    if not results.get("success"):
+        return
+    # The analysis result stands even if the history could not be extended
+    if LOG_STORE_ENABLED:
+        try:
+            analyzer.ingest_upload(log_id, analyzer.anomaly_events)
+        except Exception as e:
+            logging.warning(f"Failed to add upload {log_id} to the log store: {str(e)}")
+    if analyzer.rollups is not None:
+        try:
+            analyzer.rollup_upload(log_id, analyzer.anomaly_events)
+        except Exception as e:
+            logging.warning(f"Failed to add upload {log_id} to the rollup tables: {str(e)}")
+
+
+def store_range(store: LogStore, tenant, log_type: str, start=None, end=None, days: Optional[float] = None):
+    """Time range from explicit bounds, or the last `days` days up to end (default: the newest stored row)"""
+    if days is None:
+        return start, end
+    end = pd.Timestamp(end) if end is not None else store.latest(tenant, log_type)
+    if end is None:
+        raise Exception(f"No {log_type} stored for tenant {tenant}")
+    return end - pd.Timedelta(days=days), end
+
+
+def get_upload_info(log_id: int) -> Dict[str, Any]:
+    """Retrieve the owner, log type and file name of an upload"""
+    connection = None
     try:
-        connection = mysql.connector.connect(**DB_CONFIG)
+        connection = db.connect()
         cursor = connection.cursor(dictionary=True)
-        
-        query = "SELECT filedata FROM UploadLogs WHERE id = %s"
-        cursor.execute(query, (log_id,))
+        cursor.execute("SELECT ID, UserID, LogType, filename FROM UploadLogs WHERE id = %s", (log_id,))
         result = cursor.fetchone()
-        
         if not result:
             raise Exception(f"No log file found with ID: {log_id}")
-        
-        # Validate base64 content
-        filedata = result['filedata']
-        logging.info(f"Retrieved base64 data length: {len(filedata)}")
-        logging.debug(f"First 100 chars of retrieved data: {filedata[:100]}")
-            
-        return filedata
-        
+        return result
+    except Error as e:
+        raise Exception(f"Database error: {str(e)}")
+    finally:
+        if connection is not None and connection.is_connected():
+            cursor.close()
+            connection.close()
+
+
+ANALYSIS_INSERT = (
+    "INSERT INTO log_Analysis (LogID, Total_logs, Malicious_Events, GraphData, Alert_level, Source_Ip, Log_Type) "
+    "VALUES (%s, %s, %s, %s, %s, %s, %s)"
+)
+
+
+def _analysis_row(log_id: int, results: Dict[str, Any]) -> tuple:
+    return (log_id, int(results["total_logs"]), int(results["malicious_events"]), results["graph_data"],
+            results["alert_level"], results["sourceIp"], results["log_type"])
+
+
+def store_analysis(log_id: int, results: Dict[str, Any]) -> int:
+    """Insert analysis results into log_Analysis, as upload.php does, and return the new row id"""
+    connection = None
+    try:
+        connection = db.connect()
+        cursor = connection.cursor()
+        cursor.execute(ANALYSIS_INSERT, _analysis_row(log_id, results))
+        connection.commit()
+        return cursor.lastrowid
+    except Error as e:
+        raise Exception(f"Database error: {str(e)}")
+    finally:
+        if connection is not None and connection.is_connected():
+            cursor.close()
+            connection.close()
+
+
+def store_analyses(rows) -> int:
+    """Insert many (log_id, results) pairs into log_Analysis in a single transaction"""
+    rows = [_analysis_row(log_id, results) for log_id, results in rows]
+    if not rows:
+        return 0
+    connection = None
+    try:
+        connection = db.connect()
+        cursor = connection.cursor()
+        # The connector rewrites this into multi-row INSERT statements
+        cursor.executemany(ANALYSIS_INSERT, rows)
+        connection.commit()
+        return len(rows)
+    except Error as e:
+        raise Exception(f"Database error: {str(e)}")
+    finally:
+        if connection is not None and connection.is_connected():
+            cursor.close()
+            connection.close()
+
+
+def select_uploads(ids=(), ranges=(), where: Optional[str] = None,
+                   log_type: Optional[str] = None) -> list:
+    """Return (ID, LogType) of the uploads matching explicit ids, inclusive id ranges and/or a SQL filter"""
+    selectors, params = [], []
+    if ids:
+        selectors.append(f"ID IN ({', '.join(['%s'] * len(ids))})")
+        params.extend(ids)
+    for first, last in ranges:
+        selectors.append("ID BETWEEN %s AND %s")
+        params.extend([first, last])
+
+    query = "SELECT ID, LogType FROM UploadLogs WHERE 1 = 1"
+    if selectors:
+        query += f" AND ({' OR '.join(selectors)})"
+    if where:
+        query += f" AND ({where})"
+    if log_type:
+        query += " AND LogType = %s"
+        params.append(log_type)
+    query += " ORDER BY LogType, ID"
+
+    connection = None
+    try:
+        connection = db.connect()
+        cursor = connection.cursor()
+        cursor.execute(query, tuple(params))
+        return cursor.fetchall()
     except Error as e:
         raise Exception(f"Database error: {str(e)}")
     finally:
-        if connection.is_connected():
+        if connection is not None and connection.is_connected():
             cursor.close()
             connection.close()
 
 
+def job_options(job: Dict[str, Any]) -> Dict[str, Any]:
+    """Analyzer options for a job, adding the upload owner as tenant when models are per tenant"""
+    options = {name: job[name] for name in ("mode", "tenant", "graph_format", "engine") if job.get(name) is not None}
+    if MODEL_PER_TENANT and "tenant" not in options and "log_id" in job:
+        options["tenant"] = get_upload_info(int(job["log_id"]))["UserID"]
+    return options
+
+
 def display_base64_image(base64_string):
     try:
         # Remove the data URI prefix if present
@@ -224,8 +489,734 @@ def display_base64_image(base64_string):
         print(f"Error displaying image: {str(e)}")
 
 
+def _json_default(value):
+    """Serialize numpy scalars that the analyzers return in their results"""
+    if hasattr(value, 'item'):
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def run_job(analyzer: LogAnalyzerMaster, job: Dict[str, Any]) -> Dict[str, Any]:
+    """Execute one worker job identified by log_id (database) or file_path (local file)"""
+    if job.get("command") == "stats":
+        return {
+            "success": True,
+            "result_cache": analyzer.result_cache.stats() if analyzer.result_cache else None
+        }
+
+    try:
+        log_type = job["log_type"]
+        logging.info(f"Worker received job for {log_type}: {job}")
+        options = job_options(job)
+        if "file_path" in job:
+            results = analyzer.analyze_file(log_type, job["file_path"], **options)
+        else:
+            with open_upload(int(job["log_id"])) as blob:
+                results = analyzer.analyze_logs(log_type, blob, digest=blob.digest, **options)
+            ingest_analyzed_upload(analyzer, int(job["log_id"]), results)
+    except Exception as e:
+        error_msg = f"Job failed: {str(e)}"
+        logging.error(error_msg)
+        results = {"success": False, "error": error_msg}
+
+    if "id" in job:
+        results["job_id"] = job["id"]
+    return results
+
+
+def _handle_job_line(analyzer: LogAnalyzerMaster, line: str) -> str:
+    """Decode one JSON job line and return the JSON response line"""
+    try:
+        job = json.loads(line)
+        if not isinstance(job, dict):
+            raise ValueError("job must be a JSON object")
+        response = run_job(analyzer, job)
+    except ValueError as e:
+        response = {"success": False, "error": f"Invalid job: {str(e)}"}
+    return json.dumps(response, ensure_ascii=False, default=_json_default) + "\n"
+
+
+def serve_stdio(analyzer: LogAnalyzerMaster):
+    """Answer newline-delimited JSON jobs from stdin, one JSON line per job on stdout"""
+    out = sys.stdout
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        out.write(_handle_job_line(analyzer, line))
+        out.flush()
+
+
+class _JobRequestHandler(socketserver.StreamRequestHandler):
+    """Serve newline-delimited JSON jobs for one client connection"""
+
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            response = _handle_job_line(self.server.analyzer, line.decode('utf-8'))
+            self.wfile.write(response.encode('utf-8'))
+            self.wfile.flush()
+
+
+def serve_socket(analyzer: LogAnalyzerMaster, socket_path: str = None, port: int = None):
+    """Serve jobs on a local Unix socket, or on a loopback TCP port where Unix sockets are unavailable"""
+    if socket_path:
+        if not hasattr(socketserver, 'UnixStreamServer'):
+            raise Exception("Unix sockets are not supported on this platform, use --port instead")
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        server = socketserver.UnixStreamServer(socket_path, _JobRequestHandler)
+        address = socket_path
+    else:
+        server = socketserver.TCPServer(('127.0.0.1', port), _JobRequestHandler)
+        address = f"127.0.0.1:{port}"
+
+    # Jobs are served one at a time; the analyzers and TensorFlow share process state
+    server.analyzer = analyzer
+    logging.info(f"Analysis worker listening on {address}")
+    try:
+        with server:
+            server.serve_forever()
+    finally:
+        if socket_path and os.path.exists(socket_path):
+            os.remove(socket_path)
+
+
+def submit_job(job: Dict[str, Any], socket_path: str = None, port: int = None,
+               timeout: float = None) -> Dict[str, Any]:
+    """Send one job to a running worker and wait for its response"""
+    if socket_path:
+        if not hasattr(socket, 'AF_UNIX'):
+            raise Exception("Unix sockets are not supported on this platform, use a port instead")
+        family, address = socket.AF_UNIX, socket_path
+    else:
+        family, address = socket.AF_INET, ('127.0.0.1', port)
+
+    with socket.socket(family, socket.SOCK_STREAM) as conn:
+        conn.settimeout(timeout)
+        conn.connect(address)
+        conn.sendall((json.dumps(job) + "\n").encode('utf-8'))
+        with conn.makefile('rb') as reader:
+            line = reader.readline()
+
+    if not line:
+        raise Exception("Worker closed the connection without a response")
+    return json.loads(line)
+
+
+def process_queued_job(queue: JobQueue, analyzer: LogAnalyzerMaster, job: Dict[str, Any]):
+    """Run a claimed queue job and record its outcome in log_Analysis and the jobs table"""
+    try:
+        request = {"log_type": job["LogType"], **(job["Options"] or {})}
+        if job["LogID"] is not None:
+            request["log_id"] = job["LogID"]
+        results = run_job(analyzer, request)
+        if not results["success"]:
+            queue.fail(job["JobID"], results.get("error", "Analysis failed"))
+            return
+
+        analysis_id = None
+        if job["LogID"] is not None:
+            analysis_id = store_analysis(job["LogID"], results["results"])
+        summary = {key: results["results"].get(key)
+                   for key in ("total_logs", "malicious_events", "alert_level", "log_type")}
+        queue.complete(job["JobID"], summary, analysis_id)
+    except Exception as e:
+        error_msg = f"Job {job['JobID']} failed: {str(e)}"
+        logging.error(error_msg)
+        queue.fail(job["JobID"], error_msg)
+
+
+def queue_worker_loop(poll_interval: float):
+    """Claim and process queued jobs forever, keeping the analyzers loaded"""
+    queue = JobQueue()
+    analyzer = LogAnalyzerMaster()
+    analyzer.preload()
+    while True:
+        job = queue.claim()
+        if job is None:
+            time.sleep(poll_interval)
+            continue
+        logging.info(f"Claimed job {job['JobID']} for {job['LogType']} upload {job['LogID']}")
+        process_queued_job(queue, analyzer, job)
+
+
+# Analyzer master of a batch worker process, reused across all of its chunks
+_batch_analyzer: Optional[LogAnalyzerMaster] = None
+
+
+def _init_batch_worker():
+    global _batch_analyzer
+    _batch_analyzer = LogAnalyzerMaster()
+
+
+def _analyze_batch_chunk(log_type: str, log_ids: list, options: Dict[str, Any]) -> list:
+    """Analyze uploads of one log type in a batch worker; returns (log_id, results) pairs"""
+    outcomes = []
+    for log_id in log_ids:
+        results = run_job(_batch_analyzer, {"log_type": log_type, "log_id": log_id, **options})
+        outcomes.append((log_id, results))
+    return outcomes
+
+
+def print_results(results: Dict[str, Any]):
+    """Print analysis results in the line layout upload.php reads (JSON on the fourth line)"""
+    if("results" not in results):
+        raise Exception("Analysis failed: No results returned")
+
+    print("Keys in results:", list(results["results"].keys()))
+    if results["results"].get("graph_format") == "series":
+        # Two summary lines, like display_base64_image, keep the JSON on the fourth line
+        print("Graph format: series")
+        print(f"Graph payload size: {len(results['results']['graph_data'] or '')}")
+    elif "graph_artifact" in results["results"]:
+        artifact = results["results"]["graph_artifact"]
+        print(f"Graph artifact: {artifact['url']}")
+        print(f"Graph artifact size: {artifact['bytes']}")
+    else:
+        display_base64_image(results["results"]["graph_data"])
+    print(json.dumps(results, ensure_ascii=False, default=_json_default))
+
+
+def _worker_address_from_env():
+    """Worker address configured for the one-shot CLI, if any"""
+    socket_path = os.environ.get('SHIELD_WORKER_SOCKET')
+    port = os.environ.get('SHIELD_WORKER_PORT')
+    return socket_path, int(port) if port else None
+
+
+def worker_main(argv) -> int:
+    """Run a long-lived worker that keeps all analyzers loaded"""
+    parser = argparse.ArgumentParser(prog='master.py worker',
+                                     description='Serve analysis jobs from a persistent process')
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--socket', help='Unix socket path to listen on')
+    group.add_argument('--port', type=int, help='Loopback TCP port to listen on')
+    args = parser.parse_args(argv)
+
+    analyzer = LogAnalyzerMaster()
+    analyzer.preload()
+
+    if args.socket or args.port:
+        serve_socket(analyzer, socket_path=args.socket, port=args.port)
+    else:
+        serve_stdio(analyzer)
+    return 0
+
+
+def submit_main(argv) -> int:
+    """Thin client: forward one job to a running worker and print its results"""
+    parser = argparse.ArgumentParser(prog='master.py submit',
+                                     description='Submit a job to a running analysis worker')
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument('--socket', help='Unix socket path of the worker')
+    group.add_argument('--port', type=int, help='Loopback TCP port of the worker')
+    parser.add_argument('log_type')
+    parser.add_argument('log_id', type=int)
+    args = parser.parse_args(argv)
+
+    try:
+        results = submit_job({"log_type": args.log_type.strip('"\''), "log_id": args.log_id},
+                             socket_path=args.socket, port=args.port)
+        print_results(results)
+        return 0 if results["success"] else 1
+    except Exception as e:
+        error_msg = f"Analysis failed: {str(e)}"
+        logging.error(error_msg)
+        print(json.dumps({"success": False, "error": error_msg}))
+        return 1
+
+
+def cache_main(argv) -> int:
+    """Warm, purge or inspect the columnar upload cache"""
+    parser = argparse.ArgumentParser(prog='master.py cache',
+                                     description='Manage the columnar cache of parsed uploads')
+    subparsers = parser.add_subparsers(dest='action', required=True)
+    warm = subparsers.add_parser('warm', help='Parse uploads into the cache ahead of analysis')
+    warm.add_argument('log_ids', type=int, nargs='+')
+    purge = subparsers.add_parser('purge', help='Remove cached uploads')
+    purge.add_argument('--log-type', help='Only purge uploads of this log type')
+    subparsers.add_parser('stats', help='Show cache size and usage')
+    args = parser.parse_args(argv)
+
+    if not columnar_support():
+        print(json.dumps({"success": False, "error": "The upload cache requires pyarrow"}))
+        return 1
+
+    cache = UploadCache()
+    if args.action == 'warm':
+        warmed, failed = [], {}
+        for log_id in args.log_ids:
+            try:
+                log_type = get_upload_info(log_id)["LogType"]
+                with open_upload(log_id) as blob:
+                    cache.get_or_build(blob, log_type, blob.digest)
+                warmed.append(log_id)
+            except Exception as e:
+                logging.error(f"Failed to warm cache for upload {log_id}: {str(e)}")
+                failed[log_id] = str(e)
+        print(json.dumps({"success": not failed, "warmed": warmed, "failed": failed}))
+        return 0 if not failed else 1
+    if args.action == 'purge':
+        print(json.dumps({"success": True, "removed": cache.purge(args.log_type)}))
+        return 0
+    print(json.dumps({"success": True, **cache.stats()}))
+    return 0
+
+
+def results_main(argv) -> int:
+    """Inspect or invalidate the analysis result cache"""
+    parser = argparse.ArgumentParser(prog='master.py results',
+                                     description='Manage cached analysis results')
+    subparsers = parser.add_subparsers(dest='action', required=True)
+    invalidate = subparsers.add_parser('invalidate', help='Drop cached results')
+    invalidate.add_argument('--log-type', help='Only drop results of this log type')
+    invalidate.add_argument('--stale', action='store_true',
+                            help='Only drop results produced by older analyzer versions')
+    subparsers.add_parser('stats', help='Show the number of cached results')
+    args = parser.parse_args(argv)
+
+    analyzer = LogAnalyzerMaster()
+    if analyzer.result_cache is None:
+        print(json.dumps({"success": False, "error": "Result caching is disabled"}))
+        return 1
+
+    if args.action == 'stats':
+        print(json.dumps({"success": True, **analyzer.result_cache.stats()}))
+        return 0
+
+    if args.stale:
+        log_types = [args.log_type] if args.log_type else list(analyzer.analyzers)
+        removed = sum(
+            analyzer.result_cache.invalidate(log_type, keep_version=analyzer.analyzer_version(log_type))
+            for log_type in log_types
+        )
+    else:
+        removed = analyzer.result_cache.invalidate(args.log_type)
+    print(json.dumps({"success": True, "removed": removed}))
+    return 0
+
+
+def artifacts_main(argv) -> int:
+    """Garbage collect or inspect the store of rendered graphs"""
+    parser = argparse.ArgumentParser(prog='master.py artifacts',
+                                     description='Manage the content-addressed store of rendered graphs')
+    subparsers = parser.add_subparsers(dest='action', required=True)
+    gc = subparsers.add_parser('gc', help='Remove least recently used artifacts past the size cap')
+    gc.add_argument('--max-bytes', type=int, help='Size to shrink the store to (default: the configured cap)')
+    subparsers.add_parser('stats', help='Show store size and usage')
+    args = parser.parse_args(argv)
+
+    try:
+        store = ArtifactStore()
+    except Exception as e:
+        print(json.dumps({"success": False, "error": str(e)}))
+        return 1
+    if args.action == 'gc':
+        print(json.dumps({"success": True, "removed": store.gc(args.max_bytes)}))
+        return 0
+    print(json.dumps({"success": True, **store.stats()}))
+    return 0
+
+
+def store_main(argv) -> int:
+    """Ingest uploads into, analyze ranges of, or inspect the partitioned log store"""
+    parser = argparse.ArgumentParser(prog='master.py store',
+                                     description='Manage the per-tenant log store partitioned by day')
+    subparsers = parser.add_subparsers(dest='action', required=True)
+    ingest = subparsers.add_parser('ingest', help="Append uploads to their owner's log store")
+    ingest.add_argument('ids', nargs='*', type=_parse_id_selector,
+                        help='Upload ids or inclusive id ranges such as 100-250')
+    ingest.add_argument('--where', help='Extra SQL condition on UploadLogs, e.g. "UserID = 3"')
+    ingest.add_argument('--log-type', help='Only ingest uploads of this log type')
+    analyze = subparsers.add_parser('analyze', help="Analyze a time range of a tenant's stored logs")
+    analyze.add_argument('tenant')
+    analyze.add_argument('log_type')
+    analyze.add_argument('--start', help='First timestamp to include, e.g. 2024-05-01')
+    analyze.add_argument('--end', help='Last timestamp to include (default: the newest stored row)')
+    analyze.add_argument('--days', type=float, help='Analyze the DAYS days before --end instead of --start')
+    analyze.add_argument('--mode', help='Model mode passed to the analyzer')
+    analyze.add_argument('--graph-format', help='Graph format passed to the analyzer')
+    analyze.add_argument('--engine', help='Detector engine passed to the network, DNS and application analyzers')
+    stats = subparsers.add_parser('stats', help='Show stored uploads, days and rows')
+    stats.add_argument('--tenant')
+    stats.add_argument('--log-type')
+    args = parser.parse_args(argv)
+
+    analyzer = LogAnalyzerMaster()
+    if args.action == 'stats':
+        print(json.dumps({"success": True, **analyzer.log_store.stats(args.tenant, args.log_type)}))
+        return 0
+
+    if args.action == 'analyze':
+        try:
+            log_type = args.log_type.strip('"\'')
+            start, end = store_range(analyzer.log_store, args.tenant, log_type, args.start, args.end, args.days)
+            options = {name: value for name, value in (("mode", args.mode), ("graph_format", args.graph_format),
+                                                       ("engine", args.engine))
+                       if value is not None}
+            if MODEL_PER_TENANT:
+                options["tenant"] = args.tenant
+            results = analyzer.analyze_range(log_type, args.tenant, start, end, **options)
+        except Exception as e:
+            results = {"success": False, "error": str(e)}
+        print(json.dumps(results, ensure_ascii=False, default=_json_default))
+        return 0 if results["success"] else 1
+
+    if not args.ids and not args.where and not args.log_type:
+        parser.error('give upload ids, --where or --log-type')
+    ids = [selector for selector in args.ids if isinstance(selector, int)]
+    ranges = [selector for selector in args.ids if isinstance(selector, tuple)]
+    ingested, failed = {}, {}
+    for log_id, _ in select_uploads(ids, ranges, args.where, args.log_type):
+        try:
+            ingested[log_id] = sum(entry["rows"] for entry in analyzer.ingest_upload(log_id))
+        except Exception as e:
+            logging.error(f"Failed to add upload {log_id} to the log store: {str(e)}")
+            failed[log_id] = str(e)
+    print(json.dumps({"success": not failed, "ingested": ingested, "failed": failed}))
+    return 0 if not failed else 1
+
+
+def correlate_main(argv) -> int:
+    """Report multi-signal incidents from a tenant's stored anomalies"""
+    parser = argparse.ArgumentParser(prog='master.py correlate',
+                                     description='Link anomalies of different log types by source IP and time')
+    parser.add_argument('tenant')
+    parser.add_argument('--start', help='First anomaly timestamp to include, e.g. 2024-05-01')
+    parser.add_argument('--end', help='Last anomaly timestamp to include (default: the newest stored one)')
+    parser.add_argument('--days', type=float, help='Correlate the DAYS days before --end instead of --start')
+    parser.add_argument('--tolerance', type=float, default=CORRELATION_TOLERANCE_S,
+                        help='Largest gap in seconds between anomalies of one incident')
+    parser.add_argument('--min-log-types', type=int, default=MIN_LOG_TYPES,
+                        help='Distinct log types an incident needs to be reported')
+    parser.add_argument('--limit', type=int, default=100, help='Incidents to print, most signals first')
+    args = parser.parse_args(argv)
+
+    try:
+        analyzer = LogAnalyzerMaster()
+        start, end = store_range(analyzer.log_store, args.tenant, ANOMALY_EVENTS, args.start, args.end, args.days)
+        events, incidents, timings = analyzer.correlate(args.tenant, start, end, args.tolerance,
+                                                        args.min_log_types)
+        print(json.dumps({
+            "success": True,
+            "tenant": args.tenant,
+            "anomalies": len(events),
+            "incident_count": len(incidents),
+            "incidents": incidents_payload(incidents, args.limit),
+            "timings": timings
+        }, default=_json_default))
+        return 0
+    except Exception as e:
+        logging.error(f"Correlation failed: {str(e)}")
+        print(json.dumps({"success": False, "error": str(e)}))
+        return 1
+
+
+def rollups_main(argv) -> int:
+    """Query or prune the per-minute, per-hour and per-day rollup tables"""
+    parser = argparse.ArgumentParser(prog='master.py rollups',
+                                     description='Read pre-aggregated event, byte, anomaly and IP counts')
+    subparsers = parser.add_subparsers(dest='action', required=True)
+    query = subparsers.add_parser('query', help="Buckets of a tenant's log type over a time range")
+    query.add_argument('tenant')
+    query.add_argument('log_type')
+    query.add_argument('--start', help='First bucket to include, e.g. 2024-05-01')
+    query.add_argument('--end', help='Last bucket to include')
+    query.add_argument('--days', type=float, help='Query the DAYS days before --end (default: now) instead of --start')
+    query.add_argument('--resolution', choices=list(RESOLUTIONS),
+                       help='Bucket size (default: the finest one giving at most SHIELD_ROLLUP_MAX_POINTS buckets)')
+    prune = subparsers.add_parser('prune', help='Delete old buckets of one resolution')
+    prune.add_argument('--resolution', choices=list(RESOLUTIONS), default='minute')
+    prune.add_argument('--keep-days', type=float, required=True, help='Days of buckets to keep')
+    args = parser.parse_args(argv)
+
+    try:
+        rollups = RollupTable()
+        if args.action == 'prune':
+            before = pd.Timestamp.now() - pd.Timedelta(days=args.keep_days)
+            print(json.dumps({"success": True, "resolution": args.resolution,
+                              "deleted": rollups.prune(args.resolution, before)}))
+            return 0
+        start, end = args.start, args.end
+        if args.days is not None:
+            end = pd.Timestamp(end) if end is not None else pd.Timestamp.now()
+            start = end - pd.Timedelta(days=args.days)
+        print(json.dumps({"success": True,
+                          **rollups.query(args.tenant, args.log_type.strip('"\''), start, end, args.resolution)}))
+        return 0
+    except Exception as e:
+        logging.error(f"Rollup {args.action} failed: {str(e)}")
+        print(json.dumps({"success": False, "error": str(e)}))
+        return 1
+
+
+def refit_main(argv) -> int:
+    """Train and register a new baseline model for a log type from one upload"""
+    parser = argparse.ArgumentParser(prog='master.py refit',
+                                     description='Fit a new baseline model that score-only jobs will use')
+    parser.add_argument('log_type')
+    parser.add_argument('log_id', type=int, nargs='?', help='Upload to train on (default: the latest one)')
+    parser.add_argument('--tenant', help='Register the model for this tenant (UserID) only')
+    parser.add_argument('--engine', help='Detector engine to fit (network, DNS and application logs)')
+    parser.add_argument('--days', type=float,
+                        help="Train on the tenant's last DAYS days in the log store instead of one upload")
+    args = parser.parse_args(argv)
+
+    try:
+        log_type = args.log_type.strip('"\'')
+        if args.days is not None:
+            if args.tenant is None:
+                raise Exception("--days needs --tenant, whose log store is trained on")
+            analyzer = LogAnalyzerMaster()
+            start, end = store_range(analyzer.log_store, args.tenant, log_type, days=args.days)
+            results = analyzer.analyze_range(log_type, args.tenant, start, end, mode="train", tenant=args.tenant,
+                                             engine=args.engine)
+            if not results["success"]:
+                raise Exception(results["error"])
+            print(json.dumps({
+                "success": True,
+                "log_type": log_type,
+                "tenant": args.tenant,
+                "range": results["results"]["range"],
+                "model_version": results["results"].get("model_version")
+            }))
+            return 0
+
+        log_id = args.log_id
+        if log_id is None:
+            where = f"UserID = {int(args.tenant)}" if args.tenant is not None else None
+            uploads = select_uploads(where=where, log_type=log_type)
+            if not uploads:
+                raise Exception(f"No uploads found for {log_type}")
+            log_id = uploads[-1][0]
+
+        analyzer = LogAnalyzerMaster()
+        with open_upload(log_id) as blob:
+            # Bypasses the result cache, which would return the results of an earlier fit
+            results = analyzer._analyze_upload(log_type, blob, blob.digest, mode="train", tenant=args.tenant,
+                                               engine=args.engine)
+        if not results["success"]:
+            raise Exception(results["error"])
+        print(json.dumps({
+            "success": True,
+            "log_type": log_type,
+            "log_id": log_id,
+            "tenant": args.tenant,
+            "model_version": results["results"].get("model_version")
+        }))
+        return 0
+    except Exception as e:
+        logging.error(f"Refit failed: {str(e)}")
+        print(json.dumps({"success": False, "error": str(e)}))
+        return 1
+
+
+def _parse_id_selector(value: str):
+    """An upload id, or an inclusive 'first-last' range of ids"""
+    first, _, last = value.partition('-')
+    try:
+        return (int(first), int(last)) if last else int(first)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"'{value}' is not an upload id or id range")
+
+
+def batch_main(argv) -> int:
+    """Analyze many uploads over a process pool and store the results in bulk"""
+    parser = argparse.ArgumentParser(prog='master.py batch',
+                                     description='Analyze many uploads and write the results to log_Analysis')
+    parser.add_argument('ids', nargs='*', type=_parse_id_selector,
+                        help='Upload ids or inclusive id ranges such as 100-250')
+    parser.add_argument('--where', help='Extra SQL condition on UploadLogs, e.g. "UserID = 3"')
+    parser.add_argument('--log-type', help='Only analyze uploads of this log type')
+    parser.add_argument('--mode', help='Model mode passed to the analyzers')
+    parser.add_argument('--graph-format', help='Graph format passed to the analyzers')
+    parser.add_argument('--engine', help='Detector engine passed to the network, DNS and application analyzers')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='Number of worker processes (default: CPU count)')
+    parser.add_argument('--chunk-size', type=int, default=8,
+                        help='Uploads of one log type handed to a worker at a time')
+    parser.add_argument('--insert-batch', type=int, default=100,
+                        help='Results written to log_Analysis per INSERT')
+    parser.add_argument('--dry-run', action='store_true', help='Analyze without writing to log_Analysis')
+    args = parser.parse_args(argv)
+
+    if not args.ids and not args.where and not args.log_type:
+        parser.error('give upload ids, --where or --log-type')
+
+    ids = [selector for selector in args.ids if isinstance(selector, int)]
+    ranges = [selector for selector in args.ids if isinstance(selector, tuple)]
+    uploads = select_uploads(ids, ranges, args.where, args.log_type)
+    options = {name: value for name, value in (("mode", args.mode), ("graph_format", args.graph_format),
+                                               ("engine", args.engine))
+               if value is not None}
+
+    # Uploads are sorted by log type, so each chunk runs a single analyzer
+    chunks = []
+    for log_type, log_id in ((row[1], row[0]) for row in uploads):
+        if chunks and chunks[-1][0] == log_type and len(chunks[-1][1]) < args.chunk_size:
+            chunks[-1][1].append(log_id)
+        else:
+            chunks.append((log_type, [log_id]))
+    logging.info(f"Batch of {len(uploads)} uploads in {len(chunks)} chunks over {args.workers} workers")
+
+    started = time.perf_counter()
+    analyzed, stored, total_rows, failed, pending = 0, 0, 0, {}, []
+    with ProcessPoolExecutor(max_workers=max(1, args.workers), initializer=_init_batch_worker) as executor:
+        futures = [executor.submit(_analyze_batch_chunk, log_type, log_ids, options)
+                   for log_type, log_ids in chunks]
+        for future in as_completed(futures):
+            for log_id, results in future.result():
+                if not results["success"]:
+                    failed[log_id] = results.get("error")
+                    continue
+                analyzed += 1
+                total_rows += int(results["results"]["total_logs"])
+                pending.append((log_id, results["results"]))
+            if not args.dry_run and len(pending) >= args.insert_batch:
+                stored += store_analyses(pending)
+                pending = []
+    if not args.dry_run:
+        stored += store_analyses(pending)
+    elapsed = time.perf_counter() - started
+
+    print(json.dumps({
+        "success": not failed,
+        "uploads": len(uploads),
+        "analyzed": analyzed,
+        "stored": stored,
+        "failed": failed,
+        "seconds": round(elapsed, 3),
+        "files_per_second": round(analyzed / elapsed, 3) if elapsed else None,
+        "rows_per_second": round(total_rows / elapsed, 1) if elapsed else None
+    }))
+    return 0 if not failed else 1
+
+
+def compact_main(argv) -> int:
+    """Recompress stored uploads in batches; analysis decompresses them transparently"""
+    parser = argparse.ArgumentParser(prog='master.py compact',
+                                     description='Recompress uploads stored as plain text with zstd or gzip')
+    parser.add_argument('ids', nargs='*', type=_parse_id_selector,
+                        help='Upload ids or inclusive id ranges such as 100-250 (default: every uncompressed upload)')
+    parser.add_argument('--log-type', help='Only compact uploads of this log type')
+    parser.add_argument('--codec', choices=CODECS, default=UPLOAD_CODEC)
+    parser.add_argument('--level', type=int, default=UPLOAD_CODEC_LEVEL, help='Compression level of the codec')
+    parser.add_argument('--batch-size', type=int, default=20, help='Uploads recompressed per transaction')
+    parser.add_argument('--pause', type=float, default=0.0,
+                        help='Seconds to wait between batches to leave the database room for other work')
+    args = parser.parse_args(argv)
+
+    ids = [selector for selector in args.ids if isinstance(selector, int)]
+    ranges = [selector for selector in args.ids if isinstance(selector, tuple)]
+    log_ids = sorted(row[0] for row in select_uploads(ids, ranges, db.UNCOMPRESSED_CONDITION, args.log_type))
+    logging.info(f"Compacting {len(log_ids)} uploads with {args.codec} in batches of {args.batch_size}")
+
+    bytes_before, bytes_after, compacted, failed = 0, 0, 0, {}
+    batch_size = max(1, args.batch_size)
+    for start in range(0, len(log_ids), batch_size):
+        connection = db.connect()
+        try:
+            for log_id in log_ids[start:start + batch_size]:
+                try:
+                    size, compacted_size = db.compact_upload(connection, log_id, args.codec, args.level)
+                except Exception as e:
+                    logging.error(f"Failed to compact upload {log_id}: {str(e)}")
+                    failed[log_id] = str(e)
+                    continue
+                bytes_before += size
+                bytes_after += compacted_size
+                compacted += compacted_size < size
+            connection.commit()
+        except Error as e:
+            raise Exception(f"Database error: {str(e)}")
+        finally:
+            connection.close()
+        logging.info(f"Compacted {min(start + batch_size, len(log_ids))}/{len(log_ids)} uploads, "
+                     f"{bytes_before} -> {bytes_after} bytes")
+        if args.pause and start + batch_size < len(log_ids):
+            time.sleep(args.pause)
+
+    print(json.dumps({
+        "success": not failed,
+        "uploads": len(log_ids),
+        "compacted": compacted,
+        "bytes_before": bytes_before,
+        "bytes_after": bytes_after,
+        "ratio": round(bytes_before / bytes_after, 2) if bytes_after else None,
+        "failed": failed
+    }))
+    return 0 if not failed else 1
+
+
+def download_main(argv) -> int:
+    """Write a stored upload, decompressed, to standard output"""
+    parser = argparse.ArgumentParser(prog='master.py download',
+                                     description='Stream an upload as plain text, decompressing compacted blobs')
+    parser.add_argument('log_id', type=int)
+    args = parser.parse_args(argv)
+
+    try:
+        with open_upload(args.log_id) as blob:
+            shutil.copyfileobj(blob, sys.stdout.buffer, COMPRESS_CHUNK_SIZE)
+        return 0
+    except Exception as e:
+        logging.error(f"Download of upload {args.log_id} failed: {str(e)}")
+        return 1
+
+
+def queue_workers_main(argv) -> int:
+    """Run a pool of queue workers that claim jobs from the analysis_jobs table"""
+    parser = argparse.ArgumentParser(prog='master.py queue-workers',
+                                     description='Process queued analysis jobs with a pool of workers')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='Number of worker processes (default: CPU count)')
+    parser.add_argument('--poll-interval', type=float, default=2.0,
+                        help='Seconds to wait when the queue is empty')
+    parser.add_argument('--stale-after', type=int, default=3600,
+                        help='Requeue jobs that have been running longer than this many seconds at startup')
+    args = parser.parse_args(argv)
+
+    JobQueue().requeue_stale(args.stale_after)
+
+    workers = [
+        multiprocessing.Process(target=queue_worker_loop, args=(args.poll_interval,), daemon=True)
+        for _ in range(args.workers)
+    ]
+    for worker in workers:
+        worker.start()
+    logging.info(f"Started {len(workers)} queue workers")
+    try:
+        for worker in workers:
+            worker.join()
+    except KeyboardInterrupt:
+        for worker in workers:
+            worker.terminate()
+    return 0
+
+
+COMMANDS = {
+    "worker": worker_main,
+    "submit": submit_main,
+    "queue-workers": queue_workers_main,
+    "batch": batch_main,
+    "compact": compact_main,
+    "download": download_main,
+    "store": store_main,
+    "correlate": correlate_main,
+    "rollups": rollups_main,
+    "refit": refit_main,
+    "cache": cache_main,
+    "artifacts": artifacts_main,
+    "results": results_main
+}
+
+
 def main():
     """Main entry point for the script"""
+    if len(sys.argv) > 1 and sys.argv[1] in COMMANDS:
+        sys.exit(COMMANDS[sys.argv[1]](sys.argv[2:]))
+
     try:
         if len(sys.argv) != 3:
             error_msg = "Required arguments: log_type log_id"
@@ -238,24 +1229,33 @@ def main():
         log_id = int(sys.argv[2].strip('"\''))
         
         logging.info(f"Received request to analyze {log_type} logs with ID: {log_id}")
-        
-        # Retrieve file content from database
-        try:
-            file_data = get_file_content_from_db(log_id)
-        except Exception as e:
-            raise Exception(f"Failed to retrieve file content: {str(e)}")
-        
-        # Initialize analyzer and process logs
-        analyzer = LogAnalyzerMaster()
-        results = analyzer.analyze_logs(log_type, file_data)
+
+        # Hand the job to a persistent worker when one is configured and reachable
+        results = None
+        socket_path, port = _worker_address_from_env()
+        if socket_path or port:
+            try:
+                results = submit_job({"log_type": log_type, "log_id": log_id},
+                                     socket_path=socket_path, port=port)
+            except OSError as e:
+                logging.warning(f"Analysis worker unavailable, analyzing in-process: {str(e)}")
+
+        if results is None:
+            # Stream the file content from the database
+            try:
+                blob = open_upload(log_id)
+            except Exception as e:
+                raise Exception(f"Failed to retrieve file content: {str(e)}")
+
+            # Initialize analyzer and process logs
+            with blob:
+                analyzer = LogAnalyzerMaster()
+                options = job_options({"log_type": log_type, "log_id": log_id})
+                results = analyzer.analyze_logs(log_type, blob, digest=blob.digest, **options)
+            ingest_analyzed_upload(analyzer, log_id, results)
         
         # Return results as JSON
-        if("results" not in results):
-            raise Exception("Analysis failed: No results returned")
-        
-        print("Keys in results:", list(results["results"].keys()))
-        display_base64_image(results["results"]["graph_data"])
-        print(json.dumps(results, ensure_ascii=False))
+        print_results(results)
         sys.exit(0 if results["success"] else 1)
         
     except Exception as e:
@@ -268,4 +1268,4 @@ def main():
         sys.exit(1)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,223 @@
+import os
+import re
+import json
+import shutil
+import logging
+from datetime import datetime
+from typing import Dict, Any, List, NamedTuple, Optional
+
+import joblib
+import numpy as np
+
+from inference_runtime import export_model, load_exported
+from instrumentation import timed
+
+logger = logging.getLogger(__name__)
+
+# Trained models live next to the analyzers unless configured otherwise
+REGISTRY_ROOT = os.environ.get(
+    'SHIELD_MODEL_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models')
+)
+
+# Number of versions kept per log type / tenant
+KEEP_VERSIONS = int(os.environ.get('SHIELD_MODEL_KEEP', '5'))
+
+# Rows scored per score_samples call, bounding the memory of scoring large uploads
+SCORE_CHUNK_ROWS = int(os.environ.get('SHIELD_SCORE_CHUNK_ROWS', '65536'))
+
+# train: always fit and register a new version
+# score-only: load the latest registered version and only run inference
+# auto: score with the latest version, train one if none is registered yet
+MODEL_MODES = ('train', 'score-only', 'auto')
+
+# Detectors of the windowed analyzers (network, DNS, application), see detector_engines.py
+# lstm: the analyzer's own Keras LSTM autoencoder (default)
+# pca: reconstruction error of a NumPy PCA fitted on flattened windows
+# dense: small sklearn dense autoencoder on flattened windows
+# iforest: IsolationForest on per-window statistics
+DETECTOR_ENGINES = ('lstm', 'pca', 'dense', 'iforest')
+
+
+class RegisteredModel(NamedTuple):
+    model: Any
+    state: Dict[str, Any]
+    metadata: Dict[str, Any]
+
+
+def resolve_mode(mode: Optional[str] = None) -> str:
+    """Return the model mode, defaulting to SHIELD_MODEL_MODE or 'train'."""
+    mode = mode or os.environ.get('SHIELD_MODEL_MODE', 'train')
+    if mode not in MODEL_MODES:
+        raise ValueError(f"Unknown model mode '{mode}', expected one of {', '.join(MODEL_MODES)}")
+    return mode
+
+
+def resolve_engine(log_type: str, engine: Optional[str] = None) -> str:
+    """Return the detector engine for a log type.
+
+    Defaults to SHIELD_ENGINE_<LOG_TYPE> (e.g. SHIELD_ENGINE_DNS_QUERY_LOGS), then
+    SHIELD_DETECTOR_ENGINE, then 'lstm'.
+    """
+    engine = (engine or os.environ.get(f'SHIELD_ENGINE_{_slug(log_type).upper()}')
+              or os.environ.get('SHIELD_DETECTOR_ENGINE', 'lstm'))
+    if engine not in DETECTOR_ENGINES:
+        raise ValueError(f"Unknown detector engine '{engine}', expected one of {', '.join(DETECTOR_ENGINES)}")
+    return engine
+
+
+def registry_key(log_type: str, engine: str) -> str:
+    """Registry key of an engine's models; LSTM models keep the plain log type they were always stored under."""
+    return log_type if engine == 'lstm' else f"{log_type} {engine}"
+
+
+def encode_labels(encoder, values) -> np.ndarray:
+    """Apply a fitted LabelEncoder, mapping labels unseen at training time to -1."""
+    lookup = {label: code for code, label in enumerate(encoder.classes_)}
+    return np.array([lookup.get(value, -1) for value in values], dtype=np.int64)
+
+
+@timed('score')
+def forest_scores(forest, X, chunk_rows: int = SCORE_CHUNK_ROWS):
+    """Score rows with a fitted IsolationForest in chunks.
+
+    Returns the score_samples values and the matching predict labels (-1 for anomalies),
+    both from a single pass over the trees.
+    """
+    n = len(X)
+    scores = np.empty(n, dtype=np.float64)
+    for start in range(0, n, chunk_rows):
+        chunk = X.iloc[start:start + chunk_rows] if hasattr(X, 'iloc') else X[start:start + chunk_rows]
+        scores[start:start + chunk_rows] = forest.score_samples(chunk)
+    # predict() labels a row an outlier when score_samples - offset_ < 0
+    return scores, np.where(scores < forest.offset_, -1, 1)
+
+
+def _slug(value: str) -> str:
+    return re.sub(r'[^A-Za-z0-9]+', '_', str(value)).strip('_').lower()
+
+
+def _is_keras_model(model) -> bool:
+    return type(model).__module__.startswith(('keras', 'tensorflow'))
+
+
+class ModelRegistry:
+    """Versioned store of trained models keyed by log type and optional tenant."""
+
+    def __init__(self, root: str = REGISTRY_ROOT):
+        self.root = root
+
+    def _key_dir(self, log_type: str, tenant=None) -> str:
+        scope = f"tenant_{_slug(tenant)}" if tenant is not None else "global"
+        return os.path.join(self.root, _slug(log_type), scope)
+
+    def _version_dir(self, log_type: str, tenant, version: int) -> str:
+        return os.path.join(self._key_dir(log_type, tenant), f"v{version:04d}")
+
+    def versions(self, log_type: str, tenant=None) -> List[int]:
+        """List registered versions in ascending order."""
+        key_dir = self._key_dir(log_type, tenant)
+        if not os.path.isdir(key_dir):
+            return []
+        return sorted(
+            int(name[1:]) for name in os.listdir(key_dir)
+            if re.fullmatch(r'v\d+', name)
+        )
+
+    def latest_version(self, log_type: str, tenant=None) -> Optional[int]:
+        versions = self.versions(log_type, tenant)
+        return versions[-1] if versions else None
+
+    @timed('model_save')
+    def save(self, log_type: str, model, state: Dict[str, Any], tenant=None,
+             metadata: Optional[Dict[str, Any]] = None, keep: int = KEEP_VERSIONS,
+             sample: Optional[np.ndarray] = None) -> int:
+        """Register a trained model with its fitted preprocessing state and return its version.
+
+        Keras autoencoders given `sample` windows are also exported to SHIELD_INFERENCE_RUNTIME
+        when it is set, if the export reproduces their reconstruction errors on the sample.
+        """
+        key_dir = self._key_dir(log_type, tenant)
+        os.makedirs(key_dir, exist_ok=True)
+
+        staging_dir = os.path.join(key_dir, f".staging_{os.getpid()}_{datetime.now().strftime('%Y%m%d%H%M%S%f')}")
+        os.makedirs(staging_dir)
+        try:
+            export = None
+            if _is_keras_model(model):
+                model_format = 'keras'
+                model.save(os.path.join(staging_dir, 'model.keras'))
+                if sample is not None:
+                    export = export_model(model, staging_dir, sample)
+            else:
+                model_format = 'joblib'
+                joblib.dump(model, os.path.join(staging_dir, 'model.joblib'))
+            joblib.dump(state, os.path.join(staging_dir, 'state.joblib'))
+
+            # Publishing the version directory with a rename keeps readers from seeing partial writes
+            while True:
+                version = (self.latest_version(log_type, tenant) or 0) + 1
+                meta = {
+                    'log_type': log_type,
+                    'tenant': tenant,
+                    'version': version,
+                    'model_format': model_format,
+                    'inference_export': export,
+                    'created_at': datetime.now().isoformat(timespec='seconds'),
+                    **(metadata or {})
+                }
+                with open(os.path.join(staging_dir, 'meta.json'), 'w') as f:
+                    json.dump(meta, f, indent=2, default=str)
+                try:
+                    os.rename(staging_dir, self._version_dir(log_type, tenant, version))
+                    break
+                except OSError:
+                    if not os.path.exists(self._version_dir(log_type, tenant, version)):
+                        raise
+        except Exception:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+            raise
+
+        logger.info(f"Registered {log_type} model version {version} (tenant: {tenant})")
+        self.prune(log_type, tenant, keep)
+        return version
+
+    @timed('model_load')
+    def load(self, log_type: str, tenant=None, version: Optional[int] = None) -> Optional[RegisteredModel]:
+        """Load a registered model, by default the latest version.
+
+        A tenant without its own models falls back to the global models for the log type.
+        Returns None when nothing is registered.
+        """
+        if version is None:
+            version = self.latest_version(log_type, tenant)
+            if version is None and tenant is not None:
+                return self.load(log_type, None)
+            if version is None:
+                return None
+
+        version_dir = self._version_dir(log_type, tenant, version)
+        with open(os.path.join(version_dir, 'meta.json')) as f:
+            meta = json.load(f)
+
+        if meta['model_format'] == 'keras':
+            # The lean runtime export, when there is one, spares scoring workers loading Keras
+            model = load_exported(version_dir, meta.get('inference_export'))
+            if model is None:
+                from tensorflow.keras.models import load_model  # type: ignore
+                # Only inference is needed, so custom training losses do not have to be resolvable
+                model = load_model(os.path.join(version_dir, 'model.keras'), compile=False)
+        else:
+            model = joblib.load(os.path.join(version_dir, 'model.joblib'))
+        state = joblib.load(os.path.join(version_dir, 'state.joblib'))
+
+        logger.info(f"Loaded {log_type} model version {version} (tenant: {meta.get('tenant')})")
+        return RegisteredModel(model, state, meta)
+
+    def prune(self, log_type: str, tenant=None, keep: int = KEEP_VERSIONS):
+        """Delete all but the newest `keep` versions."""
+        if keep <= 0:
+            return
+        for version in self.versions(log_type, tenant)[:-keep]:
+            shutil.rmtree(self._version_dir(log_type, tenant, version), ignore_errors=True)
+            logger.info(f"Pruned {log_type} model version {version} (tenant: {tenant})")
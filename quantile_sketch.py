@@ -0,0 +1,89 @@
+import os
+from typing import Iterable, List
+
+import numpy as np
+
+# Compactor size of new sketches; the rank error of a quantile is about 1.7 / k
+SKETCH_K = int(os.environ.get('SHIELD_SKETCH_K', '2048'))
+
+# Capacity shrink factor from one compactor to the one below it
+_DECAY = 2 / 3
+
+
+class KLLSketch:
+    """KLL quantile sketch of a stream of floats, updated in chunks and mergeable.
+
+    Level h holds items that each stand for 2**h values. When a level overflows its
+    capacity it is sorted and every other item (from a random offset) is promoted one
+    level up, so the sketch keeps O(k) items however many values it has seen. While
+    nothing has been compacted the sketch is exact and quantile() matches np.percentile.
+    """
+
+    def __init__(self, k: int = SKETCH_K, seed: int = 0):
+        self.k = k
+        self.count = 0
+        self.compactors: List[np.ndarray] = [np.empty(0)]
+        self._rng = np.random.default_rng(seed)
+
+    def __len__(self) -> int:
+        return self.count
+
+    def _capacity(self, level: int) -> int:
+        depth = len(self.compactors) - level - 1
+        return max(int(np.ceil(self.k * _DECAY ** depth)), 2)
+
+    def _compress(self):
+        while True:
+            level = next((h for h, items in enumerate(self.compactors) if len(items) > self._capacity(h)), None)
+            if level is None:
+                return
+            if level + 1 == len(self.compactors):
+                self.compactors.append(np.empty(0))
+            items = np.sort(self.compactors[level])
+            # An odd item out stays behind so the promoted pairs cover the rest exactly
+            leftover = len(items) % 2
+            promoted = items[leftover:][self._rng.integers(2)::2]
+            self.compactors[level] = items[:leftover]
+            self.compactors[level + 1] = np.concatenate([self.compactors[level + 1], promoted])
+
+    def update(self, values: Iterable[float]) -> 'KLLSketch':
+        """Add a chunk of values; NaNs are ignored."""
+        values = np.asarray(values, dtype=np.float64).ravel()
+        values = values[~np.isnan(values)]
+        if len(values):
+            self.count += len(values)
+            self.compactors[0] = np.concatenate([self.compactors[0], values])
+            self._compress()
+        return self
+
+    def merge(self, other: 'KLLSketch') -> 'KLLSketch':
+        """Fold in the sketch of another chunk or worker."""
+        if other.k != self.k:
+            raise ValueError("Only sketches with the same k can be merged")
+        while len(self.compactors) < len(other.compactors):
+            self.compactors.append(np.empty(0))
+        for level, items in enumerate(other.compactors):
+            self.compactors[level] = np.concatenate([self.compactors[level], items])
+        self.count += other.count
+        self._compress()
+        return self
+
+    def quantile(self, q: float) -> float:
+        """Approximate q-quantile (0 <= q <= 1) of every value seen."""
+        if self.count == 0:
+            raise ValueError("Quantile of an empty sketch")
+        if len(self.compactors) == 1:
+            return float(np.percentile(self.compactors[0], q * 100))
+
+        items = np.concatenate(self.compactors)
+        weights = np.concatenate([np.full(len(level_items), 2.0 ** level)
+                                  for level, level_items in enumerate(self.compactors)])
+        order = np.argsort(items, kind='stable')
+        items, weights = items[order], weights[order]
+        # Each item sits at the middle of the rank range it stands for
+        positions = (np.cumsum(weights) - weights / 2) / weights.sum()
+        return float(np.interp(q, positions, items))
+
+    @classmethod
+    def from_values(cls, values: Iterable[float], k: int = SKETCH_K) -> 'KLLSketch':
+        return cls(k).update(values)
@@ -259,15 +259,57 @@ if ($_SERVER['REQUEST_METHOD'] === 'GET' && isset($_GET['download'])) {
         }
 
         $file = $result->fetch_assoc();
-        
+
+        $codec = null;
+        if (strncmp($file['filedata'], "\x28\xb5\x2f\xfd", 4) === 0) {
+            $codec = 'zstd';
+        } elseif (strncmp($file['filedata'], "\x1f\x8b", 2) === 0) {
+            $codec = 'gzip';
+        }
+
+        // Compacted uploads are sent as stored only to clients that decode their codec
+        $accepted = [];
+        if (isset($_SERVER['HTTP_ACCEPT_ENCODING'])) {
+            foreach (explode(',', $_SERVER['HTTP_ACCEPT_ENCODING']) as $encoding) {
+                $accepted[] = strtolower(trim(explode(';', $encoding)[0]));
+            }
+        }
+        $data = $file['filedata'];
+        $streamFromAnalyzer = false;
+        if ($codec !== null && !in_array($codec, $accepted, true)) {
+            if ($codec === 'gzip') {
+                $data = gzdecode($data);
+            } elseif (function_exists('zstd_uncompress')) {
+                $data = zstd_uncompress($data);
+            } else {
+                // PHP without the zstd extension streams the decompressed upload from the analyzer
+                $streamFromAnalyzer = true;
+            }
+            if ($data === false) {
+                throw new Exception('Failed to decompress file');
+            }
+            $codec = null;
+        }
+
         // Set headers for download
         header('Content-Type: text/plain');
         header('Content-Disposition: attachment; filename="' . $file['filename'] . '"');
-        header('Content-Length: ' . strlen($file['filedata']));
         header('Cache-Control: no-cache, must-revalidate');
         header('Pragma: public');
-        
-        echo $file['filedata'];
+        header('Vary: Accept-Encoding');
+
+        if ($streamFromAnalyzer) {
+            $pythonScript = dirname(__FILE__) . '\scripts\master.py';
+            passthru("python \"$pythonScript\" download " . escapeshellarg($fileId));
+            exit();
+        }
+
+        if ($codec !== null) {
+            header('Content-Encoding: ' . $codec);
+        }
+        header('Content-Length: ' . strlen($data));
+
+        echo $data;
         exit();
 
     } catch (Exception $e) {
@@ -905,6 +947,7 @@ if ($_SERVER["REQUEST_METHOD"] == "GET" && isset($_GET['view_analysis'])) {
         </div>
     </div>
 
+    <script src="js/series_canvas.js"></script>
     <script>
        // Replace everything between <script> tags with this code
         document.addEventListener('DOMContentLoaded', () => {
@@ -1031,6 +1074,12 @@ if ($_SERVER["REQUEST_METHOD"] == "GET" && isset($_GET['view_analysis'])) {
             }
 
             function renderGraphToCanvas(canvas, graphData) {
+                // Series payloads are JSON, stored graphs a URL ending in .png, everything else a base64 PNG
+                if (graphData.trim().startsWith('{')) {
+                    renderSeriesToCanvas(canvas, JSON.parse(graphData));
+                    return;
+                }
+
                 const img = new Image();
                 img.onload = () => {
                     const container = canvas.parentElement;
@@ -1044,7 +1093,7 @@ if ($_SERVER["REQUEST_METHOD"] == "GET" && isset($_GET['view_analysis'])) {
                     ctx.clearRect(0, 0, canvas.width, canvas.height);
                     ctx.drawImage(img, 0, 0, canvas.width, canvas.height);
                 };
-                img.src = 'data:image/png;base64,' + graphData;
+                img.src = graphData.endsWith('.png') ? graphData : 'data:image/png;base64,' + graphData;
             }
 
             // Table management
@@ -0,0 +1,192 @@
+import os
+import json
+import hashlib
+import logging
+from datetime import datetime
+from typing import Dict, Any, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+# disk (default), mysql, or none to disable result caching
+RESULT_CACHE_BACKEND = os.environ.get('SHIELD_RESULT_CACHE', 'disk')
+
+RESULT_CACHE_DIR = os.environ.get(
+    'SHIELD_RESULT_CACHE_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache', 'results')
+)
+
+
+def _json_default(value):
+    if hasattr(value, 'item'):
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def source_version(paths: Iterable[str]) -> str:
+    """Fingerprint of the source files an analyzer runs, so editing any of them invalidates its results."""
+    digest = hashlib.sha256()
+    for path in paths:
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:16]
+
+
+def result_key(content_digest: str, log_type: str, analyzer_version: str, params: Dict[str, Any]) -> str:
+    """Cache key for one analysis: upload content, log type, analyzer version and parameters."""
+    payload = json.dumps([content_digest, log_type, analyzer_version, params], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class DiskResultBackend:
+    """One JSON file per cached result under a local directory."""
+
+    def __init__(self, root: str = RESULT_CACHE_DIR):
+        self.root = root
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], f"{key}.json")
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._path(key)) as f:
+                return json.load(f)['results']
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def put(self, key: str, log_type: str, analyzer_version: str, results: Dict[str, Any]):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        entry = {
+            'log_type': log_type,
+            'analyzer_version': analyzer_version,
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'results': results
+        }
+        staging_path = f"{path}.{os.getpid()}.tmp"
+        with open(staging_path, 'w') as f:
+            json.dump(entry, f, default=_json_default)
+        os.replace(staging_path, path)
+
+    def invalidate(self, log_type: Optional[str] = None, keep_version: Optional[str] = None) -> int:
+        removed = 0
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                if not filename.endswith('.json'):
+                    continue
+                path = os.path.join(dirpath, filename)
+                try:
+                    with open(path) as f:
+                        entry = json.load(f)
+                except (OSError, ValueError):
+                    entry = {}
+                if log_type and entry.get('log_type') != log_type:
+                    continue
+                if keep_version and entry.get('analyzer_version') == keep_version:
+                    continue
+                os.remove(path)
+                removed += 1
+        return removed
+
+    def count(self) -> int:
+        return sum(
+            len([name for name in filenames if name.endswith('.json')])
+            for _, _, filenames in os.walk(self.root)
+        )
+
+
+class MySQLResultBackend:
+    """Cached results in the analysis_result_cache table, over the process's pooled connections."""
+
+    def _execute(self, query: str, params=(), fetch: bool = False):
+        import db
+        # Closing a pooled connection returns it to the pool
+        connection = db.connect()
+        try:
+            cursor = connection.cursor()
+            cursor.execute(query, params)
+            rows = cursor.fetchall() if fetch else cursor.rowcount
+            connection.commit()
+            cursor.close()
+            return rows
+        finally:
+            connection.close()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        rows = self._execute("SELECT Results FROM analysis_result_cache WHERE CacheKey = %s",
+                             (key,), fetch=True)
+        return json.loads(rows[0][0]) if rows else None
+
+    def put(self, key: str, log_type: str, analyzer_version: str, results: Dict[str, Any]):
+        self._execute(
+            "REPLACE INTO analysis_result_cache (CacheKey, Log_Type, AnalyzerVersion, Results) "
+            "VALUES (%s, %s, %s, %s)",
+            (key, log_type, analyzer_version, json.dumps(results, default=_json_default))
+        )
+
+    def invalidate(self, log_type: Optional[str] = None, keep_version: Optional[str] = None) -> int:
+        query, params = "DELETE FROM analysis_result_cache WHERE 1 = 1", []
+        if log_type:
+            query += " AND Log_Type = %s"
+            params.append(log_type)
+        if keep_version:
+            query += " AND AnalyzerVersion <> %s"
+            params.append(keep_version)
+        return self._execute(query, tuple(params))
+
+    def count(self) -> int:
+        return self._execute("SELECT COUNT(*) FROM analysis_result_cache", fetch=True)[0][0]
+
+
+class ResultCache:
+    """Analysis results keyed by upload content, analyzer version and parameters, with hit/miss counters."""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        try:
+            results = self.backend.get(key)
+        except Exception as e:
+            logger.warning(f"Result cache lookup failed: {str(e)}")
+            results = None
+        if results is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        logger.info(f"Result cache {'hit' if results is not None else 'miss'} "
+                    f"(hits: {self.hits}, misses: {self.misses})")
+        return results
+
+    def put(self, key: str, log_type: str, analyzer_version: str, results: Dict[str, Any]):
+        try:
+            self.backend.put(key, log_type, analyzer_version, results)
+        except Exception as e:
+            logger.warning(f"Failed to store analysis results in cache: {str(e)}")
+
+    def invalidate(self, log_type: Optional[str] = None, keep_version: Optional[str] = None) -> int:
+        removed = self.backend.invalidate(log_type, keep_version)
+        logger.info(f"Invalidated {removed} cached results (log type: {log_type or 'all'})")
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            'backend': type(self.backend).__name__,
+            'entries': self.backend.count(),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else None
+        }
+
+
+def create_result_cache(backend: str = RESULT_CACHE_BACKEND) -> Optional[ResultCache]:
+    """Build the configured result cache, or None when caching is disabled."""
+    if backend == 'none':
+        return None
+    if backend == 'mysql':
+        return ResultCache(MySQLResultBackend())
+    if backend == 'disk':
+        return ResultCache(DiskResultBackend())
+    raise ValueError(f"Unknown result cache backend '{backend}', expected disk, mysql or none")
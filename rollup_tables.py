@@ -0,0 +1,272 @@
+import os
+import logging
+from typing import Any, Dict, NamedTuple, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+import db
+from distinct_sketch import hll_estimate, hll_registers
+
+logger = logging.getLogger(__name__)
+
+# Materialize dashboard rollups of every analyzed upload
+ROLLUPS_ENABLED = os.environ.get('SHIELD_ROLLUPS', '0') == '1'
+
+# mysql (default) or sqlite as a local stand-in
+ROLLUP_BACKEND = os.environ.get('SHIELD_ROLLUP_BACKEND', 'mysql')
+
+ROLLUP_SQLITE_PATH = os.environ.get(
+    'SHIELD_ROLLUP_DB',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'log_rollups.sqlite3')
+)
+
+# Bucket sizes kept for every tenant and log type, finest first
+RESOLUTIONS = {'minute': 'min', 'hour': 'h', 'day': 'D'}
+
+# Buckets a query returns at most when it picks the resolution itself
+ROLLUP_MAX_POINTS = int(os.environ.get('SHIELD_ROLLUP_MAX_POINTS', '500'))
+
+# Rows written per REPLACE statement
+WRITE_CHUNK_ROWS = 100
+
+
+class RollupFields(NamedTuple):
+    timestamp: str
+    # Source address column, or None when the log type has none
+    ip: Optional[str]
+    # (column, factor to bytes) pairs summed into the byte total
+    byte_columns: Tuple[Tuple[str, float], ...] = ()
+
+
+ROLLUP_FIELDS = {
+    "Firewall Logs": RollupFields('Timestamp', 'Source_IP', (('Bytes_Transferred', 1.0),)),
+    "Network Traffic Logs": RollupFields('timestamp', 'source_ip', (('bytes_sent', 1.0), ('bytes_received', 1.0))),
+    "DNS Query Logs": RollupFields('Timestamp', 'Client IP'),
+    "Endpoint Security Logs": RollupFields('Timestamp', 'Source_IP'),
+    "Application Logs": RollupFields('Timestamp', 'IP_Address', (('Bytes', 1.0),)),
+    "Email Security Logs": RollupFields('Timestamp', None, (('Size_KB', 1024.0),))
+}
+
+SQLITE_SCHEMA = ("""
+CREATE TABLE IF NOT EXISTS log_rollups (
+    UserID INTEGER NOT NULL,
+    LogType VARCHAR(50) NOT NULL,
+    Resolution VARCHAR(6) NOT NULL,
+    BucketStart TIMESTAMP NOT NULL,
+    Events INTEGER NOT NULL DEFAULT 0,
+    Bytes REAL NOT NULL DEFAULT 0,
+    Anomalies INTEGER NOT NULL DEFAULT 0,
+    DistinctIps INTEGER,
+    IpSketch BLOB,
+    PRIMARY KEY (UserID, LogType, Resolution, BucketStart)
+)
+""", """
+CREATE TABLE IF NOT EXISTS log_rollup_uploads (
+    LogID INTEGER PRIMARY KEY,
+    UserID INTEGER NOT NULL,
+    LogType VARCHAR(50) NOT NULL,
+    CreatedAt TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+)
+""")
+
+
+class RollupBatch(NamedTuple):
+    """Aggregates of one resolution: counts per bucket plus the IP registers (None without IPs)."""
+    counts: pd.DataFrame
+    registers: Optional[np.ndarray]
+
+    def coarsen(self, freq: str) -> 'RollupBatch':
+        """The same aggregates in larger buckets; the buckets must be sorted."""
+        groups = self.counts.index.floor(freq)
+        counts = self.counts.groupby(groups).sum()
+        registers = None
+        if self.registers is not None:
+            starts = np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]])
+            registers = np.maximum.reduceat(self.registers, starts, axis=0)
+        return RollupBatch(counts, registers)
+
+
+def upload_rollup(df: pd.DataFrame, log_type: str, anomaly_times=None) -> RollupBatch:
+    """Per-minute events, bytes, anomalies and IP registers of one upload."""
+    fields = ROLLUP_FIELDS[log_type]
+    times = pd.to_datetime(df[fields.timestamp], errors='coerce')
+    valid = times.notna().to_numpy()
+    codes, buckets = pd.factorize(times[valid].dt.floor('min').to_numpy(), sort=True)
+    counts = pd.DataFrame({'events': np.bincount(codes, minlength=len(buckets)).astype(np.int64)},
+                          index=pd.DatetimeIndex(buckets, name='bucket'))
+
+    counts['bytes'] = 0.0
+    for column, factor in fields.byte_columns:
+        if column in df.columns:
+            values = pd.to_numeric(df[column][valid], errors='coerce').fillna(0.0).to_numpy(np.float64)
+            counts['bytes'] += np.bincount(codes, weights=values * factor, minlength=len(buckets))
+
+    counts['anomalies'] = 0
+    if anomaly_times is not None and len(anomaly_times):
+        minutes = pd.to_datetime(pd.Series(anomaly_times), errors='coerce').dropna().dt.floor('min')
+        anomalies = minutes.value_counts()
+        counts['anomalies'] = anomalies.reindex(counts.index, fill_value=0).to_numpy(np.int64)
+
+    registers = None
+    if fields.ip is not None and fields.ip in df.columns:
+        registers = hll_registers(df[fields.ip][valid].astype(str).to_numpy(), codes, len(buckets))
+    return RollupBatch(counts, registers)
+
+
+class RollupTable:
+    """Per-minute, per-hour and per-day aggregates per tenant and log type in the log_rollups table.
+
+    Uploads are folded in at most once each (log_rollup_uploads records their UploadLogs IDs,
+    which unlike the stored blob's digest survive compaction);
+    bucket counts add up and the IP registers merge by maximum, so a bucket filled by
+    several uploads reports the same distinct IP count as one upload holding all rows.
+    """
+
+    def __init__(self, backend: str = ROLLUP_BACKEND, sqlite_path: str = ROLLUP_SQLITE_PATH):
+        if backend not in ('mysql', 'sqlite'):
+            raise ValueError(f"Unknown rollup backend '{backend}', expected mysql or sqlite")
+        self.backend = backend
+        self.sqlite_path = sqlite_path
+        self.param = '?' if backend == 'sqlite' else '%s'
+        if backend == 'sqlite':
+            with self._connect() as connection:
+                for statement in SQLITE_SCHEMA:
+                    connection.execute(statement)
+
+    def _connect(self):
+        if self.backend == 'sqlite':
+            import sqlite3
+            return db.SQLiteConnection(sqlite3.connect(self.sqlite_path, timeout=30, isolation_level=None))
+        return db.MySQLConnection(db.connect())
+
+    def _merge(self, connection, tenant, log_type: str, resolution: str, batch: RollupBatch) -> int:
+        p = self.param
+        lock = " FOR UPDATE" if self.backend == 'mysql' else ""
+        first, last = batch.counts.index.min(), batch.counts.index.max()
+        existing = connection.execute(
+            f"SELECT BucketStart, Events, Bytes, Anomalies, IpSketch FROM log_rollups "
+            f"WHERE UserID = {p} AND LogType = {p} AND Resolution = {p} AND BucketStart BETWEEN {p} AND {p}{lock}",
+            (tenant, log_type, resolution, str(first), str(last))
+        ).fetchall()
+        counts, registers = batch.counts.copy(), batch.registers
+        if registers is not None:
+            registers = registers.copy()
+        if existing:
+            rows = {pd.Timestamp(row[0]): row for row in existing}
+            for position, bucket in enumerate(counts.index):
+                row = rows.get(bucket)
+                if row is None:
+                    continue
+                counts.iloc[position] += [row[1], row[2], row[3]]
+                if registers is not None and row[4] is not None:
+                    np.maximum(registers[position], np.frombuffer(row[4], dtype=np.uint8), out=registers[position])
+
+        distinct = hll_estimate(registers) if registers is not None else None
+        values = [
+            (tenant, log_type, resolution, str(bucket), int(row.events), float(row.bytes), int(row.anomalies),
+             int(distinct[position]) if distinct is not None else None,
+             registers[position].tobytes() if registers is not None else None)
+            for position, (bucket, row) in enumerate(counts.iterrows())
+        ]
+        for start in range(0, len(values), WRITE_CHUNK_ROWS):
+            chunk = values[start:start + WRITE_CHUNK_ROWS]
+            placeholders = ", ".join(f"({', '.join([p] * 9)})" for _ in chunk)
+            connection.execute(
+                "REPLACE INTO log_rollups (UserID, LogType, Resolution, BucketStart, Events, Bytes, Anomalies, "
+                f"DistinctIps, IpSketch) VALUES {placeholders}",
+                tuple(value for row in chunk for value in row)
+            )
+        return len(values)
+
+    def add(self, tenant, log_type: str, df: pd.DataFrame, log_id: int, anomaly_times=None) -> Dict[str, int]:
+        """Fold one upload into every resolution; returns the rows written per resolution."""
+        minutes = upload_rollup(df, log_type, anomaly_times)
+        if minutes.counts.empty:
+            return {}
+        p = self.param
+        lock = " FOR UPDATE" if self.backend == 'mysql' else ""
+        with self._connect() as connection:
+            connection.begin()
+            try:
+                seen = connection.execute(
+                    f"SELECT 1 FROM log_rollup_uploads WHERE LogID = {p}{lock}", (log_id,)
+                ).fetchone()
+                if seen:
+                    connection.rollback()
+                    logger.info(f"Upload {log_id} already rolled up for tenant {tenant}")
+                    return {}
+                connection.execute(f"INSERT INTO log_rollup_uploads (LogID, UserID, LogType) VALUES ({p}, {p}, {p})",
+                                   (log_id, tenant, log_type))
+                written = {}
+                for resolution, freq in RESOLUTIONS.items():
+                    batch = minutes if resolution == 'minute' else minutes.coarsen(freq)
+                    written[resolution] = self._merge(connection, tenant, log_type, resolution, batch)
+                connection.commit()
+            except Exception:
+                connection.rollback()
+                raise
+        logger.info(f"Rolled up {int(minutes.counts['events'].sum())} {log_type} rows of tenant {tenant}: {written}")
+        return written
+
+    def _pick_resolution(self, connection, tenant, log_type: str, start, end) -> str:
+        if start is None or end is None:
+            p = self.param
+            first, last = connection.execute(
+                f"SELECT MIN(BucketStart), MAX(BucketStart) FROM log_rollups "
+                f"WHERE UserID = {p} AND LogType = {p} AND Resolution = 'day'", (tenant, log_type)
+            ).fetchone()
+            start = start if start is not None else first
+            end = end if end is not None else last
+        if start is None or end is None:
+            return 'day'
+        span = pd.Timestamp(end) - pd.Timestamp(start)
+        for resolution, freq in RESOLUTIONS.items():
+            if span / pd.Timedelta(1, unit=freq) <= ROLLUP_MAX_POINTS:
+                return resolution
+        return 'day'
+
+    def query(self, tenant, log_type: str, start=None, end=None, resolution: Optional[str] = None) -> Dict[str, Any]:
+        """Buckets of a time range at the given resolution, or the finest one within ROLLUP_MAX_POINTS."""
+        if resolution is not None and resolution not in RESOLUTIONS:
+            raise ValueError(f"Unknown resolution '{resolution}', expected one of {', '.join(RESOLUTIONS)}")
+        p = self.param
+        with self._connect() as connection:
+            resolution = resolution or self._pick_resolution(connection, tenant, log_type, start, end)
+            query = (f"SELECT BucketStart, Events, Bytes, Anomalies, DistinctIps, IpSketch FROM log_rollups "
+                     f"WHERE UserID = {p} AND LogType = {p} AND Resolution = {p}")
+            params = [tenant, log_type, resolution]
+            if start is not None:
+                query += f" AND BucketStart >= {p}"
+                params.append(str(pd.Timestamp(start).floor(RESOLUTIONS[resolution])))
+            if end is not None:
+                query += f" AND BucketStart <= {p}"
+                params.append(str(pd.Timestamp(end)))
+            rows = connection.execute(query + " ORDER BY BucketStart", tuple(params)).fetchall()
+
+        sketches = [np.frombuffer(row[5], dtype=np.uint8) for row in rows if row[5] is not None]
+        return {
+            'tenant': tenant,
+            'log_type': log_type,
+            'resolution': resolution,
+            'buckets': [
+                {'bucket': pd.Timestamp(row[0]).isoformat(), 'events': int(row[1]), 'bytes': float(row[2]),
+                 'anomalies': int(row[3]), 'distinct_ips': row[4]}
+                for row in rows
+            ],
+            'totals': {
+                'events': int(sum(row[1] for row in rows)),
+                'bytes': float(sum(row[2] for row in rows)),
+                'anomalies': int(sum(row[3] for row in rows)),
+                # Registers of the whole range, so IPs seen in several buckets count once
+                'distinct_ips': int(hll_estimate(np.maximum.reduce(sketches))[0]) if sketches else None
+            }
+        }
+
+    def prune(self, resolution: str, before) -> int:
+        """Delete the buckets of one resolution that start before a timestamp."""
+        p = self.param
+        with self._connect() as connection:
+            cursor = connection.execute(f"DELETE FROM log_rollups WHERE Resolution = {p} AND BucketStart < {p}",
+                                        (resolution, str(pd.Timestamp(before))))
+            return cursor.rowcount
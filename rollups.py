@@ -0,0 +1,126 @@
+from typing import Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+# Feature columns per numeric column, in the order resample().agg() produces them
+FEATURE_STATS = ('sum', 'mean', 'std', 'max', 'min')
+
+# Per-bucket state kept for every column; mean and std are derived from it
+STATE_STATS = ('count', 'sum', 'm2', 'min', 'max')
+
+
+class Rollup:
+    """Mergeable per-bucket count/sum/sum of squared deviations/min/max of numeric columns.
+
+    Buckets are combined with Chan's parallel form of Welford's update, so a rollup can be
+    fed new rows in any order, or merged with the rollup of another shard, and still give
+    the same sum/mean/std/max/min as resampling all of the rows at once.
+    """
+
+    def __init__(self, columns: Iterable[str], freq: str = 'h', state: Optional[pd.DataFrame] = None):
+        self.columns = list(columns)
+        self.freq = freq
+        if state is None:
+            state = pd.DataFrame(
+                columns=pd.MultiIndex.from_product([STATE_STATS, self.columns]),
+                index=pd.DatetimeIndex([], name='timestamp'),
+                dtype='float64'
+            )
+        self.state = state
+
+    @classmethod
+    def from_rows(cls, logs: pd.DataFrame, columns: Iterable[str], freq: str = 'h') -> 'Rollup':
+        """Aggregate rows indexed by timestamp into a new rollup."""
+        columns = list(columns)
+        values = logs[columns].apply(pd.to_numeric, errors='coerce').astype('float64')
+        grouped = values.groupby(values.index.floor(freq))
+        count = grouped.count().astype('float64')
+        state = pd.concat({
+            'count': count,
+            'sum': grouped.sum(),
+            # var(ddof=0) * n is the sum of squared deviations from the bucket mean
+            'm2': (grouped.var(ddof=0) * count).fillna(0.0),
+            'min': grouped.min(),
+            'max': grouped.max()
+        }, axis=1)
+        state.index.name = 'timestamp'
+        return cls(columns, freq, state)
+
+    def __len__(self) -> int:
+        return len(self.state)
+
+    def copy(self) -> 'Rollup':
+        return Rollup(self.columns, self.freq, self.state.copy())
+
+    def merge(self, other: 'Rollup') -> 'Rollup':
+        """Fold another rollup of the same columns and bucket size into this one."""
+        if other.columns != self.columns or other.freq != self.freq:
+            raise ValueError("Only rollups of the same columns and bucket size can be merged")
+        if other.state.empty:
+            return self
+        if self.state.empty:
+            self.state = other.state.copy()
+            return self
+
+        index = self.state.index.union(other.state.index)
+        a = self.state.reindex(index)
+        b = other.state.reindex(index)
+        n_a, n_b = a['count'].fillna(0.0), b['count'].fillna(0.0)
+        s_a, s_b = a['sum'].fillna(0.0), b['sum'].fillna(0.0)
+        n = n_a + n_b
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            delta = s_b / n_b - s_a / n_a
+            correction = (delta ** 2 * n_a * n_b / n).where((n_a > 0) & (n_b > 0), 0.0)
+        merged = pd.concat({
+            'count': n,
+            'sum': s_a + s_b,
+            'm2': a['m2'].fillna(0.0) + b['m2'].fillna(0.0) + correction,
+            'min': np.fmin(a['min'], b['min']),
+            'max': np.fmax(a['max'], b['max'])
+        }, axis=1)
+        merged.index.name = 'timestamp'
+        self.state = merged
+        return self
+
+    def update(self, logs: pd.DataFrame) -> 'Rollup':
+        """Add rows indexed by timestamp; only the buckets they fall in change."""
+        if not logs.empty:
+            self.merge(Rollup.from_rows(logs, self.columns, self.freq))
+        return self
+
+    def to_features(self) -> Optional[pd.DataFrame]:
+        """Feature frame matching resample(freq).agg(['sum', 'mean', 'std', 'max', 'min']).reset_index().
+
+        Buckets without rows between the first and last one are included, as resample does.
+        """
+        if self.state.empty:
+            return None
+        index = pd.date_range(self.state.index.min(), self.state.index.max(), freq=self.freq, name='timestamp')
+        state = self.state.reindex(index)
+        count = state['count'].fillna(0.0)
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            derived = {
+                'sum': state['sum'].fillna(0.0),
+                'mean': (state['sum'] / count).where(count > 0),
+                'std': np.sqrt(state['m2'] / (count - 1)).where(count > 1),
+                'max': state['max'],
+                'min': state['min']
+            }
+        features = pd.DataFrame({'timestamp': index})
+        for column in self.columns:
+            for stat in FEATURE_STATS:
+                features[f'{column}_{stat}'] = derived[stat][column].to_numpy()
+        return features
+
+
+def merge_rollups(rollups: List[Rollup]) -> Optional[Rollup]:
+    """Merge the rollups of several shards into a new one."""
+    if not rollups:
+        return None
+    merged = rollups[0].copy()
+    for rollup in rollups[1:]:
+        merged.merge(rollup)
+    return merged
@@ -0,0 +1,250 @@
+import os
+import sys
+import json
+import logging
+import argparse
+from typing import Callable, Dict, Tuple
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Rows generated and written per step; each chunk has its own seeded generator, so a file
+# is the same for a given seed however large it is and memory stays bounded
+CHUNK_ROWS = 500_000
+
+START_TIME = np.datetime64('2024-01-01T00:00:00')
+
+# Fraction of rows turned into anomalies unless the caller asks for another rate
+ANOMALY_RATE = 0.01
+
+
+def _hosts(prefix: str, count: int) -> np.ndarray:
+    return np.array([f"{prefix}.{i // 256}.{i % 256}" for i in range(count)])
+
+
+CLIENT_HOSTS = _hosts('10.0', 500)
+# A handful of outside hosts that every injected anomaly comes from
+ATTACKER_HOSTS = _hosts('203.0', 8)
+
+
+def _timestamps(offset: int, rows: int, interval_s: int = 1) -> np.ndarray:
+    """Evenly spaced 'YYYY-MM-DD HH:MM:SS' strings, continuing across chunks."""
+    times = START_TIME + (np.arange(offset, offset + rows) * interval_s).astype('timedelta64[s]')
+    return np.char.replace(np.datetime_as_string(times, unit='s'), 'T', ' ')
+
+
+def _pick(rng: np.random.Generator, values, size: int, p=None) -> np.ndarray:
+    """Random choice as an object array, so longer anomaly values are not truncated on assignment."""
+    return rng.choice(np.asarray(values, dtype=object), size=size, p=p)
+
+
+def _source_ips(rng: np.random.Generator, anomalies: np.ndarray) -> np.ndarray:
+    ips = _pick(rng, CLIENT_HOSTS, len(anomalies))
+    ips[anomalies] = _pick(rng, ATTACKER_HOSTS, int(anomalies.sum()))
+    return ips
+
+
+def network_logs(rng: np.random.Generator, offset: int, rows: int, anomalies: np.ndarray) -> pd.DataFrame:
+    n = int(anomalies.sum())
+    packet_size = rng.normal(512, 96, rows).clip(64, 1500)
+    duration = rng.exponential(1.5, rows)
+    bytes_sent = rng.lognormal(8, 0.6, rows)
+    bytes_received = bytes_sent * rng.uniform(0.5, 4, rows)
+    # Exfiltration: large packets and long, sustained uploads
+    packet_size[anomalies] = rng.uniform(1400, 9000, n)
+    duration[anomalies] = rng.uniform(30, 300, n)
+    bytes_sent[anomalies] = rng.lognormal(13, 0.5, n)
+    bytes_received[anomalies] = rng.lognormal(6, 0.5, n)
+    return pd.DataFrame({
+        'timestamp': _timestamps(offset, rows),
+        'source_ip': _source_ips(rng, anomalies),
+        'destination_ip': _pick(rng, _hosts('172.16', 64), rows),
+        'protocol': _pick(rng, ['TCP', 'UDP', 'ICMP'], rows, p=[0.7, 0.25, 0.05]),
+        'packet_size': packet_size.round(),
+        'duration': duration.round(3),
+        'bytes_sent': bytes_sent.round(),
+        'bytes_received': bytes_received.round()
+    })
+
+
+def dns_logs(rng: np.random.Generator, offset: int, rows: int, anomalies: np.ndarray) -> pd.DataFrame:
+    n = int(anomalies.sum())
+    response_time = rng.gamma(2.0, 12.0, rows)
+    query_length = rng.integers(8, 40, rows).astype('float64')
+    ttl = rng.choice([60, 300, 3600, 86400], size=rows, p=[0.1, 0.4, 0.4, 0.1]).astype('float64')
+    # Tunnelling: long encoded names with no caching, answered slowly
+    response_time[anomalies] = rng.uniform(400, 2000, n)
+    query_length[anomalies] = rng.integers(120, 253, n)
+    ttl[anomalies] = 0
+    return pd.DataFrame({
+        'Timestamp': _timestamps(offset, rows),
+        'Client IP': _source_ips(rng, anomalies),
+        'Query Type': _pick(rng, ['A', 'AAAA', 'MX', 'TXT'], rows, p=[0.7, 0.2, 0.05, 0.05]),
+        'Response Time (ms)': response_time.round(2),
+        'Query Length': query_length,
+        'TTL': ttl,
+        'Source Port': rng.integers(1024, 65536, rows)
+    })
+
+
+def firewall_logs(rng: np.random.Generator, offset: int, rows: int, anomalies: np.ndarray) -> pd.DataFrame:
+    n = int(anomalies.sum())
+    destination_port = rng.choice([80, 443, 53, 22, 25], size=rows, p=[0.3, 0.5, 0.1, 0.05, 0.05])
+    bytes_transferred = rng.lognormal(8, 1, rows)
+    action = _pick(rng, ['ALLOW', 'DENY'], rows, p=[0.9, 0.1])
+    threat_level = _pick(rng, ['Low', 'Medium', 'High'], rows, p=[0.8, 0.15, 0.05])
+    # Port scans and bulk transfers on unusual ports
+    destination_port[anomalies] = rng.integers(1, 65536, n)
+    bytes_transferred[anomalies] = rng.lognormal(14, 0.5, n)
+    action[anomalies] = 'DENY'
+    threat_level[anomalies] = 'High'
+    return pd.DataFrame({
+        'Timestamp': _timestamps(offset, rows),
+        'Source_IP': _source_ips(rng, anomalies),
+        'Destination_IP': _pick(rng, _hosts('172.16', 64), rows),
+        'Source_Port': rng.integers(1024, 65536, rows),
+        'Destination_Port': destination_port,
+        'Protocol': _pick(rng, ['TCP', 'UDP'], rows, p=[0.8, 0.2]),
+        'Action': action,
+        'Bytes_Transferred': bytes_transferred.round(),
+        'Threat_Level': threat_level
+    })
+
+
+def endpoint_logs(rng: np.random.Generator, offset: int, rows: int, anomalies: np.ndarray) -> pd.DataFrame:
+    n = int(anomalies.sum())
+    severity = _pick(rng, ['INFO', 'WARNING', 'CRITICAL'], rows, p=[0.85, 0.13, 0.02])
+    event_type = _pick(rng, ['Login', 'File_Access', 'Process_Start', 'Network_Connection'],
+                       rows, p=[0.3, 0.3, 0.25, 0.15])
+    action_taken = _pick(rng, ['NO_ACTION', 'ALLOWED', 'REPORTED'], rows, p=[0.3, 0.65, 0.05])
+    # Malware detections and privilege escalations that had to be stopped
+    severity[anomalies] = 'CRITICAL'
+    event_type[anomalies] = _pick(rng, ['Malware_Detected', 'Privilege_Escalation'], n)
+    action_taken[anomalies] = _pick(rng, ['QUARANTINED', 'BLOCKED'], n)
+    return pd.DataFrame({
+        'Timestamp': _timestamps(offset, rows),
+        'Source_IP': _source_ips(rng, anomalies),
+        'Severity': severity,
+        'Event_Type': event_type,
+        'Action_Taken': action_taken
+    })
+
+
+def email_logs(rng: np.random.Generator, offset: int, rows: int, anomalies: np.ndarray) -> pd.DataFrame:
+    n = int(anomalies.sum())
+    senders = np.array([f"user{i}@example.com" for i in range(200)])
+    size_kb = rng.lognormal(3, 0.8, rows)
+    attachments = rng.poisson(0.3, rows)
+    links = rng.poisson(1.0, rows)
+    spam_score = rng.beta(1, 12, rows) * 10
+    sender = _pick(rng, senders, rows)
+    # Phishing bursts from lookalike domains
+    size_kb[anomalies] = rng.uniform(5000, 25000, n)
+    attachments[anomalies] = rng.integers(5, 20, n)
+    links[anomalies] = rng.integers(20, 80, n)
+    spam_score[anomalies] = rng.uniform(7, 10, n)
+    sender[anomalies] = _pick(rng, ['billing@examp1e.com', 'it-support@exarnple.com'], n)
+    return pd.DataFrame({
+        'Timestamp': _timestamps(offset, rows),
+        'Sender': sender,
+        'Recipient': _pick(rng, senders, rows),
+        'Size_KB': size_kb.round(2),
+        'Attachments': attachments,
+        'Links': links,
+        'Spam_Score': spam_score.round(2)
+    })
+
+
+def application_logs(rng: np.random.Generator, offset: int, rows: int, anomalies: np.ndarray) -> pd.DataFrame:
+    n = int(anomalies.sum())
+    status_code = rng.choice([200, 201, 301, 404], size=rows, p=[0.85, 0.05, 0.05, 0.05])
+    response_time = rng.gamma(2.0, 40.0, rows)
+    response_bytes = rng.lognormal(9, 0.7, rows)
+    endpoint = _pick(rng, ['/', '/login', '/api/orders', '/api/users', '/static/app.js'], rows)
+    # Injection attempts against the admin API that error out slowly
+    status_code[anomalies] = rng.choice([401, 403, 500], size=n)
+    response_time[anomalies] = rng.uniform(2000, 15000, n)
+    response_bytes[anomalies] = rng.lognormal(13, 0.5, n)
+    endpoint[anomalies] = '/api/admin'
+    return pd.DataFrame({
+        'Timestamp': _timestamps(offset, rows),
+        'IP_Address': _source_ips(rng, anomalies),
+        'Method': _pick(rng, ['GET', 'POST', 'PUT', 'DELETE'], rows, p=[0.7, 0.2, 0.05, 0.05]),
+        'Endpoint': endpoint,
+        'Status_Code': status_code,
+        'Response_Time_ms': response_time.round(1),
+        'Bytes': response_bytes.round()
+    })
+
+
+# Column layouts follow log_schemas.LOG_SCHEMAS and what each analyzer reads
+GENERATORS: Dict[str, Callable[[np.random.Generator, int, int, np.ndarray], pd.DataFrame]] = {
+    "Network Traffic Logs": network_logs,
+    "DNS Query Logs": dns_logs,
+    "Firewall Logs": firewall_logs,
+    "Endpoint Security Logs": endpoint_logs,
+    "Email Security Logs": email_logs,
+    "Application Logs": application_logs
+}
+
+
+def generate_chunk(log_type: str, offset: int, rows: int, anomaly_rate: float = ANOMALY_RATE,
+                   seed: int = 0) -> Tuple[pd.DataFrame, np.ndarray]:
+    """Rows offset..offset+rows of a synthetic log and the mask of its injected anomalies.
+
+    `offset` must be a multiple of CHUNK_ROWS for the rows to match those of a full file.
+    """
+    if log_type not in GENERATORS:
+        raise ValueError(f"Unsupported log type: {log_type}")
+    rng = np.random.default_rng([seed, offset // CHUNK_ROWS])
+    anomalies = rng.random(rows) < anomaly_rate
+    return GENERATORS[log_type](rng, offset, rows, anomalies), anomalies
+
+
+def generate(log_type: str, rows: int, anomaly_rate: float = ANOMALY_RATE,
+             seed: int = 0) -> Tuple[pd.DataFrame, np.ndarray]:
+    """A whole synthetic log in memory; use write_csv for millions of rows."""
+    chunks, masks = [], []
+    for offset in range(0, rows, CHUNK_ROWS):
+        chunk, mask = generate_chunk(log_type, offset, min(CHUNK_ROWS, rows - offset), anomaly_rate, seed)
+        chunks.append(chunk)
+        masks.append(mask)
+    return pd.concat(chunks, ignore_index=True), np.concatenate(masks)
+
+
+def write_csv(log_type: str, path: str, rows: int, anomaly_rate: float = ANOMALY_RATE,
+              seed: int = 0) -> int:
+    """Write a synthetic log chunk by chunk and return the number of injected anomalies."""
+    injected = 0
+    staging_path = f"{path}.{os.getpid()}.tmp"
+    with open(staging_path, 'w', newline='') as f:
+        for offset in range(0, rows, CHUNK_ROWS):
+            chunk, mask = generate_chunk(log_type, offset, min(CHUNK_ROWS, rows - offset), anomaly_rate, seed)
+            chunk.to_csv(f, index=False, header=offset == 0)
+            injected += int(mask.sum())
+    os.replace(staging_path, path)
+    logger.info(f"Wrote {rows} {log_type} rows with {injected} anomalies to {path}")
+    return injected
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog='synthetic_logs.py',
+                                     description='Write a deterministic synthetic log for one analyzer')
+    parser.add_argument('log_type', choices=list(GENERATORS))
+    parser.add_argument('rows', type=int)
+    parser.add_argument('output', help='CSV file to write')
+    parser.add_argument('--anomaly-rate', type=float, default=ANOMALY_RATE)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    injected = write_csv(args.log_type, args.output, args.rows, args.anomaly_rate, args.seed)
+    print(json.dumps({"log_type": args.log_type, "rows": args.rows, "anomalies": injected,
+                      "output": args.output}))
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
@@ -0,0 +1,99 @@
+import gzip
+import io
+
+import pandas as pd
+import pytest
+
+from blob_codecs import DecompressedStream, compress_stream, sniff
+from log_schemas import LOG_SCHEMAS, read_csv_with_schema
+
+CSV = b"".join(
+    b"2024-01-01 00:%02d:%02d,10.0.0.%d,High,Malware,Blocked\n" % (i // 60 % 60, i % 60, i % 250)
+    for i in range(5000)
+)
+ENDPOINT_CSV = b"Timestamp,Source_IP,Severity,Event_Type,Action_Taken\n" + CSV
+
+def _zstd_available() -> bool:
+    try:
+        import pyarrow  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+codecs = pytest.mark.parametrize('codec', [
+    'gzip',
+    pytest.param('zstd', marks=pytest.mark.skipif(not _zstd_available(), reason="zstd needs pyarrow"))
+])
+
+
+def test_sniff_plain_data():
+    assert sniff(CSV[:4]) is None
+    assert sniff(b"") is None
+
+
+@codecs
+def test_sniff_compressed(codec):
+    assert sniff(compress_stream(io.BytesIO(CSV), codec)[:4]) == codec
+
+
+@codecs
+def test_round_trip(codec):
+    blob = compress_stream(io.BytesIO(CSV), codec)
+    assert len(blob) < len(CSV)
+    with io.BufferedReader(DecompressedStream(io.BytesIO(blob), codec)) as stream:
+        assert stream.read() == CSV
+
+
+def test_zstd_round_trip_over_several_frames(monkeypatch):
+    pytest.importorskip('pyarrow')
+    import blob_codecs
+    # One frame per chunk; the frames must decompress as one stream
+    monkeypatch.setattr(blob_codecs, 'COMPRESS_CHUNK_SIZE', 4096)
+    blob = compress_stream(io.BytesIO(CSV), 'zstd')
+    with io.BufferedReader(DecompressedStream(io.BytesIO(blob), 'zstd')) as stream:
+        assert stream.read() == CSV
+
+
+def test_gzip_matches_the_standard_library():
+    blob = compress_stream(io.BytesIO(CSV), 'gzip')
+    assert gzip.decompress(blob) == CSV
+
+
+@codecs
+def test_seek_restarts_decompression(codec):
+    stream = DecompressedStream(io.BytesIO(compress_stream(io.BytesIO(CSV), codec)), codec)
+    first = stream.read(1000)
+    stream.read(20000)
+    assert stream.seek(0) == 0
+    assert stream.tell() == 0
+    assert stream.read(1000) == first
+    assert stream.seek(100) == 100
+    assert stream.read(10) == CSV[100:110]
+
+
+@codecs
+def test_c_engine_fallback_rereads_from_the_start(codec, monkeypatch):
+    stream = io.BufferedReader(DecompressedStream(io.BytesIO(compress_stream(io.BytesIO(ENDPOINT_CSV), codec)),
+                                                  codec))
+    read_csv = pd.read_csv
+    engines = []
+
+    def read_csv_without_pyarrow(source, engine=None, **options):
+        engines.append(engine)
+        if engine == 'pyarrow':
+            # Fail after consuming part of the stream, as a parse error would
+            source.read(10000)
+            raise ImportError("pyarrow engine disabled")
+        return read_csv(source, engine=engine, **options)
+
+    monkeypatch.setattr(pd, 'read_csv', read_csv_without_pyarrow)
+    df = read_csv_with_schema(stream, LOG_SCHEMAS["Endpoint Security Logs"])
+    assert engines == ['pyarrow', 'c']
+    assert len(df) == 5000
+    assert df['Source_IP'].iloc[0] == '10.0.0.0'
+
+
+def test_unknown_codec_is_rejected():
+    with pytest.raises(ValueError):
+        compress_stream(io.BytesIO(CSV), 'lz4')
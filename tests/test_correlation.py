@@ -0,0 +1,79 @@
+import pandas as pd
+
+from correlation import correlate, incidents_payload, normalize_ips
+
+START = pd.Timestamp('2024-05-01 12:00:00')
+
+
+def _events(rows):
+    return pd.DataFrame([
+        {'timestamp': START + pd.Timedelta(seconds=offset), 'log_type': log_type, 'ip': ip, 'severity': severity}
+        for offset, log_type, ip, severity in rows
+    ])
+
+
+def test_normalize_ips_canonicalizes_mixed_formats():
+    ips = ['10.0.0.1', ' 10.0.0.1 ', '10.0.0.1:443', '::ffff:10.0.0.1', '[::ffff:10.0.0.1]:80',
+           '2001:DB8::1', '[2001:db8::1]:443', 'host-a']
+    normalized = normalize_ips(ips)
+    assert list(normalized.astype(str)) == ['10.0.0.1'] * 5 + ['2001:db8::1'] * 2 + ['host-a']
+
+
+def test_overlapping_ips_across_log_types_form_an_incident():
+    incidents = correlate(_events([
+        (0, 'Firewall Logs', '10.0.0.1', 'High'),
+        (60, 'DNS Query Logs', '10.0.0.1:53', 'medium'),
+        (120, 'Endpoint Security Logs', '::ffff:10.0.0.1', 'Critical'),
+        (30, 'Firewall Logs', '10.0.0.2', 'High'),
+    ]), tolerance_s=300)
+    assert len(incidents) == 1
+    incident = incidents.iloc[0]
+    assert incident['ip'] == '10.0.0.1'
+    assert incident['events'] == 3
+    assert incident['log_types'] == 3
+    assert incident['signals'] == {'Firewall Logs': 1, 'DNS Query Logs': 1, 'Endpoint Security Logs': 1}
+    assert incident['max_severity'] == 'Critical'
+    assert incident['start'] == START and incident['end'] == START + pd.Timedelta(seconds=120)
+
+
+def test_gap_just_below_the_tolerance_chains_events():
+    incidents = correlate(_events([
+        (0, 'Firewall Logs', '10.0.0.3', 'High'),
+        (299, 'DNS Query Logs', '10.0.0.3', 'High'),
+    ]), tolerance_s=300)
+    assert len(incidents) == 1
+    assert incidents.iloc[0]['log_types'] == 2
+
+
+def test_gap_just_above_the_tolerance_splits_events():
+    incidents = correlate(_events([
+        (0, 'Firewall Logs', '10.0.0.4', 'High'),
+        (301, 'DNS Query Logs', '10.0.0.4', 'High'),
+    ]), tolerance_s=300)
+    assert incidents.empty
+
+
+def test_single_log_type_is_not_an_incident_by_default():
+    events = _events([
+        (0, 'Firewall Logs', '10.0.0.5', 'High'),
+        (10, 'Firewall Logs', '10.0.0.5', 'High'),
+    ])
+    assert correlate(events).empty
+    assert len(correlate(events, min_log_types=1)) == 1
+
+
+def test_incidents_payload_is_json_ready():
+    incidents = correlate(_events([
+        (0, 'Firewall Logs', '10.0.0.6', None),
+        (5, 'Application Logs', '10.0.0.6', None),
+    ]))
+    payload = incidents_payload(incidents)
+    assert payload == [{
+        'ip': '10.0.0.6',
+        'start': START.isoformat(),
+        'end': (START + pd.Timedelta(seconds=5)).isoformat(),
+        'events': 2,
+        'log_types': 2,
+        'signals': {'Firewall Logs': 1, 'Application Logs': 1},
+        'max_severity': None
+    }]
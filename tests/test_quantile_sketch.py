@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+from quantile_sketch import KLLSketch
+
+
+def _rank_error(sorted_values: np.ndarray, estimate: float, q: float) -> float:
+    return abs(np.searchsorted(sorted_values, estimate) / len(sorted_values) - q)
+
+
+def test_exact_before_first_compaction():
+    values = np.random.default_rng(0).normal(size=150)
+    sketch = KLLSketch(k=256).update(values)
+    assert len(sketch.compactors) == 1
+    for q in (0.0, 0.01, 0.25, 0.5, 0.9, 0.99, 1.0):
+        assert sketch.quantile(q) == pytest.approx(np.percentile(values, q * 100))
+
+
+def test_rank_error_after_chunked_updates_and_merge():
+    k = 200
+    values = np.random.default_rng(1).lognormal(size=200_000)
+    first, second = KLLSketch(k, seed=1), KLLSketch(k, seed=2)
+    for chunk in np.array_split(values[:120_000], 12):
+        first.update(chunk)
+    for chunk in np.array_split(values[120_000:], 8):
+        second.update(chunk)
+    sketch = first.merge(second)
+
+    assert len(sketch) == len(values)
+    assert sum(len(items) for items in sketch.compactors) < 5 * k
+    sorted_values = np.sort(values)
+    errors = [_rank_error(sorted_values, sketch.quantile(q), q) for q in np.linspace(0.01, 0.99, 99)]
+    # The typical rank error is about 1.7 / k; allow some slack for the worst of 99 quantiles
+    assert np.mean(errors) <= 1.7 / k
+    assert max(errors) <= 2.5 / k
+
+
+def test_nans_are_ignored():
+    sketch = KLLSketch(k=64).update([1.0, np.nan, 3.0])
+    assert len(sketch) == 2
+    assert sketch.quantile(0.5) == pytest.approx(2.0)
+
+
+def test_merge_rejects_different_k():
+    with pytest.raises(ValueError):
+        KLLSketch(k=128).merge(KLLSketch(k=256))
+
+
+def test_quantile_of_empty_sketch_raises():
+    with pytest.raises(ValueError):
+        KLLSketch().quantile(0.5)
@@ -0,0 +1,51 @@
+import numpy as np
+
+from windowing import sample_training_windows, sliding_windows
+
+
+def _loop_windows(data: np.ndarray, window_size: int) -> np.ndarray:
+    # The per-analyzer loops sliding_windows replaced
+    return np.array([data[i:i + window_size] for i in range(len(data) - window_size)], dtype=np.float32)
+
+
+def test_matches_the_original_loops():
+    data = np.random.default_rng(0).normal(size=(50, 3))
+    windows = sliding_windows(data, 10)
+    assert windows.shape == (40, 10, 3)
+    assert windows.dtype == np.float32
+    np.testing.assert_array_equal(windows, _loop_windows(data, 10))
+
+
+def test_window_ending_on_the_last_row_is_excluded():
+    data = np.arange(12, dtype=np.float64).reshape(-1, 1)
+    windows = sliding_windows(data, 4)
+    # Window i ends just before row i + 4, the row the Application analyzer pairs it with
+    assert windows[-1, -1, 0] == 10
+    for i in range(len(windows)):
+        assert windows[i, -1, 0] + 1 == data[i + 4, 0]
+
+
+def test_one_dimensional_input_gets_a_feature_axis():
+    windows = sliding_windows(np.arange(6), 2)
+    np.testing.assert_array_equal(windows[:, :, 0], _loop_windows(np.arange(6), 2))
+
+
+def test_too_short_input_gives_no_windows():
+    assert sliding_windows(np.zeros((5, 2)), 5).shape == (0, 5, 2)
+    assert sliding_windows(np.zeros((3, 2)), 5).shape == (0, 5, 2)
+
+
+def test_sampled_training_windows_stay_in_time_order():
+    windows = sliding_windows(np.arange(10_000, dtype=np.float64), 5)
+    sample = sample_training_windows(windows, max_windows=500)
+    starts = sample[:, 0, 0]
+    assert len(sample) == 500
+    assert np.all(np.diff(starts) > 0)
+    # Stratified: every tenth of the upload contributes about a tenth of the sample
+    counts = np.histogram(starts, bins=10, range=(0, len(windows)))[0]
+    assert counts.min() >= 45
+
+
+def test_small_uploads_are_not_sampled():
+    windows = sliding_windows(np.arange(100, dtype=np.float64), 5)
+    assert sample_training_windows(windows, max_windows=1000) is windows
@@ -150,111 +150,96 @@ function handleFileUpload($file, $logType)
     }
 }
 
-// Modify the analyze function to pass base64 data directly
-function analyzeLogFile($logId, $logType) {
-    // Execute Python script with log type and log ID
-    $pythonScript = dirname(__FILE__) . '\scripts\master.py';
-    error_log("Calling master Python script path: " . $pythonScript);
-    
-    // Escape the arguments for command line
-    $escapedLogType = escapeshellarg($logType);
-    $escapedLogId = escapeshellarg($logId);
-
-    error_log("Escaped log type: " . $escapedLogType);
-    error_log("Escaped log ID: " . $escapedLogId);
-    
-    // Build command with just log type and log ID
-    $command = "python \"$pythonScript\" $escapedLogType $escapedLogId";
-
-    error_log("Executing command: " . $command);
-    
-    $output = [];
-    $returnVar = 0;
-
-    exec($command, $output, $returnVar);
+// Queue the analysis for the queue workers (master.py queue-workers) instead of running it in this request
+function enqueueAnalysis($logId, $logType) {
+    try {
+        $conn = new mysqli(DB_HOST, DB_USER, DB_PASS, DB_NAME);
+        if ($conn->connect_error) {
+            throw new Exception('Database connection failed: ' . $conn->connect_error);
+        }
 
-    error_log("Command output: " . print_r($output, true));
-    error_log("Command return value: " . $returnVar);
+        // Only the uploader may analyze a file
+        $stmt = $conn->prepare("SELECT ID FROM UploadLogs WHERE ID = ? AND UserID = ?");
+        if (!$stmt) {
+            throw new Exception('Prepare failed: ' . $conn->error);
+        }
+        $stmt->bind_param("ii", $logId, $_SESSION['user_id']);
+        if (!$stmt->execute()) {
+            throw new Exception('Execute failed: ' . $stmt->error);
+        }
+        if ($stmt->get_result()->num_rows === 0) {
+            throw new Exception('File not found or access denied');
+        }
+        $stmt->close();
 
-    // Process Python script output
-    $analysisResults = [];
-    if ($output && count($output) > 0) {
-        try {
-            $analysisResults = json_decode($output[3], true);
-            if (json_last_error() !== JSON_ERROR_NONE) {
-                error_log("JSON decode error: " . json_last_error_msg());
-                return ['success' => false, 'message' => 'Invalid analysis results format'];
-            }
-            // place data into database
-            $conn = new mysqli(DB_HOST, DB_USER, DB_PASS, DB_NAME);
-            if ($conn->connect_error) {
-                throw new Exception('Database connection failed: ' . $conn->connect_error);
-            }
-    
-            try{
-                $conn->begin_transaction();
-    
-                $stmt = $conn->prepare("INSERT INTO log_analysis (LogID, Total_logs, Malicious_Events, GraphData, Alert_level, Source_Ip, Log_Type) VALUES (?, ?, ?, ?, ?, ?, ?)");
-                if (!$stmt) {
-                    throw new Exception('Prepare failed: ' . $conn->error);
-                }
+        $stmt = $conn->prepare("INSERT INTO analysis_jobs (LogID, LogType, Status, Options) VALUES (?, ?, 'queued', '{}')");
+        if (!$stmt) {
+            throw new Exception('Prepare failed: ' . $conn->error);
+        }
+        $stmt->bind_param("is", $logId, $logType);
+        if (!$stmt->execute()) {
+            throw new Exception('Execute failed: ' . $stmt->error);
+        }
 
-                // Add this validation before binding parameters
-                if (!isset($analysisResults["results"]["total_logs"]) ||
-                !isset($analysisResults["results"]["malicious_events"]) ||
-                !isset($analysisResults["results"]["graph_data"]) ||
-                !isset($analysisResults["results"]["alert_level"]) ||
-                !isset($analysisResults["results"]["sourceIp"]) ||
-                !isset($analysisResults["results"]["log_type"])) {
-                throw new Exception('Missing required analysis results fields');
+        error_log("Queued analysis job " . $conn->insert_id . " for LogID: " . $logId);
+        return [
+            'success' => true,
+            'message' => 'Analysis queued',
+            'jobId' => $conn->insert_id
+        ];
+    } catch (Exception $e) {
+        error_log("Error queueing analysis: " . $e->getMessage());
+        return ['success' => false, 'message' => $e->getMessage()];
+    } finally {
+        if (!empty($stmt)) {
+            $stmt->close();
+        }
+        if (isset($conn)) {
+            $conn->close();
+        }
+    }
 }
-    
-            
-                $totalLogs = $analysisResults["results"]["total_logs"];
-                $maliciousEvents = $analysisResults["results"]["malicious_events"];
-                $graphData = $analysisResults["results"]["graph_data"];
-                $alertLevel = $analysisResults["results"]["alert_level"];
-                $sourceIp = $analysisResults["results"]["sourceIp"];
-                $logType = $analysisResults["results"]["log_type"];
-    
-                $stmt->bind_param("iiissss", $logId, $totalLogs, $maliciousEvents, $graphData, $alertLevel, $sourceIp, $logType);
-    
-                if (!$stmt->execute()) {
-                    throw new Exception('Execute failed: ' . $stmt->error);
-                }
-    
-                // Store the ID of the newly inserted row
-                // This will be used to retrieve the analysis results later
-                $analysisId = $conn->insert_id;
-                $conn->commit();
-    
-                $stmt->close();
-                $conn->close();
-                
-            return [
-                'success' => true,
-                'message' => 'File Analysis complete',
-                'analysisId' => $analysisId
-            ];
 
-        } catch (Exception $e) {
-            $conn->rollback();
-            throw $e;
+// Status of a queued analysis job of the current user
+function getJobStatus($jobId) {
+    try {
+        $conn = new mysqli(DB_HOST, DB_USER, DB_PASS, DB_NAME);
+        if ($conn->connect_error) {
+            throw new Exception('Database connection failed: ' . $conn->connect_error);
         }
 
+        $stmt = $conn->prepare("SELECT j.Status, j.LogID, j.AnalysisID, j.Error FROM analysis_jobs j " .
+                               "JOIN UploadLogs u ON u.ID = j.LogID WHERE j.JobID = ? AND u.UserID = ?");
+        if (!$stmt) {
+            throw new Exception('Prepare failed: ' . $conn->error);
+        }
+        $stmt->bind_param("ii", $jobId, $_SESSION['user_id']);
+        if (!$stmt->execute()) {
+            throw new Exception('Execute failed: ' . $stmt->error);
+        }
 
-
-        } catch (Exception $e) {
-            error_log("Error parsing analysis results: " . $e->getMessage());
-            return ['success' => false, 'message' => 'Failed to parse analysis results'];
+        $job = $stmt->get_result()->fetch_assoc();
+        if (!$job) {
+            throw new Exception("No analysis job found with ID: {$jobId}");
+        }
+        return [
+            'success' => true,
+            'status' => $job['Status'],
+            'logId' => (int)$job['LogID'],
+            'analysisId' => $job['AnalysisID'] !== null ? (int)$job['AnalysisID'] : null,
+            'error' => $job['Error']
+        ];
+    } catch (Exception $e) {
+        error_log("Error in getJobStatus: " . $e->getMessage());
+        return ['success' => false, 'message' => $e->getMessage()];
+    } finally {
+        if (!empty($stmt)) {
+            $stmt->close();
+        }
+        if (isset($conn)) {
+            $conn->close();
         }
     }
-
-    return [
-        'success' => $returnVar === 0,
-        'message' => '😒',
-        'results' => $analysisResults
-    ];
 }
 
 // Function to retrieve analysis results
@@ -300,6 +285,8 @@ function getAnalysisResults($logId) {
                 'total_logs' => (int)$analysis['Total_logs'],
                 'malicious_events' => (int)$analysis['Malicious_Events'],
                 'graph_data' => $analysis['GraphData'],
+                // Series payloads are stored as JSON objects, graphs as base64 PNGs or artifact URLs
+                'graph_format' => strncmp(ltrim((string)$analysis['GraphData']), '{', 1) === 0 ? 'series' : 'png',
                 'alert_level' => $analysis['Alert_level'],
                 'sourceIp' => $analysis['Source_Ip'],
                 'log_type' => $analysis['Log_Type']
@@ -347,7 +334,7 @@ if ($_SERVER["REQUEST_METHOD"] == "POST") {
     else if (isset($input['analyze']) && isset($input['logId']) && isset($input['logType'])) {
         // Handle analysis request from JSON body
         error_log("Analyze request received for logId: " . $input['logId'] . " and logType: " . $input['logType']);
-        $result = analyzeLogFile($input['logId'], $input['logType']);
+        $result = enqueueAnalysis((int)$input['logId'], $input['logType']);
         echo json_encode($result);
         exit;
     }
@@ -359,6 +346,13 @@ if ($_SERVER["REQUEST_METHOD"] == "POST") {
         exit;
     }
 }
+// Polled by the page while a queued analysis runs
+if ($_SERVER["REQUEST_METHOD"] == "GET" && isset($_GET['jobid'])) {
+    header('Content-Type: application/json');
+    echo json_encode(getJobStatus((int)$_GET['jobid']));
+    exit;
+}
+
 // At the beginning of your PHP script, before the HTML
 if ($_SERVER["REQUEST_METHOD"] == "GET" && isset($_GET['logid'])) {
     // Explicitly set content type
@@ -817,6 +811,7 @@ if ($_SERVER["REQUEST_METHOD"] == "GET" && isset($_GET['logid'])) {
         </div>
     </div>
 
+    <script src="js/series_canvas.js"></script>
     <script>
 
 
@@ -890,6 +885,26 @@ document.addEventListener("DOMContentLoaded", function () {
             }
         });
 
+        // Poll a queued analysis job until a worker has finished it
+        async function waitForAnalysis(jobId) {
+            const baseUrl = window.location.pathname;
+            while (true) {
+                await new Promise(resolve => setTimeout(resolve, 2000));
+                const response = await fetch(`${baseUrl}?jobid=${jobId}`);
+                const job = await response.json();
+                if (!job.success) {
+                    throw new Error(job.message || 'Failed to read analysis status');
+                }
+                if (job.status === 'done') {
+                    return job;
+                }
+                if (job.status === 'failed') {
+                    throw new Error(job.error || 'Analysis failed');
+                }
+                statusDiv.textContent = job.status === 'running' ? 'Analyzing...' : 'Waiting for an analysis worker...';
+            }
+        }
+
         // Handle analyze button click
         analyzeBtn?.addEventListener('click', async function () {
             console.log("Analyze button is clicked!!")
@@ -918,15 +933,22 @@ document.addEventListener("DOMContentLoaded", function () {
                 });
 
                 const result = await response.json();
-                
-                if (result.success) {
-                    statusDiv.textContent = 'Analysis complete';
-                    statusDiv.className = 'upload-status success';
-                    updateAnalysisResults(result.results);
-                    viewBtn.dataset.analysisId = result.analysisId;
-                } else {
+                if (!result.success) {
                     throw new Error(result.message || 'Analysis failed');
                 }
+
+                // The upload request returns at once; a queue worker runs the analysis
+                statusDiv.textContent = 'Analysis queued...';
+                const job = await waitForAnalysis(result.jobId);
+                const resultsResponse = await fetch(`${window.location.pathname}?logid=${job.logId}`);
+                const data = await resultsResponse.json();
+                if (!data.success) {
+                    throw new Error(data.message || 'Failed to load analysis results');
+                }
+                statusDiv.textContent = 'Analysis complete';
+                statusDiv.className = 'upload-status success';
+                updateAnalysisResults(data);
+                viewBtn.dataset.analysisId = job.analysisId;
             } catch (error) {
                 console.error('Analysis error:', error);
                 statusDiv.textContent = 'Analysis failed: ' + error.message;
@@ -998,7 +1020,9 @@ function updateAnalysisResults(results) {
     document.querySelector('#logType').textContent = (data.log_type || data.results.log_type || 'N/A');
 
     // Display the graph
-    if (data.graph_data) {
+    if (data.graph_data && data.graph_format === 'series') {
+        renderSeriesToCanvas(document.getElementById('analysisCanvas'), JSON.parse(data.graph_data));
+    } else if (data.graph_data) {
         const img = new Image();
         img.onload = function() {
             const canvas = document.getElementById('analysisCanvas');
@@ -1013,7 +1037,8 @@ function updateAnalysisResults(results) {
             // Draw image on canvas
             ctx.drawImage(img, 0, 0, canvas.width, canvas.height);
         };
-        img.src = 'data:image/png;base64,' + data.graph_data;
+        // Stored graphs come back as a URL into the artifact store; base64 never contains '.'
+        img.src = data.graph_data.endsWith('.png') ? data.graph_data : 'data:image/png;base64,' + data.graph_data;
     }
 }
 
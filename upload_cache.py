@@ -0,0 +1,140 @@
+import io
+import os
+import re
+import hashlib
+import logging
+from datetime import datetime
+from typing import Dict, Any, Optional
+
+from log_schemas import read_log
+
+logger = logging.getLogger(__name__)
+
+# Parsed uploads are cached next to the analyzers unless configured otherwise
+CACHE_ROOT = os.environ.get(
+    'SHIELD_UPLOAD_CACHE_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache', 'uploads')
+)
+
+# Least recently used files are evicted once the cache grows past this size
+CACHE_MAX_BYTES = int(os.environ.get('SHIELD_UPLOAD_CACHE_MAX_BYTES', str(2 * 1024 ** 3)))
+
+CACHE_SUFFIX = '.parquet'
+
+
+def content_hash(data) -> str:
+    """SHA-256 hex digest of an upload's raw bytes."""
+    return hashlib.sha256(data).hexdigest()
+
+
+def columnar_support() -> bool:
+    """Whether pyarrow is installed to write and memory-map the cached files."""
+    try:
+        import pyarrow  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def _slug(value: str) -> str:
+    return re.sub(r'[^A-Za-z0-9]+', '_', value).strip('_').lower()
+
+
+class UploadCache:
+    """Typed, compressed Parquet copies of uploads keyed by content hash and log type."""
+
+    def __init__(self, root: str = CACHE_ROOT, max_bytes: int = CACHE_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+
+    def path_for(self, digest: str, log_type: str) -> str:
+        return os.path.join(self.root, _slug(log_type), digest[:2], f"{digest}{CACHE_SUFFIX}")
+
+    def get(self, digest: str, log_type: str) -> Optional[str]:
+        """Return the cached file for an upload, marking it as recently used."""
+        path = self.path_for(digest, log_type)
+        if not os.path.exists(path):
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            # The file may have been evicted by another process between the checks
+            return None
+        return path
+
+    def put(self, data, log_type: str, digest: Optional[str] = None) -> str:
+        """Parse an upload (bytes, or a binary stream with its digest) and store it as a columnar file."""
+        digest = digest or content_hash(data)
+        path = self.path_for(digest, log_type)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        df = read_log(data if hasattr(data, 'read') else io.BytesIO(data), log_type)
+        staging_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            df.to_parquet(staging_path, engine='pyarrow', compression='zstd', index=False)
+            os.replace(staging_path, path)
+        finally:
+            if os.path.exists(staging_path):
+                os.remove(staging_path)
+
+        logger.info(f"Cached {log_type} upload {digest} ({len(df)} rows, {os.path.getsize(path)} bytes)")
+        self.evict(keep=path)
+        return path
+
+    def get_or_build(self, data, log_type: str, digest: Optional[str] = None) -> str:
+        digest = digest or content_hash(data)
+        return self.get(digest, log_type) or self.put(data, log_type, digest)
+
+    def _entries(self):
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                if filename.endswith(CACHE_SUFFIX):
+                    path = os.path.join(dirpath, filename)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    yield path, stat.st_size, stat.st_mtime
+
+    def evict(self, keep: Optional[str] = None) -> int:
+        """Remove least recently used files until the cache fits in max_bytes, sparing `keep`."""
+        entries = sorted(self._entries(), key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for path, size, _ in entries:
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        if removed:
+            logger.info(f"Evicted {removed} cached uploads, cache size now {total} bytes")
+        return removed
+
+    def purge(self, log_type: Optional[str] = None) -> int:
+        """Remove every cached file, or only those of one log type."""
+        root = os.path.join(self.root, _slug(log_type)) if log_type else self.root
+        removed = 0
+        for dirpath, _, filenames in os.walk(root):
+            for filename in filenames:
+                if filename.endswith(CACHE_SUFFIX):
+                    os.remove(os.path.join(dirpath, filename))
+                    removed += 1
+        logger.info(f"Purged {removed} cached uploads from {root}")
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        entries = list(self._entries())
+        oldest = min((mtime for _, _, mtime in entries), default=None)
+        return {
+            'root': self.root,
+            'files': len(entries),
+            'bytes': sum(size for _, size, _ in entries),
+            'max_bytes': self.max_bytes,
+            'least_recently_used': datetime.fromtimestamp(oldest).isoformat(timespec='seconds') if oldest else None
+        }
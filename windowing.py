@@ -0,0 +1,159 @@
+import os
+import math
+import time
+import logging
+from typing import Iterator, List, Optional, Tuple
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from instrumentation import timed
+
+logger = logging.getLogger(__name__)
+
+# Windows per predict call; bounds the memory held by one batch of reconstructions
+PREDICT_BATCH_SIZE = 1024
+
+# Training budget of the autoencoders (0 disables a limit); scoring always covers every window
+# Windows trained on, sampled evenly over time from larger uploads
+TRAIN_MAX_WINDOWS = int(os.environ.get('SHIELD_TRAIN_MAX_WINDOWS', '100000'))
+# Wall-clock seconds after which training stops at the end of the current batch
+TRAIN_MAX_SECONDS = float(os.environ.get('SHIELD_TRAIN_MAX_SECONDS', '900'))
+# Epochs without validation loss improvement before training stops
+TRAIN_PATIENCE = int(os.environ.get('SHIELD_TRAIN_PATIENCE', '5'))
+
+
+@timed('windowing')
+def sliding_windows(data: np.ndarray, window_size: int) -> np.ndarray:
+    """Return windows data[i:i + window_size] for i in range(len(data) - window_size).
+
+    The result is a read-only float32 view over a single copy of `data`, so it costs
+    N x d floats instead of N x window_size x d. The alignment matches the loops the
+    analyzers used before: the window ending on the last row is not included.
+    """
+    data = np.ascontiguousarray(data, dtype=np.float32)
+    if data.ndim == 1:
+        data = data[:, np.newaxis]
+
+    n_windows = max(len(data) - window_size, 0)
+    if n_windows == 0:
+        return np.empty((0, window_size, data.shape[1]), dtype=np.float32)
+
+    # sliding_window_view appends the window axis last: (N - w + 1, d, w) -> (n, w, d)
+    windows = sliding_window_view(data, window_size, axis=0)[:n_windows]
+    return windows.transpose(0, 2, 1)
+
+
+def sample_training_windows(windows: np.ndarray, max_windows: int = TRAIN_MAX_WINDOWS,
+                            seed: int = 42) -> np.ndarray:
+    """Return at most max_windows windows, stratified by time.
+
+    The windows are split into max_windows equal stretches and one window is drawn from
+    each, so the sample covers the whole upload and stays in time order (the trailing
+    validation split remains the latest data).
+    """
+    n = len(windows)
+    if max_windows <= 0 or n <= max_windows:
+        return windows
+    rng = np.random.default_rng(seed)
+    bounds = np.linspace(0, n, max_windows + 1).astype(np.int64)
+    indices = bounds[:-1] + (rng.random(max_windows) * np.diff(bounds)).astype(np.int64)
+    logger.info(f"Training on {max_windows} of {n} windows sampled across the upload")
+    return windows[indices]
+
+
+def training_deadline(max_seconds: float = TRAIN_MAX_SECONDS) -> Optional[float]:
+    """perf_counter() value at which training must stop, or None without a time limit."""
+    return time.perf_counter() + max_seconds if max_seconds > 0 else None
+
+
+def _budget_callbacks(deadline: Optional[float], patience: int, monitor: str, callbacks: Optional[List]) -> List:
+    from tensorflow.keras.callbacks import Callback, EarlyStopping  # type: ignore
+
+    class StopAtDeadline(Callback):
+        def on_train_batch_end(self, batch, logs=None):
+            if time.perf_counter() >= deadline:
+                logger.warning("Training time budget spent, stopping early")
+                self.model.stop_training = True
+
+    callbacks = list(callbacks or [])
+    if patience > 0 and not any(isinstance(callback, EarlyStopping) for callback in callbacks):
+        callbacks.append(EarlyStopping(monitor=monitor, patience=patience, restore_best_weights=True))
+    if deadline is not None:
+        callbacks.append(StopAtDeadline())
+    return callbacks
+
+
+def window_batches(windows: np.ndarray, batch_size: int, shuffle: bool = False,
+                   seed: Optional[int] = None) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+    """Yield (x, x) autoencoder batches indefinitely, one pass over `windows` per epoch.
+
+    Only the current batch is materialized; with `shuffle` the order is redrawn every pass.
+    """
+    rng = np.random.default_rng(seed)
+    n = len(windows)
+    while True:
+        order = rng.permutation(n) if shuffle else None
+        for start in range(0, n, batch_size):
+            if order is None:
+                batch = np.ascontiguousarray(windows[start:start + batch_size])
+            else:
+                batch = windows[order[start:start + batch_size]]
+            yield batch, batch
+
+
+@timed('fit')
+def fit_windows(model, windows: np.ndarray, epochs: int, batch_size: int,
+                validation_split: float = 0.0, shuffle: bool = True,
+                callbacks: Optional[List] = None, verbose: int = 1,
+                max_windows: int = TRAIN_MAX_WINDOWS, max_seconds: float = TRAIN_MAX_SECONDS,
+                patience: int = TRAIN_PATIENCE):
+    """Train an autoencoder on windows fed from a generator instead of one in-memory array.
+
+    The validation windows are the trailing `validation_split` fraction, the same
+    split Keras applies to in-memory arrays. Training is bounded by the budget: at most
+    max_windows windows, max_seconds of wall-clock time, and early stopping after
+    `patience` epochs without improvement unless the callbacks already stop early.
+    """
+    deadline = training_deadline(max_seconds)
+    windows = sample_training_windows(windows, max_windows)
+    split_at = int(math.ceil(len(windows) * (1.0 - validation_split)))
+    train, validation = windows[:split_at], windows[split_at:]
+    logger.info(f"Training on {len(train)} windows, validating on {len(validation)} windows")
+
+    fit_kwargs = {}
+    if len(validation):
+        fit_kwargs['validation_data'] = window_batches(validation, batch_size)
+        fit_kwargs['validation_steps'] = math.ceil(len(validation) / batch_size)
+
+    callbacks = _budget_callbacks(deadline, patience, 'val_loss' if len(validation) else 'loss', callbacks)
+    return model.fit(
+        window_batches(train, batch_size, shuffle=shuffle),
+        steps_per_epoch=math.ceil(len(train) / batch_size),
+        epochs=epochs,
+        callbacks=callbacks,
+        verbose=verbose,
+        **fit_kwargs
+    )
+
+
+@timed('predict')
+def reconstruction_errors(model, windows: np.ndarray, batch_size: Optional[int] = None,
+                          sketch=None) -> np.ndarray:
+    """Mean squared reconstruction error per window, predicted batch by batch.
+
+    Models exported to a fixed-batch runtime set `predict_batch_size`, which is used
+    unless a batch size is given. Each batch of errors is also added to `sketch`
+    (a quantile_sketch.KLLSketch) when one is given.
+    """
+    batch_size = batch_size or getattr(model, 'predict_batch_size', PREDICT_BATCH_SIZE)
+    errors = np.empty(len(windows), dtype=np.float64)
+    for start in range(0, len(windows), batch_size):
+        batch = np.ascontiguousarray(windows[start:start + batch_size])
+        reconstructions = np.asarray(model.predict_on_batch(batch))
+        errors[start:start + len(batch)] = np.mean(
+            np.square(batch - reconstructions, dtype=np.float64), axis=(1, 2)
+        )
+        if sketch is not None:
+            sketch.update(errors[start:start + len(batch)])
+    return errors